@@ -11,12 +11,14 @@ from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
 from engine.routing import websocket_urlpatterns
 from engine.middleware import JWTAuthMiddlewareStack
+from RITengine.lifespan import lifespan_application
 
 django_asgi_app = get_asgi_application()
 
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
+        "lifespan": lifespan_application,
         "websocket": AllowedHostsOriginValidator(
             JWTAuthMiddlewareStack(
                 URLRouter(
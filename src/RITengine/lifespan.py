@@ -0,0 +1,51 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+_startup_callbacks = []
+_shutdown_callbacks = []
+
+
+def on_startup(callback):
+    """Register a coroutine function to run when the ASGI server starts, before it accepts connections."""
+    _startup_callbacks.append(callback)
+    return callback
+
+
+def on_shutdown(callback):
+    """Register a coroutine function to run when the ASGI server shuts down."""
+    _shutdown_callbacks.append(callback)
+    return callback
+
+
+async def run_startup_callbacks():
+    for callback in _startup_callbacks:
+        try:
+            await callback()
+        except Exception as e:
+            logger.error(f"Startup callback {callback.__qualname__} failed: {e}")
+
+
+async def run_shutdown_callbacks():
+    for callback in reversed(_shutdown_callbacks):
+        try:
+            await callback()
+        except Exception as e:
+            logger.error(f"Shutdown callback {callback.__qualname__} failed: {e}")
+
+
+async def lifespan_application(scope, receive, send):
+    """
+    Handles the ASGI lifespan protocol so background work (e.g. the typeahead index)
+    starts with the server and process-wide resources (connection pools, pending
+    writes, ...) are released on a graceful shutdown.
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await run_startup_callbacks()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await run_shutdown_callbacks()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -1,6 +1,6 @@
 from pathlib import Path
 from datetime import timedelta
-from RITengine.utils import parse_duration
+from RITengine.utils import parse_duration, parse_rate_limits
 from logging.handlers import TimedRotatingFileHandler
 import os
 
@@ -271,6 +271,31 @@ MELI_PAYAMAK_KEY = os.getenv("MELI_PAYAMAK_KEY")
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL")
+# Alternative OpenAI-compatible endpoint (e.g. the fake server in src/benchmarks for load tests).
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+# Shared LLM client: connection pool, timeouts (seconds) and retry policy.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", default=100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", default=20))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", default=60))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", default=5))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", default=60))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", default=2))
+# Terms rewritten (case-insensitively) in streamed answers.
+BRAND_REWRITE_RULES = {
+    "chatgpt": "RITengine",
+    "openai": "RIT team",
+    "open ai": "RIT team",
+}
+# Extract the keywords for all selected external engines with a single tool-call completion.
+OPENAI_COMBINED_EXTRACTION = os.getenv("OPENAI_COMBINED_EXTRACTION", default="true").lower() == "true"
+# Memoized keyword extraction (normalized message -> tool arguments), stored in the default cache.
+KEYWORD_CACHE_ENABLED = os.getenv("KEYWORD_CACHE_ENABLED", default="true").lower() == "true"
+KEYWORD_CACHE_TTL = int(os.getenv("KEYWORD_CACHE_TTL", default=60 * 60 * 24))
+KEYWORD_CACHE_LOCAL_SIZE = int(os.getenv("KEYWORD_CACHE_LOCAL_SIZE", default=1024))
+# Keywords are extracted locally first (KEYWORD_LOCAL_EXTRACTOR, empty disables it); the tool
+# call is only made when the local extractor's confidence is below KEYWORD_LOCAL_MIN_CONFIDENCE.
+KEYWORD_LOCAL_EXTRACTOR = os.getenv("KEYWORD_LOCAL_EXTRACTOR", default="engine.keywords.RakeKeywordExtractor")
+KEYWORD_LOCAL_MIN_CONFIDENCE = float(os.getenv("KEYWORD_LOCAL_MIN_CONFIDENCE", default=0.75))
 MAXIMUM_ALLOWED_USERNAME_CHANGE = 3
 OAUTH_BASE_CALLBACK_URL = os.getenv("OAUTH_BASE_CALLBACK_URL")
 TWO_FA_ANON_RATELIMIT = os.getenv("TWO_FA_ANON_RATELIMIT")
@@ -280,8 +305,166 @@ DARKOB_XFP = os.getenv("DARKOB_XFP")
 stripe.api_key = os.getenv("STRIPE_API_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 TRIAL_DAYS = 3
+
+# Usage quota ledger. Counters live in Redis when a URL is configured and fall back
+# to atomic database updates otherwise. Message quotas reset per customer window.
+QUOTA_REDIS_URL = os.getenv("QUOTA_REDIS_URL")
+QUOTA_MESSAGES_WINDOW = parse_duration(os.getenv("QUOTA_MESSAGES_WINDOW", default="1d"))
 SERPAPI_KEY = os.getenv("SERPAPI_KEY")
 
+# Shared SerpApi connection pool (per process). HTTP/2 is used when the `h2` package is installed.
+SERPAPI_BASE_URL = os.getenv("SERPAPI_BASE_URL", default="https://serpapi.com")
+SERPAPI_MAX_CONNECTIONS = int(os.getenv("SERPAPI_MAX_CONNECTIONS", default=20))
+SERPAPI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SERPAPI_MAX_KEEPALIVE_CONNECTIONS", default=10))
+SERPAPI_KEEPALIVE_EXPIRY = float(os.getenv("SERPAPI_KEEPALIVE_EXPIRY", default=30))
+SERPAPI_CONNECT_TIMEOUT = float(os.getenv("SERPAPI_CONNECT_TIMEOUT", default=3))
+SERPAPI_READ_TIMEOUT = float(os.getenv("SERPAPI_READ_TIMEOUT", default=15))
+
+# Adapter result cache: an in-process LRU tier in front of the default cache backend.
+ADAPTER_CACHE_LOCAL_SIZE = int(os.getenv("ADAPTER_CACHE_LOCAL_SIZE", default=256))
+ADAPTER_CACHE_DEFAULT_TTL = int(os.getenv("ADAPTER_CACHE_DEFAULT_TTL", default=60 * 60))
+ADAPTER_CACHE_TTLS = {
+    "google_patents_search": 60 * 60 * 24,
+    "google_scholar_search": 60 * 60 * 24,
+    "google_shopping_search": 60 * 60,
+    "google_autocomplete_search": 60 * 60,
+}
+
+# Chat connections rebuild their session snapshot this many seconds before the access token expires.
+CHAT_SESSION_REFRESH_MARGIN = int(os.getenv("CHAT_SESSION_REFRESH_MARGIN", default=30))
+
+# Number of chat turns kept in memory per websocket connection (and sent to the model).
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", default=50))
+# How long a chat's latest turns stay in the shared cache after its last answer, so a
+# client reconnecting to another worker does not need to re-read the chat.
+CHAT_HISTORY_CACHE_TTL = int(os.getenv("CHAT_HISTORY_CACHE_TTL", default=60 * 60))
+# Messages sent while an answer is generated are queued and answered in order, up to this
+# many per connection; past that the client gets a "busy" frame and should resend later.
+CHAT_MAX_QUEUED_MESSAGES = int(os.getenv("CHAT_MAX_QUEUED_MESSAGES", default=3))
+
+# Single-process default; production uses the Redis channel layer so group events
+# (e.g. chat session invalidation) reach consumers on every worker.
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+    }
+}
+
+# Chat messages are written to the database in batches by a background task
+# (PostgreSQL only, IDs are reserved from the table's sequence in blocks).
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", default="true").lower() == "true"
+MESSAGE_WRITE_BATCH_SIZE = int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", default=100))
+MESSAGE_WRITE_INTERVAL = float(os.getenv("MESSAGE_WRITE_INTERVAL", default=0.2))
+MESSAGE_ID_BLOCK_SIZE = int(os.getenv("MESSAGE_ID_BLOCK_SIZE", default=50))
+# Batches that still fail after retries are spilled to MESSAGE_SPOOL_DIR (shared by the web
+# and celery containers) and written by the replay_spooled_messages task. Requests for a
+# message another worker has handed out but not written yet wait up to MESSAGE_WRITE_WAIT seconds.
+MESSAGE_SPOOL_DIR = os.getenv("MESSAGE_SPOOL_DIR", default=os.path.join(BASE_DIR, "message_spool"))
+MESSAGE_WRITE_WAIT = float(os.getenv("MESSAGE_WRITE_WAIT", default=3))
+
+# Chat websockets without any message for CHAT_IDLE_TIMEOUT seconds are closed by a
+# process-wide sweep every CHAT_IDLE_SWEEP_INTERVAL seconds. Dead peers are detected
+# earlier by uvicorn's websocket pings (see Dockerfile).
+CHAT_IDLE_TIMEOUT = int(os.getenv("CHAT_IDLE_TIMEOUT", default=300))
+CHAT_IDLE_SWEEP_INTERVAL = int(os.getenv("CHAT_IDLE_SWEEP_INTERVAL", default=30))
+
+# Streamed answer deltas are coalesced into one websocket frame until this many seconds
+# have passed or this many bytes are buffered. Clients may pick lower/higher values per
+# connection (`?coalesce_ms=&coalesce_bytes=`) up to the maximums below.
+STREAM_COALESCE_DELAY = float(os.getenv("STREAM_COALESCE_DELAY", default=0.03))
+STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", default=256))
+STREAM_COALESCE_MAX_DELAY = float(os.getenv("STREAM_COALESCE_MAX_DELAY", default=0.25))
+STREAM_COALESCE_MAX_BYTES = int(os.getenv("STREAM_COALESCE_MAX_BYTES", default=4096))
+
+# Answers are generated independently of the websocket; a client that reconnects can
+# `resume` one for STREAM_RESUME_TTL seconds after it finished. Answers longer than
+# STREAM_BUFFER_MAX_CHARS are not resumable. Streams of other workers are followed
+# through snapshots written every STREAM_SNAPSHOT_INTERVAL seconds.
+STREAM_RESUME_TTL = int(os.getenv("STREAM_RESUME_TTL", default=300))
+STREAM_BUFFER_MAX_CHARS = int(os.getenv("STREAM_BUFFER_MAX_CHARS", default=100_000))
+STREAM_SNAPSHOT_INTERVAL = float(os.getenv("STREAM_SNAPSHOT_INTERVAL", default=0.5))
+
+# Answers to a new chat's first message are reused for identical or near-identical
+# messages (Jaccard similarity of character shingles) in categories with a response
+# cache TTL. The index keeps the latest RESPONSE_CACHE_INDEX_SIZE messages per engine set.
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", default=0.8))
+RESPONSE_CACHE_INDEX_SIZE = int(os.getenv("RESPONSE_CACHE_INDEX_SIZE", default=200))
+
+# Patent and scholar results are kept in a local corpus. A keyword fetched less than
+# CORPUS_MAX_AGE seconds ago is answered with the results it returned then; one matching
+# at least CORPUS_MIN_RESULTS fresh documents with up to CORPUS_MAX_RESULTS of them.
+CORPUS_ENABLED = os.getenv("CORPUS_ENABLED", default="true").lower() == "true"
+CORPUS_MAX_AGE = int(os.getenv("CORPUS_MAX_AGE", default=60 * 60 * 24 * 30))
+CORPUS_MIN_RESULTS = int(os.getenv("CORPUS_MIN_RESULTS", default=20))
+CORPUS_MAX_RESULTS = int(os.getenv("CORPUS_MAX_RESULTS", default=100))
+
+# Typeahead suggestions are served from an in-process prefix index: new terms are merged
+# every TYPEAHEAD_MERGE_INTERVAL seconds and corpus keywords picked up every
+# TYPEAHEAD_RELOAD_INTERVAL seconds. Only unknown prefixes of at least TYPEAHEAD_FALLBACK_MIN_CHARS
+# characters reach the autocomplete API, within the per-user "typeahead:user:*" budget of
+# TYPEAHEAD_RATE_LIMITS; past it, unknown prefixes get no suggestions.
+TYPEAHEAD_MERGE_INTERVAL = float(os.getenv("TYPEAHEAD_MERGE_INTERVAL", default=5))
+TYPEAHEAD_RELOAD_INTERVAL = float(os.getenv("TYPEAHEAD_RELOAD_INTERVAL", default=60))
+TYPEAHEAD_MAX_SUGGESTIONS = int(os.getenv("TYPEAHEAD_MAX_SUGGESTIONS", default=10))
+TYPEAHEAD_FALLBACK_MIN_CHARS = int(os.getenv("TYPEAHEAD_FALLBACK_MIN_CHARS", default=3))
+TYPEAHEAD_RATE_LIMITS = parse_rate_limits(os.getenv("TYPEAHEAD_RATE_LIMITS", default="typeahead:user:*=0.5/10"))
+
+# External results are deduplicated, ranked against the message and packed into the
+# prompt up to a token budget (per category, else EVIDENCE_TOKEN_BUDGET). Text fields
+# longer than EVIDENCE_FIELD_MAX_CHARS are shortened.
+EVIDENCE_TOKEN_BUDGET = int(os.getenv("EVIDENCE_TOKEN_BUDGET", default=3000))
+EVIDENCE_FIELD_MAX_CHARS = int(os.getenv("EVIDENCE_FIELD_MAX_CHARS", default=600))
+
+# Circuit breakers of the upstream services (each SerpApi engine, "openai"), per worker.
+# A circuit opens after BREAKER_FAILURE_THRESHOLD consecutive failures or an error rate of
+# BREAKER_ERROR_RATE over at least BREAKER_MIN_CALLS calls in the last BREAKER_WINDOW seconds,
+# and lets a trial call through after BREAKER_RESET_TIMEOUT seconds. Requests to the upstreams
+# in BREAKER_HEDGED_UPSTREAMS are repeated once they are slower than the recent p95 (at least
+# BREAKER_HEDGE_MIN_DELAY seconds), for at most BREAKER_HEDGE_RATIO of the calls.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", default=5))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", default=0.5))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", default=20))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", default=60))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", default=30))
+BREAKER_HEDGED_UPSTREAMS = [name for name in os.getenv("BREAKER_HEDGED_UPSTREAMS", default="").split(",") if name]
+BREAKER_HEDGE_MIN_DELAY = float(os.getenv("BREAKER_HEDGE_MIN_DELAY", default=0.2))
+BREAKER_HEDGE_RATIO = float(os.getenv("BREAKER_HEDGE_RATIO", default=0.1))
+
+# Outbound request budgets as "name=rate/burst" (requests per second), shared by all workers
+# through RATE_LIMIT_REDIS_URL. Budgets: "serpapi", "openai" and "openai:<model>", e.g.
+# "serpapi=5/10,openai=50/100,openai:gpt-4o=20/40". Without Redis each worker gets
+# 1/RATE_LIMIT_WORKERS of every budget. Engine searches and keyword extraction wait up to
+# RATE_LIMIT_MAX_WAIT seconds for a token before being skipped, answers RATE_LIMIT_ANSWER_WAIT.
+RATE_LIMITS = parse_rate_limits(os.getenv("RATE_LIMITS", default=""))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+RATE_LIMIT_WORKERS = int(os.getenv("RATE_LIMIT_WORKERS", default=1))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", default=1))
+RATE_LIMIT_ANSWER_WAIT = float(os.getenv("RATE_LIMIT_ANSWER_WAIT", default=10))
+
+# Clients may send "draft" messages while the user types; DRAFT_DEBOUNCE seconds after the
+# last one (of at least DRAFT_MIN_CHARS characters) its keywords are extracted and searched
+# ahead of time. The message sent is answered with those results when its similarity to the
+# draft is at least DRAFT_MATCH_SIMILARITY. Speculative requests are charged to their own
+# budgets as well as the upstream's: "draft:user:*" (prefetches per user), "draft:serpapi"
+# and "draft:openai".
+DRAFT_PREFETCH_ENABLED = os.getenv("DRAFT_PREFETCH_ENABLED", default="true").lower() == "true"
+DRAFT_DEBOUNCE = float(os.getenv("DRAFT_DEBOUNCE", default=0.6))
+DRAFT_MIN_CHARS = int(os.getenv("DRAFT_MIN_CHARS", default=12))
+DRAFT_MATCH_SIMILARITY = float(os.getenv("DRAFT_MATCH_SIMILARITY", default=0.8))
+DRAFT_RATE_LIMITS = parse_rate_limits(
+    os.getenv("DRAFT_RATE_LIMITS", default="draft:user:*=0.2/3,draft:serpapi=1/5,draft:openai=1/5")
+)
+
+# Deadlines (in seconds) for fetching an external engine's data while building a prompt.
+# Engines that miss their deadline are marked as partial instead of stalling the message.
+ENGINE_DEFAULT_DEADLINE = float(os.getenv("ENGINE_DEFAULT_DEADLINE", default=10))
+ENGINE_DEADLINES = {
+    "google_patents_search": float(os.getenv("GOOGLE_PATENTS_DEADLINE", default=ENGINE_DEFAULT_DEADLINE)),
+    "google_scholar_search": float(os.getenv("GOOGLE_SCHOLAR_DEADLINE", default=ENGINE_DEFAULT_DEADLINE)),
+    "google_shopping_search": float(os.getenv("GOOGLE_SHOPPING_DEADLINE", default=ENGINE_DEFAULT_DEADLINE)),
+    "google_autocomplete_search": float(os.getenv("GOOGLE_AUTOCOMPLETE_DEADLINE", default=ENGINE_DEFAULT_DEADLINE)),
+}
+
 OTP_TOTP_ISSUER = "RITengine"
 
 # TWILIO_ACCOUNT_SID = env("TWILIO_ACCOUNT_SID")
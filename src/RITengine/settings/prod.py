@@ -15,6 +15,17 @@ CACHES = {
         "LOCATION": f'{os.getenv("REDIS_URL")}/1',
     }
 }
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {
+            "hosts": [f'{os.getenv("REDIS_URL")}/3'],
+            "capacity": int(os.getenv("CHANNEL_LAYER_CAPACITY", default=1500)),
+            "expiry": int(os.getenv("CHANNEL_LAYER_EXPIRY", default=10)),
+        },
+    }
+}
+
 CELERY_BROKER_URL = f'{os.getenv("REDIS_URL")}/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
@@ -30,12 +41,15 @@ CELERY_BROKER_TRANSPORT_OPTIONS = {
 }
 
 CELERY_BEAT_SCHEDULE = {
-    'reset_plan_limits_daily': {
-        'task': 'payment.tasks.reset_plan_limits',
-        'schedule': crontab(hour=0, minute=0),  # Runs daily at midnight
+    'sync_usage_ledger': {
+        'task': 'payment.tasks.sync_usage_ledger',
+        'schedule': crontab(minute='*/5'),  # Runs every 5 minutes
     },
 }
 
+QUOTA_REDIS_URL = f'{os.getenv("REDIS_URL")}/2'
+RATE_LIMIT_REDIS_URL = f'{os.getenv("REDIS_URL")}/2'
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -9,3 +9,15 @@ def parse_duration(duration_str):
     elif duration_str.endswith('d'):
         return timedelta(days=int(duration_str[:-1]))
     raise ValueError('Unsupported duration format')
+
+def parse_rate_limits(rate_limits_str):
+    """
+    Parse "name=rate/burst" pairs separated by commas (e.g. "serpapi=5/10,openai=50/100")
+    into a dict of (requests per second, burst size).
+    """
+    rate_limits = {}
+    for item in filter(None, (item.strip() for item in rate_limits_str.split(','))):
+        name, budget = item.split('=')
+        rate, burst = budget.split('/')
+        rate_limits[name.strip()] = (float(rate), int(burst))
+    return rate_limits
@@ -0,0 +1,368 @@
+"""
+End-to-end chat load test, in a single process.
+
+Drives `--sessions` concurrent websocket sessions through the ASGI application
+(RITengine.asgi, with its auth and origin middleware) with channels'
+WebsocketCommunicator, against a throwaway test database. OpenAI and SerpApi
+are replaced by the fake servers of benchmarks.fake_openai and
+benchmarks.fake_serpapi, run on their own thread and event loop so their work
+does not show up as event-loop lag of the application.
+
+Reports messages/s, time to first token, tokens/s, p50/p95/p99 message latency,
+event-loop lag and database queries per message. Every run is appended to
+`--results` (JSON lines) and compared with the previous run of the same
+scenario; metrics more than `--tolerance` worse are flagged as regressions.
+
+Run from src/ with the settings of the deployment to test (the payment app must
+be installed):
+
+    DJANGO_SETTINGS_MODULE=RITengine.settings.dev python -m benchmarks.chat_load --sessions 1000 --messages 2
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from aiohttp import web
+from . import fake_openai, fake_serpapi
+
+# Metrics compared between runs, and whether a higher value is better.
+COMPARED_METRICS = {
+    "messages_per_s": True,
+    "tokens_per_s": True,
+    "ttft_p50": False,
+    "ttft_p95": False,
+    "latency_p50": False,
+    "latency_p95": False,
+    "latency_p99": False,
+    "loop_lag_p99_ms": False,
+    "db_queries_per_message": False,
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Upstreams(threading.Thread):
+    """The fake OpenAI and SerpApi servers, served from a thread of their own."""
+    def __init__(self, options):
+        super().__init__(name="fake-upstreams", daemon=True)
+        self.options = options
+        self.openai_port = get_free_port()
+        self.serpapi_port = get_free_port()
+        self.ready = threading.Event()
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self._start())
+        self.ready.set()
+        loop.run_forever()
+
+    async def _start(self):
+        openai_options = argparse.Namespace(
+            tokens=self.options.tokens,
+            token_delay=self.options.token_delay,
+            first_token_delay=self.options.first_token_delay,
+        )
+        serpapi_options = argparse.Namespace(delay=self.options.serpapi_delay, results=self.options.serpapi_results)
+        for app, port in (
+            (fake_openai.make_app(openai_options), self.openai_port),
+            (fake_serpapi.make_app(serpapi_options), self.serpapi_port),
+        ):
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", port).start()
+
+
+class QueryCounter:
+    """Counts the queries of every database connection (each thread has its own)."""
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def create_fixtures(options):
+    """Subscribed users (with access tokens) and the engines to chat with."""
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import AccessToken
+    from engine.models import Engine, EngineCategory
+    from payment.models import Customer, Plan, Subscription
+
+    category = EngineCategory.objects.create(name="Load test", prompt="Answer using the search results.")
+    services = [service for service in options.services.split(",") if service]
+    if services:
+        engines = [
+            Engine.objects.create(name=service, category=category, external_service=service) for service in services
+        ]
+    else:
+        engines = [Engine.objects.create(name="Internal", category=category, prompt="Answer briefly.")]
+
+    # bulk_create skips Plan.save, which would create the Stripe product.
+    Plan.objects.bulk_create([Plan(
+        name="Load test", messages_limit=options.sessions * options.messages + 1, projects_limit=0, bookmarks_limit=0
+    )])
+    plan = Plan.objects.get(name="Load test")
+    # The consumer checks the IDs in `engines_list` against the plan's category IDs,
+    # so the plan also allows categories with the engines' IDs.
+    engine_ids = [engine.id for engine in engines]
+    while EngineCategory.objects.order_by("-id").values_list("id", flat=True).first() < max(engine_ids):
+        EngineCategory.objects.create(name=f"Load test {EngineCategory.objects.count()}", prompt="")
+    plan.engines_categories.set(EngineCategory.objects.filter(id__in=[category.id, *engine_ids]))
+
+    tokens = []
+    for index in range(options.users):
+        user = get_user_model().objects.create(username=f"load{index}", email=f"load{index}@example.com")
+        customer = Customer.objects.create(user=user)
+        Subscription.objects.create(customer=customer, plan=plan, source_id=f"sub_load{index}", status="active")
+        tokens.append(str(AccessToken.for_user(user)))
+    return tokens, engine_ids
+
+
+async def monitor_loop_lag(lags, interval=0.05):
+    """Record how late the event loop wakes up a sleeping task."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run_session(application, index, token, engine_ids, options, results):
+    from channels.testing import WebsocketCommunicator
+
+    await asyncio.sleep(options.ramp * index / options.sessions)
+    communicator = WebsocketCommunicator(application, "/ws/chat/", headers=[(b"origin", options.origin.encode())])
+    connected, _ = await communicator.connect(timeout=options.timeout)
+    if not connected:
+        results["errors"]["connect"] = results["errors"].get("connect", 0) + 1
+        return
+
+    try:
+        for number in range(options.messages):
+            started = time.perf_counter()
+            first_token = None
+            content = []
+            await communicator.send_to(text_data=json.dumps({
+                "message": f"{options.message} {index % options.distinct_messages}-{number}",
+                "engines_list": engine_ids,
+                "token": token,
+                "use_cache": not options.no_cache,
+            }))
+            while True:
+                output = await communicator.receive_output(timeout=options.timeout)
+                if output["type"] == "websocket.close":
+                    error = f"close {output.get('code')}"
+                    results["errors"][error] = results["errors"].get(error, 0) + 1
+                    return
+                frame = json.loads(output["text"])
+                if frame.get("content"):
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                    content.append(frame["content"])
+                if frame.get("is_ended"):
+                    break
+
+            latency = time.perf_counter() - started
+            tokens = len("".join(content).split())  # The fake model streams one word per token
+            results["ttft"].append(first_token or latency)
+            results["latency"].append(latency)
+            if first_token is not None and latency > first_token:
+                results["tokens_per_s"].append(tokens / (latency - first_token))
+    except asyncio.TimeoutError:
+        results["errors"]["timeout"] = results["errors"].get("timeout", 0) + 1
+    finally:
+        # A timed-out receive cancels the application; there is nothing left to disconnect.
+        if not communicator.future.done():
+            await communicator.disconnect()
+
+
+async def run_load(application, tokens, engine_ids, options, query_counter):
+    from engine.persistence import message_writer
+
+    results = {"ttft": [], "latency": [], "tokens_per_s": [], "errors": {}}
+    lags = []
+    monitor = asyncio.create_task(monitor_loop_lag(lags))
+    queries_before = query_counter.count
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(
+        run_session(application, index, tokens[index % len(tokens)], engine_ids, options, results)
+        for index in range(options.sessions)
+    ), return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            error = type(outcome).__name__
+            results["errors"][error] = results["errors"].get(error, 0) + 1
+    elapsed = time.perf_counter() - started
+    await message_writer.flush()  # Count the batched message writes too
+    queries = query_counter.count - queries_before
+    monitor.cancel()
+
+    messages = len(results["latency"])
+    return {
+        "messages": messages,
+        "errors": results["errors"],
+        "elapsed_s": round(elapsed, 2),
+        "messages_per_s": round(messages / elapsed, 2),
+        "ttft_p50": round(percentile(results["ttft"], 0.5), 4),
+        "ttft_p95": round(percentile(results["ttft"], 0.95), 4),
+        "ttft_p99": round(percentile(results["ttft"], 0.99), 4),
+        "tokens_per_s": round(statistics.median(results["tokens_per_s"]), 1) if results["tokens_per_s"] else 0.0,
+        "latency_p50": round(percentile(results["latency"], 0.5), 4),
+        "latency_p95": round(percentile(results["latency"], 0.95), 4),
+        "latency_p99": round(percentile(results["latency"], 0.99), 4),
+        "loop_lag_p50_ms": round(percentile(lags, 0.5) * 1000, 2),
+        "loop_lag_p99_ms": round(percentile(lags, 0.99) * 1000, 2),
+        "loop_lag_max_ms": round(max(lags, default=0) * 1000, 2),
+        "db_queries_per_message": round(queries / messages, 2) if messages else 0.0,
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(path, scenario):
+    """The latest stored run of the same scenario that answered messages, or None."""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as results:
+        for line in results:
+            run = json.loads(line)
+            if run.get("scenario") == scenario and run["metrics"]["messages"]:
+                previous = run
+    return previous
+
+
+def compare(metrics, previous, tolerance):
+    """Print the change of every compared metric; returns the names of those that regressed."""
+    regressions = []
+    print(f"\nCompared with {previous['commit'] or 'unknown commit'} ({previous['timestamp']}):")
+    for name, higher_is_better in COMPARED_METRICS.items():
+        before, after = previous["metrics"].get(name), metrics[name]
+        if not before:
+            continue
+        change = (after - before) / before
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<24} {before:>10} -> {after:<10} {change:+.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end chat load test with fake upstreams.")
+    parser.add_argument("--sessions", type=int, default=200, help="Concurrent websocket sessions.")
+    parser.add_argument("--messages", type=int, default=2, help="Messages sent per session, one after the other.")
+    parser.add_argument("--users", type=int, default=50, help="Users the sessions are spread over.")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which the sessions connect.")
+    parser.add_argument("--message", default="Patents for forming cranioplasty mesh")
+    parser.add_argument("--distinct-messages", type=int, default=50,
+                        help="Sessions send one of this many messages (fewer means more cache hits).")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the keyword and response caches.")
+    parser.add_argument("--services", default="google_patents_search,google_scholar_search",
+                        help="External services of the engines chatted with; empty for an internal engine.")
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens per streamed answer.")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between streamed tokens.")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Model latency before the first token.")
+    parser.add_argument("--serpapi-delay", type=float, default=0.5, help="Latency of a SerpApi search.")
+    parser.add_argument("--serpapi-results", type=int, default=10, help="Results per SerpApi search.")
+    parser.add_argument("--origin", default="http://testserver", help="Origin header (must be an allowed host).")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for a frame.")
+    parser.add_argument("--results", default="benchmarks/results/chat_load.jsonl", help="File the runs are stored in.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change reported as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on a regression.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the application's output.")
+    options = parser.parse_args()
+
+    upstreams = Upstreams(options)
+    upstreams.start()
+    upstreams.ready.wait()
+
+    # The application's clients read these at import.
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{upstreams.openai_port}/v1"
+    os.environ["SERPAPI_BASE_URL"] = f"http://127.0.0.1:{upstreams.serpapi_port}"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ.setdefault("OPENAI_MODEL", "fake")
+    os.environ.setdefault("SERPAPI_KEY", "fake")
+
+    import django
+    django.setup()
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    query_counter = QueryCounter()
+    connection_created.connect(query_counter.install)
+    setup_test_environment()
+    from RITengine.asgi import application  # After "testserver" is an allowed host
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        tokens, engine_ids = create_fixtures(options)
+        output = contextlib.nullcontext() if options.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+        with output:
+            metrics = asyncio.run(run_load(application, tokens, engine_ids, options, query_counter))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    for name, value in metrics.items():
+        print(f"{name:<24} {value}")
+
+    scenario = {
+        name: getattr(options, name) for name in (
+            "sessions", "messages", "users", "ramp", "distinct_messages", "no_cache", "services",
+            "tokens", "token_delay", "first_token_delay", "serpapi_delay", "serpapi_results",
+        )
+    }
+    previous = load_previous(options.results, scenario)
+    regressions = compare(metrics, previous, options.tolerance) if previous else []
+
+    os.makedirs(os.path.dirname(options.results) or ".", exist_ok=True)
+    with open(options.results, "a") as results:
+        results.write(json.dumps({
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": get_commit(),
+            "scenario": scenario,
+            "metrics": metrics,
+        }) + "\n")
+
+    if regressions and options.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Minimal OpenAI-compatible chat completions server for load tests.
+
+Streams a fixed answer token by token so a load test measures our websocket
+tier, not the model. Tool calls (keyword extraction) are answered with the
+last user message as every string argument. Point the web workers at it with
+OPENAI_BASE_URL=http://<host>:<port>/v1.
+
+Run from src/: python -m benchmarks.fake_openai --port 8100 --tokens 200 --token-delay 0.02
+"""
+import argparse
+import asyncio
+import json
+import time
+from aiohttp import web
+
+WORDS = "The cited patents describe a titanium mesh formed before surgery to fit the defect".split()
+
+
+def make_chunk(content, finish_reason=None):
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "fake",
+        "choices": [{"index": 0, "delta": {"content": content} if content else {}, "finish_reason": finish_reason}],
+    }
+
+
+def fake_arguments(schema, text):
+    """Arguments matching a tool's JSON schema, with `text` for every string."""
+    if schema.get("type") == "object":
+        return {name: fake_arguments(field, text) for name, field in schema.get("properties", {}).items()}
+    if "enum" in schema:
+        return schema["enum"][0]
+    return {"string": text, "integer": 10, "number": 10, "boolean": False}.get(schema.get("type"), text)
+
+
+def make_message(body):
+    if not body.get("tools"):
+        return {"role": "assistant", "content": " ".join(WORDS)}, "stop"
+
+    text = next((message["content"] for message in reversed(body["messages"]) if message["role"] == "user"), "")
+    function = body["tools"][0]["function"]
+    tool_call = {
+        "id": "call_fake",
+        "type": "function",
+        "function": {"name": function["name"], "arguments": json.dumps(fake_arguments(function["parameters"], text))},
+    }
+    return {"role": "assistant", "content": None, "tool_calls": [tool_call]}, "tool_calls"
+
+
+async def chat_completions(request):
+    options = request.app["options"]
+    body = await request.json()
+    await asyncio.sleep(options.first_token_delay)
+
+    if not body.get("stream"):
+        message, finish_reason = make_message(body)
+        return web.json_response({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "fake",
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": 150, "completion_tokens": 20, "total_tokens": 170},
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for index in range(options.tokens):
+        await response.write(f"data: {json.dumps(make_chunk(' ' + WORDS[index % len(WORDS)]))}\n\n".encode())
+        await asyncio.sleep(options.token_delay)
+    await response.write(f"data: {json.dumps(make_chunk(None, 'stop'))}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def make_app(options):
+    app = web.Application()
+    app["options"] = options
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens per streamed answer.")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between tokens.")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Seconds before the first token.")
+    options = parser.parse_args()
+    web.run_app(make_app(options), host=options.host, port=options.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Minimal SerpApi stand-in for load tests.
+
+Answers /search for every engine our adapters use (patents, scholar, shopping,
+autocomplete) with `--results` generated results after `--delay` seconds, so
+a load test does not spend SerpApi credits. Point the web workers at it with
+SERPAPI_BASE_URL=http://<host>:<port>.
+
+Run from src/: python -m benchmarks.fake_serpapi --port 8101 --delay 0.5
+"""
+import argparse
+import asyncio
+from aiohttp import web
+
+
+def make_results(engine, query, count):
+    if engine == "google_autocomplete":
+        return {"suggestions": [{"value": f"{query} {index}", "relevance": 1000 - index} for index in range(count)]}
+    if engine == "google_shopping":
+        return {"shopping_results": [{
+            "title": f"{query} offer {index}",
+            "price": f"${10 + index}.99",
+            "thumbnail": f"https://example.com/{index}.jpg",
+        } for index in range(count)]}
+    if engine == "google_patents":
+        return {"organic_results": [{
+            "title": f"Method and system for {query} ({index})",
+            "snippet": f"A {query} is formed by shaping a sheet before use, embodiment {index}.",
+            "patent_id": f"patent/US{9000000 + index}B2/en",
+        } for index in range(count)]}
+    return {"organic_results": [{
+        "title": f"A study of {query} ({index})",
+        "snippet": f"We evaluate {query} in {index + 10} cases.",
+        "link": f"https://example.com/papers/{index}",
+    } for index in range(count)]}
+
+
+async def search(request):
+    options = request.app["options"]
+    await asyncio.sleep(options.delay)
+    return web.json_response(make_results(
+        request.query.get("engine"), request.query.get("q", ""), options.results
+    ))
+
+
+def make_app(options):
+    app = web.Application()
+    app["options"] = options
+    app.router.add_get("/search", search)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake SerpApi server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--delay", type=float, default=0.5, help="Seconds before answering a search.")
+    parser.add_argument("--results", type=int, default=10, help="Results per search.")
+    options = parser.parse_args()
+    web.run_app(make_app(options), host=options.host, port=options.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of the per-chunk cost of rewriting brand terms in streamed answers.
+
+Compares the previous chain of twelve str.replace calls with StreamRewriter.
+Run from src/: python -m benchmarks.rewriter
+"""
+import argparse
+import random
+import timeit
+from engine.rewriter import RewriteRules, StreamRewriter
+
+RULES = {"chatgpt": "RITengine", "openai": "RIT team", "open ai": "RIT team"}
+
+WORDS = (
+    "the patent claims a method for forming a cranioplasty mesh from titanium "
+    "as described by ChatGPT and OpenAI in prior art"
+).split()
+
+
+def make_chunks(count, seed=0):
+    """Token-sized chunks, like the deltas of a streamed completion."""
+    rng = random.Random(seed)
+    return [(" " if rng.random() < 0.8 else "") + rng.choice(WORDS) for _ in range(count)]
+
+
+def chained_replace(chunk):
+    chunk = chunk.replace("CHATGPT", "RITengine").replace("chatgpt", "RITengine").replace("ChatGPT", "RITengine").replace("chatGPT", "RITengine")
+    chunk = chunk.replace("OPENAI", "RIT team").replace("openai", "RIT team").replace("OpenAI", "RIT team").replace("openAI", "RIT team")
+    chunk = chunk.replace("OPEN AI", "RIT team").replace("open ai", "RIT team").replace("Open AI", "RIT team").replace("open AI", "RIT team")
+    return chunk
+
+
+def run_chained(chunks):
+    for chunk in chunks:
+        chained_replace(chunk)
+
+
+def run_stream_rewriter(chunks, rules):
+    rewriter = StreamRewriter(rules)
+    for chunk in chunks:
+        rewriter.feed(chunk)
+    rewriter.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=10000, help="Chunks per run.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per implementation (best is reported).")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    rules = RewriteRules(RULES)
+    candidates = {
+        "chained str.replace": lambda: run_chained(chunks),
+        "StreamRewriter": lambda: run_stream_rewriter(chunks, rules),
+    }
+
+    for name, run in candidates.items():
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f"{name:<20} {best / args.chunks * 1e9:8.0f} ns/chunk")
+
+
+if __name__ == "__main__":
+    main()
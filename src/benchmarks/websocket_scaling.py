@@ -0,0 +1,100 @@
+"""
+Websocket load test: concurrent chat streams against a running deployment.
+
+Opens `concurrency` websocket connections to the chat endpoint, has each of them
+send `messages` chat messages, and reports completed streams per second and
+time-to-first-token / total stream time percentiles.
+
+To check horizontal scaling, run the web workers against the fake model server
+(OPENAI_BASE_URL, see benchmarks.fake_openai) and repeat the same sweep with
+1, 2, 4, ... replicas:
+
+    WEB_REPLICAS=1 docker compose up -d && docker compose restart nginx
+    python -m benchmarks.websocket_scaling --url wss://<host>/ws/chat/ --token <jwt> --concurrency 50,100,200
+
+Compare streams/s at saturation between the replica counts; each replica should
+get its own CPU core, or the sweep measures the host rather than the replicas.
+
+Run from src/.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+import aiohttp
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def run_connection(session, options, results):
+    headers = {"Authorization": f"Bearer {options.token}", "Origin": options.origin}
+    async with session.ws_connect(options.url, headers=headers) as ws:
+        for index in range(options.messages):
+            started = time.perf_counter()
+            first_token = None
+            await ws.send_str(json.dumps({
+                "message": f"{options.message} ({index})",
+                "engines_list": [],
+                "token": options.token,
+            }))
+            async for frame in ws:
+                if frame.type != aiohttp.WSMsgType.TEXT:
+                    results["errors"] += 1
+                    return
+                data = json.loads(frame.data)
+                if first_token is None and data.get("content"):
+                    first_token = time.perf_counter() - started
+                if data.get("is_ended"):
+                    results["ttft"].append(first_token or 0.0)
+                    results["total"].append(time.perf_counter() - started)
+                    break
+
+
+async def run_level(options, concurrency):
+    results = {"ttft": [], "total": [], "errors": 0}
+    connector = aiohttp.TCPConnector(limit=0, ssl=not options.insecure)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *(run_connection(session, options, results) for _ in range(concurrency)),
+            return_exceptions=True,
+        )
+        elapsed = time.perf_counter() - started
+    results["errors"] += sum(isinstance(outcome, Exception) for outcome in outcomes)
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent chat streams load test.")
+    parser.add_argument("--url", required=True, help="Chat websocket URL, e.g. ws://localhost:8000/ws/chat/")
+    parser.add_argument("--token", required=True, help="Access token of a user with an active subscription.")
+    parser.add_argument("--concurrency", default="10,50,100", help="Comma-separated numbers of connections.")
+    parser.add_argument("--messages", type=int, default=3, help="Messages sent per connection.")
+    parser.add_argument("--message", default="Patents for forming cranioplasty mesh")
+    parser.add_argument("--origin", help="Origin header (must be an allowed host); defaults to the URL's host.")
+    parser.add_argument("--insecure", action="store_true", help="Skip TLS certificate verification.")
+    options = parser.parse_args()
+    if not options.origin:
+        url = urlsplit(options.url)
+        options.origin = f"{'https' if url.scheme == 'wss' else 'http'}://{url.netloc}"
+
+    print(f"{'conns':>6} {'streams':>8} {'errors':>6} {'streams/s':>10} {'ttft p50':>9} {'ttft p95':>9} {'total p50':>10} {'total p95':>10}")
+    for concurrency in map(int, options.concurrency.split(",")):
+        results, elapsed = asyncio.run(run_level(options, concurrency))
+        streams = len(results["total"])
+        print(
+            f"{concurrency:>6} {streams:>8} {results['errors']:>6} {streams / elapsed:>10.1f} "
+            f"{percentile(results['ttft'], 0.5):>9.3f} {percentile(results['ttft'], 0.95):>9.3f} "
+            f"{statistics.median(results['total']) if streams else 0:>10.3f} {percentile(results['total'], 0.95):>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
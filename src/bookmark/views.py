@@ -8,11 +8,14 @@ from rest_framework.response import Response
 from rest_framework import status
 from .models import Bookmark
 from engine.models import Message
+from engine.persistence import message_writer
 from engine.serializers import MessageSerializer
 from RITengine.exceptions import CustomAPIException
 from rest_framework.views import APIView
 from share.permissions import IsOwnerOrViewer
 from rest_framework.exceptions import PermissionDenied
+from django.db.models import Q
+from payment.quota import quota_ledger
 
 class BookmarksDetailView(generics.RetrieveUpdateAPIView):
     """
@@ -25,7 +28,6 @@ class BookmarksDetailView(generics.RetrieveUpdateAPIView):
             bookmark_id = self.kwargs.get('id')
             customer = getattr(self.request.user, 'customer', None)
 
-<<<<<<< HEAD
             if bookmark_id is not None:
                 try:
                     bookmark = Bookmark.objects.get(
@@ -35,25 +37,9 @@ class BookmarksDetailView(generics.RetrieveUpdateAPIView):
                     raise CustomAPIException("Bookmark not found", status_code=404)
             else:
                 if customer:
-                    # Check if the customer can create more bookmarks
-                    if customer.bookmarks_created >= customer.subscription.plan.bookmarks_limit:
-                        raise PermissionDenied("You have reached the maximum number of bookmarks allowed by your subscription plan.")
                     bookmark, created = Bookmark.objects.get_or_create(user=self.request.user)
-                    if created:
-                        customer.bookmarks_created += 1
-                        customer.save()
                 else:
                     raise PermissionDenied("You must have an active subscription to create bookmarks.")
-=======
-        if bookmark_id is not None:
-            try:
-                bookmark = Bookmark.objects.get(id=bookmark_id)
-                self.check_object_permissions(self.request, bookmark)
-            except Bookmark.DoesNotExist:
-                raise NotFound("Bookmark not found.")
-        else:
-            bookmark, created = Bookmark.objects.get_or_create(user=self.request.user)
->>>>>>> main
 
             return bookmark
 
@@ -77,32 +63,30 @@ class BookmarkMessageView(APIView):
 
     def post(self, request, message_id):
         user = request.user
+        message_writer.wait_until_written(message_id)
         message = get_object_or_404(Message, id=message_id, chat__user=user)
 
         customer = getattr(user, 'customer', None)
         if not customer or not customer.has_active_subscription():
             raise PermissionDenied("You must have an active subscription to create more bookmarks.")
 
-        if customer.bookmarks_created >= customer.subscription.plan.bookmarks_limit:
-            raise PermissionDenied("You have reached the maximum number of bookmarks allowed by your subscription plan.")
-
         bookmark = self.get_or_create_bookmark(user)
 
-        customer.bookmarks_created += 1
-        customer.save()
-
-        bookmark, created = Bookmark.objects.get_or_create(user=user)
-        if created:
-            customer.bookmarks_created += 1
-            customer.save()
-
         if bookmark.messages.filter(id=message_id).exists():
                         raise CustomAPIException(
                             detail='Message is already bookmarked',
                             status_code=400
                         )
 
-        bookmark.messages.add(message)
+        allowed, _ = quota_ledger.consume(customer.pk, "bookmarks", customer.subscription.plan.bookmarks_limit)
+        if not allowed:
+            raise PermissionDenied("You have reached the maximum number of bookmarks allowed by your subscription plan.")
+
+        try:
+            bookmark.messages.add(message)
+        except Exception:
+            quota_ledger.release(customer.pk, "bookmarks")
+            raise
 
         serializer = MessageSerializer(message, context={'user': user})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1,5 +1,10 @@
 # base_adapter.py
 
+from engine.ratelimit import rate_limiter
+from engine.resilience import get_breaker, time_left
+from .http_client import get_http_client
+
+
 class BaseAPIAdapter:
     """Base class for all external API adapters."""
     def __init__(self, api_key: str = None):
@@ -12,3 +17,49 @@ class BaseAPIAdapter:
     def parse_response(self, response):
         """To be overridden to handle specific API response parsing."""
         raise NotImplementedError("parse_response must be implemented by the subclass")
+
+
+class AsyncHTTPAdapter(BaseAPIAdapter):
+    """
+    Base class for adapters backed by a JSON HTTP API.
+
+    Requests go through a process-wide pooled AsyncClient, so searches never block
+    the event loop. Subclasses set `base_url`, `search_path` and the pool settings,
+    and `rate_limit` to the outbound budget (see `engine.ratelimit`) requests count against.
+    Requests go through the circuit breaker named after the adapter (see `engine.resilience`).
+    """
+    name = None
+    base_url = None
+    rate_limit = None
+    search_path = "/"
+    max_connections = 20
+    max_keepalive_connections = 10
+    keepalive_expiry = 30.0
+    connect_timeout = 3.0
+    read_timeout = 15.0
+
+    def get_client(self):
+        return get_http_client(
+            self.base_url,
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+        )
+
+    def build_params(self, params):
+        """Drop unset parameters so they are omitted from the query string."""
+        return {key: value for key, value in params.items() if value is not None}
+
+    async def perform_search(self, params):
+        timeout = time_left()
+        return await get_breaker(self.name).call(lambda: self.fetch(params), timeout=timeout)
+
+    async def fetch(self, params):
+        """A single request to the upstream; a hedged search may make two."""
+        if self.rate_limit:
+            await rate_limiter.limit([self.rate_limit])
+        response = await self.get_client().get(self.search_path, params=self.build_params(params))
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,49 @@
+# cache.py
+
+import functools
+import inspect
+from django.conf import settings
+from engine.cache import TieredCache
+
+adapter_cache = TieredCache(
+    "adapter",
+    local_size=settings.ADAPTER_CACHE_LOCAL_SIZE,
+    default_ttl=settings.ADAPTER_CACHE_DEFAULT_TTL,
+)
+
+
+def normalize_param(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, (tuple, list)):
+        return [normalize_param(item) for item in value]
+    return value
+
+
+def get_adapter_cache_ttl(adapter_name):
+    return settings.ADAPTER_CACHE_TTLS.get(adapter_name, settings.ADAPTER_CACHE_DEFAULT_TTL)
+
+
+def cached_search(search):
+    """
+    Cache an adapter's `search` results keyed on the adapter name and its normalized
+    parameters. Identical searches running at the same time share a single upstream
+    request. Empty results are not cached, since they usually mean the upstream failed.
+    """
+    signature = inspect.signature(search)
+
+    @functools.wraps(search)
+    async def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        params = {name: normalize_param(value) for name, value in bound.arguments.items() if name != "self"}
+
+        key = adapter_cache.make_key(self.name, params)
+        return await adapter_cache.get_or_set(
+            key,
+            lambda: search(self, *args, **kwargs),
+            ttl=get_adapter_cache_ttl(self.name),
+            cache_if=bool,
+        )
+
+    return wrapper
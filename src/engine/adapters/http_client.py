@@ -0,0 +1,61 @@
+# http_client.py
+
+import asyncio
+import importlib.util
+import httpx
+
+# Process-wide connection pools, one per upstream base URL.
+_clients = {}
+
+
+def http2_available():
+    """HTTP/2 support in httpx depends on the optional `h2` package."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def close_on_loop(close, loop):
+    """
+    Close a client that is being replaced on the loop it was created on: its
+    connections belong to that loop, so they cannot be closed from another one.
+    A loop that has stopped already dropped them.
+    """
+    if loop.is_running() and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(close(), loop)
+
+
+def get_http_client(base_url, max_connections, max_keepalive_connections, keepalive_expiry,
+                    connect_timeout, read_timeout):
+    """
+    Returns the shared AsyncClient for the given base URL, creating it on first use.
+
+    Every adapter talking to the same upstream reuses one connection pool, so
+    connections are kept alive across searches and bounded per host.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(base_url)
+    if entry is not None:
+        client, client_loop = entry
+        if client_loop is loop and not client.is_closed:
+            return client
+        if client_loop is not loop:
+            close_on_loop(client.aclose, client_loop)
+
+    client = httpx.AsyncClient(
+        base_url=base_url,
+        http2=http2_available(),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+    )
+    _clients[base_url] = (client, loop)
+    return client
+
+
+async def close_http_clients():
+    """Close every shared connection pool. Meant to be called on shutdown."""
+    while _clients:
+        _, (client, _) = _clients.popitem()
+        await client.aclose()
@@ -1,7 +1,11 @@
 from engine.adapters.serpapi_adapter import SerpapiAdapter
+from engine.adapters.cache import cached_search
 
 class GoogleAutocompleteAdapter(SerpapiAdapter):
     """Adapter for Google Autocomplete suggestions via SerpApi."""
+    name = "google_autocomplete_search"
+
+    @cached_search
     async def search(self, query: str, geo_location: str = None, language: str = None):
         params = {
             "engine": "google_autocomplete",
@@ -9,7 +13,7 @@ class GoogleAutocompleteAdapter(SerpapiAdapter):
             "gl": geo_location,
             "hl": language
         }
-        response = self.perform_search(params)
+        response = await self.perform_search(params)
         return self.parse_response(response)
 
     def parse_response(self, response):
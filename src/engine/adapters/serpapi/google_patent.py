@@ -1,7 +1,14 @@
+import logging
 from engine.adapters.serpapi_adapter import SerpapiAdapter
+from engine.adapters.cache import cached_search
+
+logger = logging.getLogger(__name__)
 
 class GooglePatentsAdapter(SerpapiAdapter):
     """Adapter for Google Patents searches via SerpApi."""
+    name = "google_patents_search"
+
+    @cached_search
     async def search(self, query: str, number=100, sort=("new", "old"), type=("PATENT", "DESIGN"), status=("GRANT", "APPLICATION")):
         params = {
             "engine": "google_patents",
@@ -11,7 +18,7 @@ class GooglePatentsAdapter(SerpapiAdapter):
             "type": type,
             "status": status,
         }
-        response = self.perform_search(params)
+        response = await self.perform_search(params)
         return self.parse_response(response)
 
     def parse_response(self, response):
@@ -26,13 +33,5 @@ class GooglePatentsAdapter(SerpapiAdapter):
             }
             for result in results
         ]
-        
-        # Print the final parsed results
-        print("GOOGLE PATENT")
-        print()
-        print()
-        print()
-        print()
-        print(parsed_results)
-        
+        logger.debug(f"Google Patents returned {len(parsed_results)} results")
         return parsed_results
\ No newline at end of file
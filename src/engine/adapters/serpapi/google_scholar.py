@@ -1,14 +1,18 @@
 from engine.adapters.serpapi_adapter import SerpapiAdapter
+from engine.adapters.cache import cached_search
 
 class GoogleScholarAdapter(SerpapiAdapter):
     """Adapter for Google Scholar searches via SerpApi."""
+    name = "google_scholar_search"
+
+    @cached_search
     async def search(self, query: str, language: str = None):
         params = {
             "engine": "google_scholar",
             "q": query,
             "hl": language
         }
-        response = self.perform_search(params)
+        response = await self.perform_search(params)
         return self.parse_response(response)
 
     def parse_response(self, response):
@@ -1,7 +1,11 @@
 from engine.adapters.serpapi_adapter import SerpapiAdapter
+from engine.adapters.cache import cached_search
 
 class GoogleShoppingAdapter(SerpapiAdapter):
     """Adapter for Google Shopping searches via SerpApi."""
+    name = "google_shopping_search"
+
+    @cached_search
     async def search(self, query: str, language: str = None):
         params = {
             "engine": "google_shopping",
@@ -9,7 +13,7 @@ class GoogleShoppingAdapter(SerpapiAdapter):
             "q": query,
             "hl": language
         }
-        response = self.perform_search(params)
+        response = await self.perform_search(params)
         return self.parse_response(response)
 
     def parse_response(self, response):
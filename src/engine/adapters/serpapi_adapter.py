@@ -1,14 +1,24 @@
 from django.conf import settings
-import serpapi
-from .base_adapter import BaseAPIAdapter
+from .base_adapter import AsyncHTTPAdapter
 
-class SerpapiAdapter(BaseAPIAdapter):
+class SerpapiAdapter(AsyncHTTPAdapter):
     """SerpApi adapter class for performing searches using SerpApi."""
+    base_url = settings.SERPAPI_BASE_URL
+    search_path = "/search"
+    max_connections = settings.SERPAPI_MAX_CONNECTIONS
+    max_keepalive_connections = settings.SERPAPI_MAX_KEEPALIVE_CONNECTIONS
+    keepalive_expiry = settings.SERPAPI_KEEPALIVE_EXPIRY
+    connect_timeout = settings.SERPAPI_CONNECT_TIMEOUT
+    read_timeout = settings.SERPAPI_READ_TIMEOUT
+    rate_limit = "serpapi"
+
     def __init__(self):
         # Fetch API key for SerpApi from Django settings
         api_key = settings.SERPAPI_KEY  # Use the API key from Django settings
         super().__init__(api_key)
-        self.client = serpapi.Client(api_key=api_key)
 
-    def perform_search(self, params):
-        return self.client.search(params)
\ No newline at end of file
+    def build_params(self, params):
+        params = super().build_params(params)
+        params.setdefault("api_key", self.api_key)
+        params.setdefault("output", "json")
+        return params
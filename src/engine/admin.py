@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Engine, Message, Chat, EngineCategory, Assist
+from .models import Engine, Message, Chat, EngineCategory, Assist, CorpusDocument, CorpusSearch, CircuitBreakerState
+from .response_cache import response_cache
 # from django.db.models import Count, Case, When, IntegerField
 # from stats.models import Vote
 # from stats.utils import get_engine_performance, get_engine_performance_over_time
@@ -23,5 +24,37 @@ from .models import Engine, Message, Chat, EngineCategory, Assist
 admin.site.register(Engine)
 admin.site.register(Message)
 admin.site.register(Chat)
-admin.site.register(EngineCategory)
+
+@admin.register(EngineCategory)
+class EngineCategoryAdmin(admin.ModelAdmin):
+    list_display = ('name', 'is_default', 'response_cache_ttl', 'evidence_token_budget')
+    actions = ['purge_response_cache']
+
+    @admin.action(description="Purge cached responses")
+    def purge_response_cache(self, request, queryset):
+        for category in queryset:
+            response_cache.purge(category.id)
+        self.message_user(request, f"Purged the cached responses of {queryset.count()} categories.")
+
 admin.site.register(Assist)
+
+@admin.register(CorpusDocument)
+class CorpusDocumentAdmin(admin.ModelAdmin):
+    list_display = ('title', 'service', 'key', 'fetched_at')
+    list_filter = ('service',)
+    search_fields = ('title', 'key')
+
+@admin.register(CorpusSearch)
+class CorpusSearchAdmin(admin.ModelAdmin):
+    list_display = ('keyword', 'service', 'result_count', 'fetched_at')
+    list_filter = ('service',)
+    search_fields = ('keyword',)
+
+@admin.register(CircuitBreakerState)
+class CircuitBreakerStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'worker', 'state', 'error_rate', 'p95_ms', 'consecutive_failures', 'changed_at')
+    list_filter = ('state', 'name')
+    readonly_fields = [field.name for field in CircuitBreakerState._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
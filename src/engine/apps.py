@@ -4,3 +4,28 @@ from django.apps import AppConfig
 class EngineConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "engine"
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from RITengine.lifespan import on_startup, on_shutdown
+        from . import signals
+        from .adapters.http_client import close_http_clients
+        from .llm import close_openai_clients
+        from .persistence import message_writer
+        from .reaper import idle_reaper
+        from .streams import wait_for_streams
+        from .typeahead import typeahead_index
+
+        on_startup(typeahead_index.start)
+
+        on_shutdown(close_openai_clients)
+        on_shutdown(idle_reaper.stop)
+        on_shutdown(close_http_clients)
+        # Run in reverse order: running answers finish, then pending messages are written, then pools close.
+        on_shutdown(message_writer.close)
+        on_shutdown(wait_for_streams)
+
+        # Connected lazily: chat sessions cache subscription and plan data per connection.
+        post_save.connect(signals.subscription_changed, sender="payment.Subscription")
+        post_delete.connect(signals.subscription_changed, sender="payment.Subscription")
+        post_save.connect(signals.plan_changed, sender="payment.Plan")
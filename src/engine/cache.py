@@ -0,0 +1,122 @@
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from django.core.cache import cache as shared_cache
+from . import metrics
+
+_MISSING = object()
+
+
+class TieredCache:
+    """
+    A small in-process LRU tier in front of the Django cache backend (Redis in
+    production). Concurrent lookups of the same missing key are coalesced, so only
+    one of them computes the value while the others wait for its result.
+
+    Values come back as copies (like from the shared tier, which pickles them),
+    so a caller mutating a result does not change what later callers get.
+
+    Counters are reported to `engine.metrics` as `<namespace>_cache.<event>`.
+    """
+    def __init__(self, namespace, local_size=256, default_ttl=3600):
+        self.namespace = namespace
+        self.local_size = local_size
+        self.default_ttl = default_ttl
+        self._local = OrderedDict()
+        self._inflight = {}
+
+    def make_key(self, *parts):
+        """Build a stable cache key from JSON-serializable parts."""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        return f"{self.namespace}:{digest}"
+
+    def _count(self, event):
+        metrics.incr(f"{self.namespace}_cache.{event}")
+
+    def _get_local(self, key):
+        entry = self._local.get(key)
+        if entry is None:
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._local[key]
+            return _MISSING
+        self._local.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def _set_local(self, key, value, ttl):
+        self._local[key] = (time.monotonic() + ttl, copy.deepcopy(value))
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    async def get(self, key):
+        """Return the cached value for `key`, or None when it is not cached in either tier."""
+        value = self._get_local(key)
+        if value is not _MISSING:
+            self._count("hit_local")
+            return value
+
+        value = await shared_cache.aget(key, _MISSING)
+        if value is not _MISSING:
+            self._count("hit_shared")
+            # The remaining TTL of the shared entry is unknown, so keep the local copy short-lived.
+            self._set_local(key, value, min(self.default_ttl, 60))
+            return value
+
+        self._count("miss")
+        return None
+
+    async def set(self, key, value, ttl=None):
+        ttl = ttl or self.default_ttl
+        self._set_local(key, value, ttl)
+        await shared_cache.aset(key, value, ttl)
+
+    async def delete(self, key):
+        self._local.pop(key, None)
+        await shared_cache.adelete(key)
+
+    async def _load(self, key, compute, ttl, cache_if):
+        value = await self.get(key)
+        if value is not None:
+            return value
+        value = await compute()
+        if cache_if is None or cache_if(value):
+            await self.set(key, value, ttl)
+        return value
+
+    async def get_or_set(self, key, compute, ttl=None, cache_if=None):
+        """
+        Return the cached value for `key`, computing it with the `compute` coroutine
+        function on a miss. `cache_if` can veto storing a computed value.
+        """
+        value = self._get_local(key)
+        if value is not _MISSING:
+            self._count("hit_local")
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._count("coalesced")
+            return copy.deepcopy(await asyncio.shield(inflight))
+
+        task = asyncio.ensure_future(self._load(key, compute, ttl, cache_if))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shield the shared task so a waiter that gives up does not cancel it for the others.
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def stats(self):
+        prefix = f"{self.namespace}_cache"
+        return {
+            "hit_local": metrics.get_counter(f"{prefix}.hit_local"),
+            "hit_shared": metrics.get_counter(f"{prefix}.hit_shared"),
+            "miss": metrics.get_counter(f"{prefix}.miss"),
+            "coalesced": metrics.get_counter(f"{prefix}.coalesced"),
+            "hit_rate": metrics.hit_rate(prefix),
+            "local_entries": len(self._local),
+        }
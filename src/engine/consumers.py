@@ -1,47 +1,144 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.conf import settings
-from openai import AsyncOpenAI
 from .models import Chat, Message, EngineCategory
-from .utils import save_message, authenticate_user, get_prompts, load_chat_history
+from . import metrics
+from .history import ChatHistory, get_cached_history, cache_history
+from .llm import get_openai_client, stream_deltas
+from .rewriter import StreamRewriter, get_brand_rules
+from .session import build_session
+from .streaming import FrameCoalescer, get_coalesce_options
+from .streams import start_stream, get_stream, get_stream_snapshot, request_cancel, record_cancellation
+from .persistence import message_writer
+from .prefetch import DraftPrefetch
+from .reaper import idle_reaper
+from .ratelimit import get_openai_budgets, rate_limiter
+from .response_cache import response_cache, get_response_cache_scope, is_first_turn, replay_deltas
+from .utils import authenticate_user, get_prompts, load_chat_history
+from payment.quota import quota_ledger
 import json
 import asyncio
+import logging
+from collections import deque
 
-class ChatConsumer(AsyncWebsocketConsumer):
-    TIMEOUT = 300
+logger = logging.getLogger(__name__)
 
+class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.last_activity = asyncio.get_event_loop().time()
-        self.messages = []
+        self.history = ChatHistory(max_turns=settings.CHAT_HISTORY_MAX_TURNS)
+        self.chat = None
+        self.session = None
         self.slug = self.scope['url_route']['kwargs'].get('slug')
+        self.coalesce_options = get_coalesce_options(self.scope)
+        self.stream = None
+        self.listener = None
+        self.resume_task = None
+        self.draft = None
+        self.queued = deque()
+        self.queue_task = None
 
-        self.timeout_task = asyncio.create_task(self.timeout_check())
+        # Users authenticated by JWTAuthMiddleware get their session built up front;
+        # otherwise it is built from the token of the first message.
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            await self._start_session(user, self.scope.get('token_expires_at'))
 
         await self.accept()
+        idle_reaper.register(self)
+
+    async def _start_session(self, user, token_expires_at):
+        await self._leave_session_groups()
+        self.user = user
+        self.session = await build_session(user, token_expires_at)
+        if self.channel_layer is not None:
+            for group in self.session.groups:
+                await self.channel_layer.group_add(group, self.channel_name)
+
+    async def _leave_session_groups(self):
+        if self.session is not None and self.channel_layer is not None:
+            for group in self.session.groups:
+                await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def _ensure_session(self, token):
+        """
+        Make sure the connection has an up-to-date session. The token is only
+        validated when there is no session yet or the current one is about to expire.
+        """
+        session = self.session
+        if session is not None and not session.stale and not session.token_expiring():
+            return True
+
+        if session is None or session.token_expiring():
+            user, token_expires_at = await authenticate_user(token) if token else (None, None)
+            if not user:
+                await self.close(code=4401, reason="JWT token is invalid or expired.")
+                return False
+        else:
+            user, token_expires_at = session.user, session.token_expires_at
+
+        await self._start_session(user, token_expires_at)
+        return True
+
+    async def session_invalidate(self, event):
+        """The user's subscription or plan changed; rebuild the session on the next message."""
+        if self.session is not None:
+            self.session.stale = True
 
     async def receive(self, text_data):
-        self.last_activity = asyncio.get_event_loop().time()
         data = json.loads(text_data)
-        message_text = data.get("message")
-        engines_list = data.get("engines_list")
-        token = data.get("token")
-        reply_to_id = data.get("reply_to")
+        if data.get("type") == "ping":
+            # Heartbeat for clients that cannot send websocket ping frames (browsers);
+            # it does not count as activity, so idle chats are still reaped.
+            await self.send(text_data=json.dumps({"type": "pong"}))
+            return
+        idle_reaper.touch(self)
 
-        self.user = await authenticate_user(token)
-        if not self.user:
-            await self.close(code=4401, reason="JWT token is invalid or expired.")
+        if not await self._ensure_session(data.get("token")):
             return
 
-        customer = await database_sync_to_async(lambda: getattr(self.user, 'customer', None))()
-        if not customer or not await database_sync_to_async(customer.has_active_subscription)():
-            await self.close(code=4429, reason="You must have an active subscription to use the chat.")
+        if data.get("type") == "resume":
+            await self._resume(data.get("stream_id"), data.get("offset"))
+            return
+        if data.get("type") == "cancel":
+            await self._cancel(data.get("stream_id"))
+            return
+        if data.get("type") == "draft":
+            self._draft(data.get("message"), data.get("engines_list"))
             return
 
-        # Check if the user has reached the daily message limit
-        messages_sent_today = await database_sync_to_async(lambda: customer.messages_sent_today)()
-        messages_per_day = await database_sync_to_async(lambda: customer.subscription.plan.messages_limit)()
-        if messages_sent_today >= messages_per_day:
-            await self.close(code=4429, reason="You have reached the maximum number of messages allowed by your subscription plan.")
+        # Never wait for a running answer here: the frames sent meanwhile (`cancel`
+        # above all) must be handled right away, so the message is queued instead.
+        if self._generating() or self.queued or (self.queue_task is not None and not self.queue_task.done()):
+            if len(self.queued) >= settings.CHAT_MAX_QUEUED_MESSAGES:
+                await self.send(text_data=json.dumps({"type": "busy"}))
+                return
+            self.queued.append(data)
+            if self.queue_task is None or self.queue_task.done():
+                self.queue_task = asyncio.create_task(self._drain_queue())
+            return
+        await self._handle_message(data)
+
+    async def _drain_queue(self):
+        """Answer the queued messages in order, each once the answer before it is complete."""
+        while self.queued:
+            if self._generating():
+                await asyncio.wait([self.stream.task])
+                continue
+            try:
+                await self._handle_message(self.queued.popleft())
+            except Exception as e:
+                logger.error(f"Handling a queued message failed: {e}")
+                await self.close(code=1011)
+                return
+
+    async def _handle_message(self, data):
+        message_text = data.get("message")
+        engines_list = data.get("engines_list")
+        reply_to_id = data.get("reply_to")
+        session = self.session
+
+        if not session.has_active_subscription:
+            await self.close(code=4429, reason="You must have an active subscription to use the chat.")
             return
 
         if not message_text:
@@ -49,8 +146,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         # Validate engine categories based on the customer's plan
-        allowed_engine_categories = await database_sync_to_async(lambda: list(customer.subscription.plan.engines_categories.all()))()
-        if not all(engine in [category.id for category in allowed_engine_categories] for engine in engines_list):
+        if not session.allows_categories(engines_list or []):
             await self.close(code=4405, reason="One or more engine categories are not allowed by your subscription plan.")
             return
 
@@ -58,6 +154,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         reply_to_text = None
         reply_to_message = None
         if reply_to_id:
+            await message_writer.await_written(reply_to_id)
             try:
                 reply_to_message = await database_sync_to_async(Message.objects.get)(
                     id=reply_to_id, chat__user=self.user
@@ -67,92 +164,284 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.close(code=4404, reason="Reply-to message not found.")
                 return
 
-        final_msg, initial_prompt, error_message = await get_prompts(
-            message_text, engines_list, reply_to_text
+        # Count the message against the plan's limit; given back if no answer is generated.
+        allowed, _ = await database_sync_to_async(quota_ledger.consume)(
+            session.customer_id, "messages", session.messages_limit
         )
+        if not allowed:
+            await self.close(code=4429, reason="You have reached the maximum number of messages allowed by your subscription plan.")
+            return
 
-        print(final_msg)
+        # A new chat's first message may be answered from the response cache.
+        cache_entry = None
+        cached_answer = None
+        if is_first_turn(self.slug, reply_to_id) and data.get("use_cache", True):
+            scope = await get_response_cache_scope(engines_list)
+            if scope is not None:
+                cache_entry = (*scope, engines_list, message_text)
+                cached_answer = await response_cache.get(scope[0], engines_list, message_text)
 
-        if error_message:
-            await self.close(code=4404, reason=error_message)
+        # Reuse what was prefetched for the draft of this message.
+        prefetched = None
+        draft, self.draft = self.draft, None
+        if draft is not None:
+            if cached_answer is None and data.get("use_cache", True):
+                prefetched = await draft.take(message_text, engines_list)
+            else:
+                draft.cancel()
+
+        error_message = None
+        if cached_answer is None:
+            final_msg, initial_prompt, error_message, engine_timings = await get_prompts(
+                message_text, engines_list, reply_to_text,
+                use_cache=data.get("use_cache", True), prefetched=prefetched
+            )
+
+            for timing in engine_timings:
+                logger.info(
+                    f"Engine {timing['engine_id']} ({timing['service']}) finished with status "
+                    f"'{timing['status']}' in {timing['elapsed_ms']}ms"
+                )
+
+        if cached_answer is None and not error_message and not await rate_limiter.acquire(
+            get_openai_budgets(settings.OPENAI_MODEL), wait=settings.RATE_LIMIT_ANSWER_WAIT
+        ):
+            await database_sync_to_async(quota_ledger.release)(session.customer_id, "messages")
+            await self.close(code=1013, reason="The service is busy, please try again shortly.")
             return
 
-        self.messages.append({"role": "system", "content": initial_prompt})
+        if error_message or not await self._retrieve_or_create_chat(message_text):
+            await database_sync_to_async(quota_ledger.release)(session.customer_id, "messages")
+            if error_message:
+                await self.close(code=4404, reason=error_message)
+            return
 
-        await self._retrieve_or_create_chat(message_text)
+        if cached_answer is None:
+            # The history holds the raw user text; the extra data only goes to the current request.
+            messages = self.history.as_messages(system_prompt=initial_prompt)
+            messages.append({"role": "user", "content": final_msg})
+        self.history.append("user", message_text)
 
-        await save_message(self.chat, message_text, sender="user", engine_ids=engines_list, reply_to=reply_to_message)
-        self.messages.append({"role": "user", "content": final_msg})
-        customer.messages_sent_today += 1
-        await database_sync_to_async(customer.save)()
+        await message_writer.save(
+            self.chat, message_text, sender="user", engine_ids=engines_list,
+            reply_to_id=reply_to_message.id if reply_to_message else None
+        )
+
+        if cached_answer is None:
+            await self._generate_and_send_response(messages, engines_list, reply_to_id, cache_entry)
+        else:
+            self._start_generation(replay_deltas(cached_answer), engines_list, reply_to_id, replayed=True)
 
-        await self._generate_and_send_response(engines_list, reply_to_id)
+    def _draft(self, message_text, engines_list):
+        """
+        Prefetch the external data of a message being typed. A new draft replaces
+        the previous one, so only a pause in typing starts the prefetch.
+        """
+        if self.draft is not None:
+            self.draft.cancel()
+            self.draft = None
+
+        session = self.session
+        if (
+            not settings.DRAFT_PREFETCH_ENABLED
+            or not message_text or len(message_text.strip()) < settings.DRAFT_MIN_CHARS
+            or not engines_list
+            or not session.has_active_subscription
+            or not session.allows_categories(engines_list)
+        ):
+            return
+        self.draft = DraftPrefetch(self.user.pk, message_text, engines_list)
+        self.draft.start()
 
     async def _retrieve_or_create_chat(self, message_text):
+        """
+        Resolve the chat of this connection. An existing chat's history is loaded
+        once (from the shared cache, else the database); later turns are appended
+        in memory and written back to the cache after every answer.
+        """
+        if self.chat is not None:
+            return True
+
         if self.slug:
             try:
                 self.chat = await database_sync_to_async(Chat.objects.get)(
                     slug=self.slug, user=self.user
                 )
-                self.messages = await load_chat_history(self.chat)
             except Chat.DoesNotExist:
                 await self.close(code=4404, reason="Chat not found")
-                return
+                return False
+            turns = await get_cached_history(self.slug)
+            if turns is None:
+                await message_writer.flush()
+                turns = await load_chat_history(self.chat, limit=settings.CHAT_HISTORY_MAX_TURNS)
+            self.history.extend(turns)
         else:
             self.chat = await database_sync_to_async(Chat.objects.create)(
                 user=self.user, title=message_text[:50].strip()
             )
             self.slug = self.chat.slug
+        return True
 
-    async def _generate_and_send_response(self, engines_list, reply_to_id):
-        client = AsyncOpenAI()
+    async def _generate_and_send_response(self, messages, engines_list, reply_to_id, cache_entry=None):
+        client = get_openai_client()
         openai_response = await client.chat.completions.create(
-            messages=self.messages,
+            messages=messages,
             model=settings.OPENAI_MODEL,
             stream=True,
         )
+        self._start_generation(stream_deltas(openai_response), engines_list, reply_to_id, cache_entry)
 
-        final_response = ""
-        async for chunk in openai_response:
-            message_chunk = chunk.choices[0].delta.content or ""
-            message_chunk = message_chunk.replace("CHATGPT", "RITengine").replace("chatgpt", "RITengine").replace("ChatGPT", "RITengine").replace("chatGPT", "RITengine")
-            message_chunk = message_chunk.replace("OPENAI", "RIT team").replace("openai", "RIT team").replace("OpenAI", "RIT team").replace("openAI", "RIT team")
-            message_chunk = message_chunk.replace("OPEN AI", "RIT team").replace("open ai", "RIT team").replace("Open AI", "RIT team").replace("open AI", "RIT team")
-
-            final_response += message_chunk
-            if message_chunk:
-                await self.send(text_data=json.dumps({
-                    "content": message_chunk,
-                    "slug": self.slug,
-                    "is_ended": False
-                }))
-
-        engine_msg = await save_message(
-            self.chat, final_response, sender="engine", engine_ids=engines_list, reply_to=reply_to_id
+    def _start_generation(self, deltas, engines_list, reply_to_id, cache_entry=None, replayed=False):
+        # The answer is generated in its own task so it outlives this connection if
+        # the socket drops; the client can `resume` it from another connection.
+        stream = start_stream(self.user.pk, self.slug)
+        stream.replayed = replayed
+        self._attach_stream(stream)
+        stream.task = asyncio.create_task(self._generate(stream, deltas, engines_list, reply_to_id, cache_entry))
+
+    async def _generate(self, stream, deltas, engines_list, reply_to_id, cache_entry=None):
+        rewriter = StreamRewriter(get_brand_rules())
+        truncated = False
+        try:
+            async for content in deltas:
+                if content:
+                    stream.tokens += 1  # The API streams about one token per delta
+                await stream.feed(rewriter.feed(content))
+        except asyncio.CancelledError:
+            # `cancel`: closing the deltas drops the upstream response so the provider stops generating.
+            truncated = True
+            await deltas.aclose()
+            if not stream.replayed:
+                record_cancellation(stream)
+        except Exception as e:
+            logger.error(f"Generating stream {stream.id} failed: {e}")
+            attached = stream.listener is not None and stream.listener is self.listener
+            if attached:
+                stream.detach(self.listener)
+            await stream.finish(None)
+            if attached:
+                await self.close(code=1011)
+            return
+        stream.cancellable = False
+        await stream.feed(rewriter.flush())
+
+        final_response = stream.content
+        if not final_response:
+            # Stopped before the first token: nothing to keep, the message is not counted.
+            await database_sync_to_async(quota_ledger.release)(self.session.customer_id, "messages")
+            await stream.finish(None, truncated=truncated)
+            return
+
+        engine_msg = await message_writer.save(
+            self.chat, final_response, sender="engine", engine_ids=engines_list,
+            reply_to_id=reply_to_id, is_truncated=truncated
         )
-        await self.send(text_data=json.dumps({
-            "content": "",
-            "slug": self.slug,
-            "message_id": engine_msg.id,
-            "is_ended": True
-        }))
+        await stream.finish(engine_msg.id, truncated=truncated)
+        idle_reaper.touch(self)
+
+        if cache_entry is not None and not truncated:
+            category_id, ttl, engine_ids, message_text = cache_entry
+            await response_cache.set(category_id, ttl, engine_ids, message_text, final_response)
 
-        self.messages.append({"role": "system", "content": final_response})
+        self.history.append("system", final_response)
+        await cache_history(self.slug, self.history)
+
+    def _attach_stream(self, stream, offset=0):
+        """Make this connection the listener of `stream`, starting at `offset`."""
+        if self.stream is not None:
+            self.stream.detach(self.listener)
+        self.stream = stream
+        self.listener = FrameCoalescer(
+            self.send, stream.slug, *self.coalesce_options, stream_id=stream.id, offset=offset
+        )
+        stream.attach(self.listener)
+        return self.listener
 
-    async def timeout_check(self):
+    def _generating(self):
+        """Whether this connection's answer is still being generated; the next message must wait for it."""
+        return self.stream is not None and self.stream.task is not None and not self.stream.task.done()
+
+    async def _resume(self, stream_id, offset):
+        """
+        Continue an answer from `offset` after a reconnect. Streams of this process
+        are followed live; others are followed through their shared snapshot.
+        """
+        try:
+            offset = max(int(offset or 0), 0)
+        except (TypeError, ValueError):
+            offset = 0
+
+        stream = get_stream(stream_id)
+        if stream is not None and stream.user_id == self.user.pk:
+            self.slug = self.slug or stream.slug
+            pending, done = stream.content[offset:], stream.done
+            metrics.incr("stream.resumed")
+            if done:
+                listener = FrameCoalescer(self.send, stream.slug, *self.coalesce_options, stream_id=stream.id, offset=offset)
+                await listener.add(pending)
+                await listener.end(stream.message_id, stream.truncated)
+            else:
+                listener = self._attach_stream(stream, offset)
+                await listener.add(pending)
+            return
+
+        snapshot = await get_stream_snapshot(stream_id)
+        if snapshot is None or snapshot["user_id"] != self.user.pk:
+            await self.close(code=4404, reason="Stream not found or expired.")
+            return
+        self.slug = self.slug or snapshot["slug"]
+        metrics.incr("stream.resumed")
+        self.resume_task = asyncio.create_task(self._follow_snapshot(stream_id, snapshot, offset))
+
+    async def _follow_snapshot(self, stream_id, snapshot, offset):
+        listener = FrameCoalescer(self.send, snapshot["slug"], *self.coalesce_options, stream_id=stream_id, offset=offset)
+        sent = offset
         while True:
-            await asyncio.sleep(self.TIMEOUT)
-            current_time = asyncio.get_event_loop().time()
-            if current_time - self.last_activity > self.TIMEOUT:
-                await self.close(code=4001, reason="closed due to inactivity.")
-                break
+            content = snapshot["content"]
+            await listener.add(content[sent:])
+            sent = max(sent, len(content))
+            if snapshot["done"]:
+                await listener.end(snapshot["message_id"], snapshot["truncated"])
+                return
+
+            await asyncio.sleep(settings.STREAM_SNAPSHOT_INTERVAL)
+            snapshot = await get_stream_snapshot(stream_id)
+            if snapshot is None:
+                await self.close(code=4404, reason="Stream not found or expired.")
+                return
+
+    async def _cancel(self, stream_id=None):
+        """
+        Stop the answer being generated for this connection (or the given stream);
+        the partial answer is saved as truncated.
+        """
+        if self.stream is not None and stream_id in (None, self.stream.id):
+            stream = self.stream
+        else:
+            stream = get_stream(stream_id)
+
+        if stream is not None:
+            if stream.user_id == self.user.pk:
+                stream.cancel()
+            return
+
+        # Generated by another worker (followed after a reconnect).
+        snapshot = await get_stream_snapshot(stream_id) if stream_id else None
+        if snapshot is not None and snapshot["user_id"] == self.user.pk and not snapshot["done"]:
+            await request_cancel(stream_id)
 
     async def disconnect(self, close_code):
-        self.messages = []
-        # Cancel the timeout check task if it's running
-        if hasattr(self, 'timeout_task'):
-            self.timeout_task.cancel()
-            try:
-                await self.timeout_task
-            except asyncio.CancelledError:
-                pass
+        self.queued.clear()
+        if self.queue_task is not None:
+            self.queue_task.cancel()
+        if self.resume_task is not None:
+            self.resume_task.cancel()
+        if self.draft is not None:
+            self.draft.cancel()
+        if self.stream is not None and not self.stream.done:
+            # The answer keeps being generated (and then saved) for a later `resume`.
+            self.stream.detach(self.listener)
+        else:
+            self.history.clear()
+        await self._leave_session_groups()
+        idle_reaper.unregister(self)
@@ -0,0 +1,129 @@
+"""
+Local corpus of patent and scholarly results fetched from SerpApi.
+
+Every result of a corpus service is kept (deduplicated on its patent ID or
+link), and so is every keyword searched, linked to the results it returned.
+A later search is answered from the corpus, without calling the external
+service, with those same results when the keyword itself was fetched less
+than CORPUS_MAX_AGE ago, or else when enough fresh documents match it.
+Matching uses PostgreSQL full-text search (GIN-indexed); other databases fall
+back to requiring every keyword term in the title or snippet.
+"""
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import and_
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import metrics
+from .extraction import normalize_message
+from .models import CorpusDocument, CorpusSearch, CorpusSearchResult
+from .ratelimit import speculative
+
+logger = logging.getLogger(__name__)
+
+# Fields each corpus service's adapter returns for a result.
+CORPUS_FIELDS = {
+    "google_patents_search": ("title", "snippet", "patent_id", "link"),
+    "google_scholar_search": ("title", "snippet", "link"),
+}
+
+
+def is_corpus_service(service):
+    return settings.CORPUS_ENABLED and service in CORPUS_FIELDS
+
+
+def _match(documents, keyword):
+    """Documents matching the keyword, best first."""
+    if connection.vendor == "postgresql":
+        vector = SearchVector("title", "snippet", config="english")
+        query = SearchQuery(keyword, config="english", search_type="websearch")
+        return documents.annotate(
+            search=vector, rank=SearchRank(vector, query)
+        ).filter(search=query).order_by("-rank", "-fetched_at")
+
+    terms = normalize_message(keyword).split()
+    if not terms:
+        return documents.none()
+    return documents.filter(reduce(and_, (
+        Q(title__icontains=term) | Q(snippet__icontains=term) for term in terms
+    ))).order_by("-fetched_at")
+
+
+@database_sync_to_async
+def search_corpus(service, keyword):
+    """Return the corpus results for the keyword, or None if the external service should be searched."""
+    fresh_since = timezone.now() - timedelta(seconds=settings.CORPUS_MAX_AGE)
+    searched = CorpusSearch.objects.filter(
+        service=service, keyword=normalize_message(keyword), fetched_at__gte=fresh_since
+    ).first()
+    if searched is not None:
+        results = list(searched.documents.order_by("corpussearchresult__position").values(*CORPUS_FIELDS[service]))
+        if results:
+            metrics.incr("corpus.hit")
+            return results
+
+    documents = CorpusDocument.objects.filter(service=service, fetched_at__gte=fresh_since)
+    results = list(_match(documents, keyword).values(*CORPUS_FIELDS[service])[:settings.CORPUS_MAX_RESULTS])
+    if len(results) < max(settings.CORPUS_MIN_RESULTS, 1):
+        metrics.incr("corpus.miss")
+        return None
+
+    metrics.incr("corpus.hit")
+    return results
+
+
+@database_sync_to_async
+def store_results(service, keyword, results):
+    """Add (or refresh) the results of an external search to the corpus."""
+    now = timezone.now()
+    fields = CORPUS_FIELDS[service]
+    documents = {}
+    for result in results:
+        key = result.get("patent_id") or result.get("link")
+        if key:
+            documents[key] = CorpusDocument(
+                service=service, key=key, fetched_at=now,
+                **{field: result.get(field) or "" for field in fields},
+            )
+
+    with transaction.atomic():
+        CorpusDocument.objects.bulk_create(
+            documents.values(),
+            update_conflicts=True,
+            unique_fields=["service", "key"],
+            update_fields=[*fields, "fetched_at"],
+        )
+        ids = dict(CorpusDocument.objects.filter(service=service, key__in=documents).values_list("key", "id"))
+        search, _ = CorpusSearch.objects.update_or_create(
+            service=service, keyword=normalize_message(keyword),
+            defaults={"result_count": len(documents), "fetched_at": now},
+        )
+        search.results.all().delete()
+        CorpusSearchResult.objects.bulk_create([
+            CorpusSearchResult(search=search, document_id=ids[key], position=position)
+            for position, key in enumerate(documents)
+        ])
+    metrics.incr("corpus.stored", len(documents))
+
+
+async def search_with_corpus(service, keyword, search):
+    """
+    Search the keyword in the corpus first, then with `search(keyword)` on the
+    external service (storing its results, unless prefetching for a draft).
+    """
+    results = await search_corpus(service, keyword)
+    if results is not None:
+        return results
+
+    results = await search(keyword)
+    if results and not speculative.get():  # Draft keywords are not indexed as searched
+        try:
+            await store_results(service, keyword, results)
+        except Exception as e:
+            logger.error(f"Storing {service} results for '{keyword}' in the corpus failed: {e}")
+    return results
@@ -0,0 +1,151 @@
+"""
+Packing of external engine results into the prompt.
+
+Adapters return every result they get (up to a hundred patents per search), so
+the evidence given to the model is reduced first: results are deduplicated
+across engines, ranked against the user message with BM25 and added in rank
+order, as compact JSON tables, until the category's token budget is spent.
+"""
+import json
+import math
+import re
+from collections import Counter
+from django.conf import settings
+
+# Rough size of a token for English text; good enough to enforce a budget without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Result fields scored against the message.
+TEXT_FIELDS = ("title", "snippet", "value", "description")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def tokenize(text):
+    return re.findall(r"\w+", text.casefold())
+
+
+def dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def get_result_text(result):
+    return " ".join(str(result[field]) for field in TEXT_FIELDS if result.get(field))
+
+
+def get_result_key(result):
+    """
+    Identity of a result across engines: its link or patent ID, else all of its
+    fields (text fields normalized), so e.g. the same product at different prices
+    is kept twice.
+    """
+    for field in ("link", "patent_id"):
+        if result.get(field):
+            return field, result[field]
+    return "result", dumps({
+        field: " ".join(tokenize(str(value))) if field in TEXT_FIELDS else value
+        for field, value in sorted(result.items())
+    })
+
+
+def bm25_scores(query, documents):
+    """BM25 score of each tokenized document for the tokenized query."""
+    if not documents:
+        return []
+    average_length = sum(map(len, documents)) / len(documents) or 1
+    document_frequency = Counter(term for document in documents for term in set(document))
+    idf = {
+        term: math.log(1 + (len(documents) - frequency + 0.5) / (frequency + 0.5))
+        for term, frequency in document_frequency.items()
+    }
+
+    scores = []
+    for document in documents:
+        frequencies = Counter(document)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(document) / average_length)
+        scores.append(sum(
+            idf[term] * frequencies[term] * (BM25_K1 + 1) / (frequencies[term] + norm)
+            for term in query if term in frequencies
+        ))
+    return scores
+
+
+def clip(result):
+    """Shorten overly long text fields of a result."""
+    limit = settings.EVIDENCE_FIELD_MAX_CHARS
+    return {
+        field: value[:limit].rstrip() + "…" if isinstance(value, str) and len(value) > limit else value
+        for field, value in result.items()
+    }
+
+
+def pack_evidence(message, extra_data, token_budget=None):
+    """
+    Return `(packed, stats)`: the compact JSON evidence for `extra_data` (as built
+    by `get_prompts`) and the token counts before and after packing.
+
+    Notes, filters and searches are always kept; results are ranked and added
+    until `token_budget` tokens (EVIDENCE_TOKEN_BUDGET by default) are used.
+    """
+    token_budget = token_budget or settings.EVIDENCE_TOKEN_BUDGET
+    evidence = {}
+    results = {}
+    returned = 0
+    query = tokenize(message)
+    for entry in extra_data:
+        if isinstance(entry, str):
+            evidence.setdefault("notes", []).append(entry)
+        elif "filter" in entry:
+            evidence.setdefault("filters", []).append(entry["filter"])
+        else:
+            search = dict(entry.get("external_data") or {})
+            if entry.get("partial"):
+                search["partial"] = True
+            evidence.setdefault("searches", []).append(search)
+            query += tokenize(str(search.get("keyword", "")))
+            for result in entry.get("service_data") or []:
+                if isinstance(result, dict):
+                    returned += 1
+                    results.setdefault(get_result_key(result), result)
+
+    # Ties keep the adapters' order.
+    candidates = list(results.values())
+    scores = bm25_scores(query, [tokenize(get_result_text(result)) for result in candidates])
+    ranked = [result for _, _, result in sorted(
+        zip(scores, range(len(candidates)), candidates), key=lambda item: (-item[0], item[1])
+    )]
+
+    # Results sharing the same fields go in one table, which states the field names once.
+    tables = {}
+    used = estimate_tokens(dumps(evidence))
+    included = 0
+    for result in ranked:
+        result = clip(result)
+        columns = tuple(result)
+        row = [result[column] for column in columns]
+        cost = estimate_tokens(dumps(row)) + (0 if columns in tables else estimate_tokens(dumps(columns)))
+        if used + cost > token_budget:
+            break
+        tables.setdefault(columns, []).append(row)
+        used += cost
+        included += 1
+
+    if tables:
+        evidence["results"] = [{"columns": list(columns), "rows": rows} for columns, rows in tables.items()]
+    if included < len(ranked):
+        evidence["omitted_results"] = len(ranked) - included
+
+    packed = dumps(evidence)
+    stats = {
+        "tokens_before": estimate_tokens(str(extra_data)),
+        "tokens_after": estimate_tokens(packed),
+        "results": len(ranked),
+        "duplicates": returned - len(ranked),
+        "included": included,
+    }
+    return packed, stats
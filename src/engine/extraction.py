@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from django.conf import settings
+from .cache import TieredCache
+from . import metrics
+from .functions import FUNCTIONS_CONFIG, call_openai_function, call_openai_functions
+from .keywords import get_local_extractor
+
+logger = logging.getLogger(__name__)
+
+keyword_cache = TieredCache(
+    "keyword",
+    local_size=settings.KEYWORD_CACHE_LOCAL_SIZE,
+    default_ttl=settings.KEYWORD_CACHE_TTL,
+)
+
+# Hash of every tool definition, part of the cache key so edits to functions.json
+# invalidate the arguments extracted with the previous schema.
+TOOL_SCHEMA_HASHES = {
+    tool: hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+    for tool, config in FUNCTIONS_CONFIG.items()
+}
+
+
+def normalize_message(message):
+    """Fold case, punctuation and whitespace so trivially edited messages share a key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", message.casefold()).split())
+
+
+def get_keyword_cache_key(message, tool):
+    return keyword_cache.make_key(tool, TOOL_SCHEMA_HASHES.get(tool), normalize_message(message))
+
+
+def parse_arguments(arguments):
+    """Tool-call arguments come back as a JSON string; return them as a dict (or None)."""
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments)
+        except json.JSONDecodeError:
+            return None
+    return arguments if isinstance(arguments, dict) else None
+
+
+class KeywordExtractor:
+    """
+    Extracts the tool-call arguments (keyword, description, ...) of the external
+    services selected for a single message.
+
+    Arguments are served from the keyword cache when possible. Services that miss
+    the cache use the local extractor's keyword when it is confident enough, else
+    share a single combined OpenAI call, and each one falls back to its own tool
+    call when the combined call fails or leaves it out. `prefetched` arguments
+    (from the draft of the message) are used as they are.
+    """
+    def __init__(self, message, services, use_cache=True, prefetched=None):
+        self.message = message
+        self.services = list(dict.fromkeys(services))
+        self.use_cache = use_cache and settings.KEYWORD_CACHE_ENABLED
+        self.cached = {
+            service: arguments for service, arguments in (prefetched or {}).items() if service in self.services
+        }
+        self.local = {}
+        self.combined = None
+
+    @property
+    def messages(self):
+        return [{'role': 'user', 'content': self.message}]
+
+    async def start(self):
+        if self.use_cache:
+            for service in self.services:
+                if service in self.cached:
+                    continue
+                arguments = await keyword_cache.get(get_keyword_cache_key(self.message, service))
+                if arguments is not None:
+                    self.cached[service] = arguments
+
+        missing = [service for service in self.services if service not in self.cached]
+        if missing and self._extract_locally(missing):
+            missing = []
+        if settings.OPENAI_COMBINED_EXTRACTION and len(missing) > 1:
+            self.combined = asyncio.ensure_future(call_openai_functions(self.messages, missing))
+
+    def _extract_locally(self, services):
+        """Use the local extractor's keyword for `services` if it is confident enough."""
+        extractor = get_local_extractor()
+        if extractor is None:
+            return False
+        keyword, confidence = extractor.extract(self.message)
+        metrics.observe("keywords.local_confidence", confidence)
+        if not keyword or confidence < settings.KEYWORD_LOCAL_MIN_CONFIDENCE:
+            metrics.incr("keywords.local_rejected")
+            return False
+
+        # Every engine waits for the tool call, but a combined call's tokens are shared.
+        token_share = 1 / len(services) if settings.OPENAI_COMBINED_EXTRACTION else 1
+        for service in services:
+            properties = FUNCTIONS_CONFIG[service][0]["function"]["parameters"]["properties"]
+            arguments = {"keyword": keyword}
+            if "description" in properties:
+                arguments["description"] = self.message
+            self.local[service] = arguments
+
+            metrics.incr(f"keywords.local.{service}")
+            metrics.incr(f"keywords.saved_ms.{service}", round(metrics.get_average("keywords.llm_ms")))
+            metrics.incr(
+                f"keywords.saved_tokens.{service}", round(metrics.get_average("keywords.llm_tokens") * token_share)
+            )
+        return True
+
+    def close(self):
+        if self.combined is not None and not self.combined.done():
+            self.combined.cancel()
+
+    async def _from_combined(self, service):
+        if self.combined is None:
+            return None
+        try:
+            # Shielded: one engine missing its deadline must not cancel the shared call.
+            return (await asyncio.shield(self.combined)).get(service)
+        except Exception as e:
+            logger.warning(f"Combined keyword extraction failed, falling back for {service}: {e}")
+            return None
+
+    async def get_arguments(self, service):
+        """Return the parsed tool-call arguments for `service`, or None if they could not be extracted."""
+        if service in self.cached:
+            return self.cached[service]
+        if service in self.local:
+            return self.local[service]
+
+        arguments = await self._from_combined(service)
+        if arguments is None:
+            arguments = parse_arguments(await call_openai_function(self.messages, service))
+
+        if arguments is not None and self.use_cache:
+            await keyword_cache.set(get_keyword_cache_key(self.message, service), arguments)
+        return arguments
@@ -1,11 +1,21 @@
 import json
-from openai import AsyncOpenAI
+import time
+from . import metrics
 from .constants import EXTERNAL_SERVICE_FUNCTIONS
+from .llm import get_openai_client
+from .resilience import get_breaker
+from .ratelimit import get_openai_budgets, rate_limiter
 from django.conf import settings
 
 with open('functions.json', 'r') as f:
     FUNCTIONS_CONFIG = json.load(f)
 
+def record_extraction_cost(response, started_at):
+    """Latency and tokens of a keyword-extraction call, what a local extraction saves."""
+    metrics.observe("keywords.llm_ms", (time.monotonic() - started_at) * 1000)
+    if getattr(response, "usage", None) is not None:
+        metrics.observe("keywords.llm_tokens", response.usage.total_tokens)
+
 async def call_openai_function(messages, tool):
     """
     This function calls OpenAI's chat completion API.
@@ -21,17 +31,75 @@ async def call_openai_function(messages, tool):
     if not tool_config:
         raise ValueError(f"Error: '{tool}' does not have a valid configuration in the functions.json file.")
 
-    client = AsyncOpenAI()
+    client = get_openai_client()
 
-    response = await client.chat.completions.create(
+    await rate_limiter.limit(get_openai_budgets(settings.OPENAI_MODEL))
+    started_at = time.monotonic()
+    response = await get_breaker("openai").call(lambda: client.chat.completions.create(
         model=settings.OPENAI_MODEL,
         messages=messages,
         tools=tool_config,
         tool_choice="required",
-    )
+    ))
+    record_extraction_cost(response, started_at)
 
     return response.choices[0].message.tool_calls[0].function.arguments
 
+COMBINED_FUNCTION_NAME = "extract_search_arguments"
+
+def build_combined_tool(tools):
+    """
+    Merge the functions.json schemas of the given tools into a single function whose
+    arguments hold one object per tool, so all of them are extracted in one completion.
+    """
+    properties = {}
+    for tool in tools:
+        tool_config = FUNCTIONS_CONFIG.get(tool)
+        if not tool_config:
+            raise ValueError(f"Error: '{tool}' does not have a valid configuration in the functions.json file.")
+        function = tool_config[0]["function"]
+        properties[tool] = {**function["parameters"], "description": function["description"]}
+
+    return [{
+        "type": "function",
+        "function": {
+            "name": COMBINED_FUNCTION_NAME,
+            "description": "Extract the search arguments for every listed service from the user's message",
+            "strict": True,
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "required": list(tools),
+                "additionalProperties": False,
+            },
+        },
+    }]
+
+async def call_openai_functions(messages, tools):
+    """
+    Extract the arguments of several tools with a single chat completion.
+    Returns a dict mapping each tool name to its parsed arguments; tools missing
+    from the model's answer are left out so the caller can fall back for them.
+    """
+    invalid_tools = [tool for tool in tools if tool not in EXTERNAL_SERVICE_FUNCTIONS]
+    if invalid_tools:
+        raise ValueError(f"Error: {invalid_tools} are not valid service functions. Choose from: {EXTERNAL_SERVICE_FUNCTIONS}")
+
+    client = get_openai_client()
+
+    await rate_limiter.limit(get_openai_budgets(settings.OPENAI_MODEL))
+    started_at = time.monotonic()
+    response = await get_breaker("openai").call(lambda: client.chat.completions.create(
+        model=settings.OPENAI_MODEL,
+        messages=messages,
+        tools=build_combined_tool(tools),
+        tool_choice={"type": "function", "function": {"name": COMBINED_FUNCTION_NAME}},
+    ))
+    record_extraction_cost(response, started_at)
+
+    arguments = json.loads(response.choices[0].message.tool_calls[0].function.arguments)
+    return {tool: arguments[tool] for tool in tools if isinstance(arguments.get(tool), dict)}
+
 # import asyncio
 
 # # Example messages and tool
@@ -0,0 +1,53 @@
+from collections import deque
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ChatHistory:
+    """
+    In-memory transcript of a chat, kept by the consumer for the lifetime of a
+    connection so the database is read only once per chat.
+
+    Turns are stored as compact `(role, content)` tuples and only the latest
+    `max_turns` are retained, which keeps memory bounded on long chats.
+    """
+    __slots__ = ("turns",)
+
+    def __init__(self, max_turns=None):
+        self.turns = deque(maxlen=max_turns)
+
+    def __len__(self):
+        return len(self.turns)
+
+    def append(self, role, content):
+        self.turns.append((role, content))
+
+    def extend(self, turns):
+        self.turns.extend(turns)
+
+    def clear(self):
+        self.turns.clear()
+
+    def as_messages(self, system_prompt=None):
+        """Build the message list for a chat completion, led by the given system prompt."""
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        messages.extend({"role": role, "content": content} for role, content in self.turns)
+        return messages
+
+
+def get_history_cache_key(slug):
+    return f"chat_history:{slug}"
+
+
+async def get_cached_history(slug):
+    """
+    Return the chat's latest turns from the shared cache, or None on a miss.
+    The cache lets a reconnecting client land on any worker without re-reading
+    the chat (or missing messages another worker has not written yet).
+    """
+    turns = await cache.aget(get_history_cache_key(slug))
+    return [tuple(turn) for turn in turns] if turns is not None else None
+
+
+async def cache_history(slug, history):
+    await cache.aset(get_history_cache_key(slug), list(history.turns), settings.CHAT_HISTORY_CACHE_TTL)
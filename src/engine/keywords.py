@@ -0,0 +1,124 @@
+"""
+Local keyword extraction.
+
+Most messages sent to an external engine are short requests ("patents for
+forming cranioplasty mesh") whose search keyword is the message minus its
+filler words. A local extractor produces that keyword together with a
+confidence score; `KeywordExtractor` only asks the model (a tool call of a few
+hundred milliseconds) when the confidence is below KEYWORD_LOCAL_MIN_CONFIDENCE.
+
+Extractors are pluggable through KEYWORD_LOCAL_EXTRACTOR: any class whose
+`extract(message)` returns `(keyword, confidence)`, or `(None, 0.0)`.
+"""
+import re
+from functools import lru_cache
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+out over own same she should so some such than that the their them then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you your
+please find search show list give get looking look need want know tell help me us related regarding
+patent patents paper papers article articles publication publications research study studies scholar journal
+product products buy price prices cheap cheapest best top good review reviews shop shopping deal deals
+suggest suggestions autocomplete something anything thing things latest new recent any some
+""".split())
+
+# Words that usually change what the search should be (comparisons, exclusions, dates,
+# people, price ranges); the model handles those better than a word filter.
+HARD_WORDS = frozenset("""
+compare comparison versus vs difference differences between not without except excluding exclude inventor
+inventors invented assignee assigned author authors written filed granted before after since until cheaper
+under below over above less more than
+""".split())
+
+# Messages made only of these are chat, not searches.
+CHAT_WORDS = frozenset("""
+hi hello hey thanks thank thx ok okay yes yeah no nope sure cool great nice bye goodbye welcome sorry hmm
+""".split())
+
+# Questions and requests to do something ("how do I file a patent") ask for an answer,
+# not for results on their leftover words.
+QUESTION_WORDS = frozenset("how what why when where which who whom whose can could should would is are do does".split())
+INTENT_VERBS = frozenset("""
+file apply register submit make build create write use start fix install learn cancel renew pay
+""".split())
+
+MAX_PHRASES = 3
+MAX_KEYWORD_WORDS = 8
+MIN_KEYWORD_WORDS = 2
+
+
+def split_phrases(words):
+    """RAKE candidate phrases: runs of words between stopwords."""
+    phrases, phrase = [], []
+    for word in words:
+        if word.casefold() in STOPWORDS:
+            if phrase:
+                phrases.append(phrase)
+            phrase = []
+        else:
+            phrase.append(word)
+    if phrase:
+        phrases.append(phrase)
+    return phrases
+
+
+def rake_scores(phrases):
+    """Score of each phrase: the sum of its words' degree / frequency (RAKE)."""
+    frequency, degree = {}, {}
+    for phrase in phrases:
+        for word in phrase:
+            word = word.casefold()
+            frequency[word] = frequency.get(word, 0) + 1
+            degree[word] = degree.get(word, 0) + len(phrase)
+    return [sum(degree[word.casefold()] / frequency[word.casefold()] for word in phrase) for phrase in phrases]
+
+
+class RakeKeywordExtractor:
+    """
+    Keyword from the message's candidate phrases (at most MAX_PHRASES, best RAKE
+    scores first, kept in message order). Confidence drops with every extra
+    phrase, for keywords too short or too long, for words that need interpreting,
+    for questions and requests to do something, and for text that is mostly
+    non-Latin (the stopwords are English). Chat ("thanks!") has no keyword.
+    """
+    def extract(self, message):
+        words = re.findall(r"[\w][\w'+.-]*[\w]|\w", message)
+        if not words:
+            return None, 0.0
+
+        letters = [char for char in message if char.isalpha()]
+        if letters and sum(not char.isascii() for char in letters) / len(letters) > 0.3:
+            return None, 0.0
+
+        phrases = split_phrases(words)
+        if not phrases or all(word.casefold() in CHAT_WORDS for phrase in phrases for word in phrase):
+            return None, 0.0
+        scores = rake_scores(phrases)
+        best = sorted(sorted(range(len(phrases)), key=lambda index: -scores[index])[:MAX_PHRASES])
+        keyword_words = [word for index in best for word in phrases[index]]
+
+        confidence = 1.0 - 0.2 * (len(best) - 1)
+        content_words = sum(len(phrase) for phrase in phrases)
+        confidence *= len(keyword_words) / content_words
+        if len(keyword_words) < MIN_KEYWORD_WORDS or len(keyword_words) > MAX_KEYWORD_WORDS:
+            confidence *= 0.5
+        if words[0].casefold() in QUESTION_WORDS or message.rstrip().endswith("?"):
+            confidence *= 0.5
+        if any(word.casefold() in INTENT_VERBS for word in keyword_words):
+            confidence *= 0.5
+        if any(word.casefold() in HARD_WORDS for word in words):
+            confidence *= 0.5
+        return " ".join(keyword_words), round(confidence, 3)
+
+
+@lru_cache(maxsize=None)
+def get_local_extractor():
+    """The configured local extractor, or None when local extraction is disabled."""
+    if not settings.KEYWORD_LOCAL_EXTRACTOR:
+        return None
+    return import_string(settings.KEYWORD_LOCAL_EXTRACTOR)()
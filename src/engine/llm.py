@@ -0,0 +1,64 @@
+import asyncio
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from .adapters.http_client import close_on_loop
+
+# Process-wide LLM clients, keyed by name. Each keeps its own connection pool alive
+# across messages so the streaming and tool-call paths skip the TLS handshake.
+_clients = {}
+
+
+def create_openai_client():
+    return AsyncOpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        timeout=httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        ),
+    )
+
+
+def get_openai_client(name="default"):
+    """
+    Returns the shared AsyncOpenAI client, creating it lazily on first use
+    (or when the event loop it was created on is gone).
+    """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(name)
+    if entry is not None:
+        client, client_loop = entry
+        if client_loop is loop and not client.is_closed():
+            return client
+        if client_loop is not loop:
+            close_on_loop(client.close, client_loop)
+
+    client = create_openai_client()
+    _clients[name] = (client, loop)
+    return client
+
+
+async def close_openai_clients():
+    """Close every shared LLM client. Meant to be called on shutdown."""
+    while _clients:
+        _, (client, _) = _clients.popitem()
+        await client.close()
+
+
+async def stream_deltas(response):
+    """
+    Yield the text deltas of a streamed chat completion. The response is closed
+    when the stream ends or is abandoned (e.g. a cancelled generation), so the
+    provider stops generating.
+    """
+    try:
+        async for chunk in response:
+            yield chunk.choices[0].delta.content or ""
+    finally:
+        await response.close()
@@ -0,0 +1,64 @@
+"""
+Lightweight in-process metrics for the engine pipeline.
+
+Counters and observations are kept per worker process and exposed to staff
+through `EngineMetricsView`.
+"""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_observations = {}
+
+
+def incr(name, value=1):
+    """Increment the counter `name` by `value`."""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, value):
+    """Record a single observation (e.g. a latency or a size) under `name`."""
+    with _lock:
+        stats = _observations.setdefault(name, {"count": 0, "sum": 0, "max": value})
+        stats["count"] += 1
+        stats["sum"] += value
+        stats["max"] = max(stats["max"], value)
+
+
+def get_counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def get_average(name, default=0.0):
+    """Average of the observations recorded under `name`."""
+    with _lock:
+        stats = _observations.get(name)
+        return stats["sum"] / stats["count"] if stats else default
+
+
+def hit_rate(prefix):
+    """Share of `<prefix>.hit*` counters among all lookups under `prefix`."""
+    with _lock:
+        hits = sum(value for key, value in _counters.items() if key.startswith(f"{prefix}.hit"))
+        misses = _counters.get(f"{prefix}.miss", 0)
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+def snapshot():
+    """Return a copy of every counter and observation, with averages precomputed."""
+    with _lock:
+        observations = {
+            name: {**stats, "avg": stats["sum"] / stats["count"]}
+            for name, stats in _observations.items()
+        }
+        return {"counters": dict(_counters), "observations": observations}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _observations.clear()
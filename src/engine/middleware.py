@@ -10,12 +10,13 @@ User = get_user_model()
 
 @database_sync_to_async
 def get_user(token):
+    """Return the token's user and its expiry timestamp."""
     try:
         access_token = AccessToken(token)
         user = User.objects.get(id=access_token['user_id'])
-        return user
+        return user, access_token['exp']
     except (User.DoesNotExist, TokenError):
-        return AnonymousUser()
+        return AnonymousUser(), None
 
 
 class JWTAuthMiddleware(BaseMiddleware):
@@ -27,7 +28,7 @@ class JWTAuthMiddleware(BaseMiddleware):
                 token_name, token_key = headers[b'authorization'].decode().split()
 
                 if token_name == 'Bearer':
-                    scope['user'] = await get_user(token_key)
+                    scope['user'], scope['token_expires_at'] = await get_user(token_key)
                 else:
                     scope['user'] = AnonymousUser()
             except Exception as e:
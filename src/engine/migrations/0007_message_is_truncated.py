@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("engine", "0006_alter_engine_external_service"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="is_truncated",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("engine", "0007_message_is_truncated"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="enginecategory",
+            name="response_cache_ttl",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Seconds to reuse answers to identical or near-identical first messages. Empty disables it.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("engine", "0008_enginecategory_response_cache_ttl"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="enginecategory",
+            name="evidence_token_budget",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Tokens of external results to include in the prompt. Empty uses EVIDENCE_TOKEN_BUDGET.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+SEARCH_INDEX = GinIndex(SearchVector("title", "snippet", config="english"), name="corpus_document_search")
+
+
+# The full-text index only exists on PostgreSQL; other databases search the corpus without it.
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("engine", "CorpusDocument"), SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.remove_index(apps.get_model("engine", "CorpusDocument"), SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engine', '0009_enginecategory_evidence_token_budget'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpusDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(max_length=255)),
+                ('key', models.CharField(max_length=500)),
+                ('title', models.TextField(blank=True)),
+                ('snippet', models.TextField(blank=True)),
+                ('patent_id', models.CharField(blank=True, max_length=255)),
+                ('link', models.URLField(blank=True, max_length=500)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('service', 'key'), name='unique_corpus_document')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CorpusSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(max_length=255)),
+                ('keyword', models.CharField(max_length=500)),
+                ('result_count', models.PositiveIntegerField(default=0)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('service', 'keyword'), name='unique_corpus_search')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engine', '0011_circuitbreakerstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpusSearchResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='engine.corpusdocument')),
+                ('search', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='engine.corpussearch')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='corpussearch',
+            name='documents',
+            field=models.ManyToManyField(related_name='searches', through='engine.CorpusSearchResult', to='engine.corpusdocument'),
+        ),
+        migrations.AddConstraint(
+            model_name='corpussearchresult',
+            constraint=models.UniqueConstraint(fields=('search', 'document'), name='unique_corpus_search_result'),
+        ),
+    ]
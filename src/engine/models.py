@@ -23,6 +23,14 @@ class EngineCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
     prompt = models.TextField()
     is_default = models.BooleanField(default=False)
+    response_cache_ttl = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Seconds to reuse answers to identical or near-identical first messages. Empty disables it."
+    )
+    evidence_token_budget = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Tokens of external results to include in the prompt. Empty uses EVIDENCE_TOKEN_BUDGET."
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -82,11 +90,84 @@ class Message(models.Model):
     engines = models.ManyToManyField(Engine, related_name="messages")
     bookmark = models.ForeignKey(Bookmark, on_delete=models.SET_NULL, related_name='messages', null=True, blank=True)
     reply_to = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='replies')
+    is_truncated = models.BooleanField(default=False)  # Answer stopped by the user before it was complete
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.get_sender_display()}: {self.text[:50]}"
 
+class CorpusDocument(models.Model):
+    """A patent or scholarly result fetched from an external service, kept for later searches."""
+    service = models.CharField(max_length=255)
+    key = models.CharField(max_length=500)  # Patent ID, else link
+    title = models.TextField(blank=True)
+    snippet = models.TextField(blank=True)
+    patent_id = models.CharField(max_length=255, blank=True)
+    link = models.URLField(max_length=500, blank=True)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'key'], name='unique_corpus_document')
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class CorpusSearch(models.Model):
+    """A keyword searched on an external service, whose results are in the corpus."""
+    service = models.CharField(max_length=255)
+    keyword = models.CharField(max_length=500)  # Normalized
+    result_count = models.PositiveIntegerField(default=0)
+    fetched_at = models.DateTimeField()
+    documents = models.ManyToManyField(CorpusDocument, through='CorpusSearchResult', related_name='searches')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'keyword'], name='unique_corpus_search')
+        ]
+
+    def __str__(self):
+        return f"{self.service}: {self.keyword}"
+
+
+class CorpusSearchResult(models.Model):
+    """A document returned for a searched keyword, at its position in the external service's results."""
+    search = models.ForeignKey(CorpusSearch, on_delete=models.CASCADE, related_name='results')
+    document = models.ForeignKey(CorpusDocument, on_delete=models.CASCADE)
+    position = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['search', 'document'], name='unique_corpus_search_result')
+        ]
+
+
+class CircuitBreakerState(models.Model):
+    """Last state change of an upstream's circuit breaker in one worker process."""
+    STATE_CHOICES = (
+        ('closed', 'Closed'),
+        ('open', 'Open'),
+        ('half_open', 'Half-open'),
+    )
+    name = models.CharField(max_length=100)
+    worker = models.CharField(max_length=255)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES)
+    error_rate = models.FloatField(default=0)
+    p95_ms = models.FloatField(null=True, blank=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'worker'], name='unique_circuit_breaker_state')
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.worker}): {self.state}"
+
+
 class Assist(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
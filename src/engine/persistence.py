@@ -0,0 +1,326 @@
+"""
+Write-behind persistence of chat messages.
+
+Messages get their primary key up front (from a block reserved on the table's
+sequence) so the consumer can reference them right away, and are written in
+batches by a background task instead of on the streaming path. Batches that
+cannot be written are spilled to MESSAGE_SPOOL_DIR and written later by the
+`replay_spooled_messages` task.
+
+Until its batch is written, a message has a marker in the shared cache, so other
+workers asked about its ID know to wait for it rather than answer 404.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from . import metrics
+from .models import Chat, Message, Engine
+from .utils import save_message
+
+logger = logging.getLogger(__name__)
+
+
+def get_pending_key(message_id):
+    return f"message_pending:{message_id}"
+
+
+class MessageWriter:
+    """
+    Queues messages and writes them with `bulk_create` (plus one bulk insert into
+    the engines through table) per batch. A single writer task per process drains
+    the queue in FIFO order, so messages of a chat are stored in the order they
+    were sent.
+
+    ID pre-allocation needs a database sequence (PostgreSQL); on other backends
+    messages are saved synchronously as before.
+    """
+    def __init__(self, batch_size=100, flush_interval=0.2, id_block_size=50, max_retries=3,
+                 retry_delay=0.5, spool_dir=None, write_wait=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.id_block_size = id_block_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.spool_dir = spool_dir
+        self.write_wait = write_wait
+        self._ids = deque()
+        self._ids_lock = threading.Lock()
+        self._queue = None
+        self._task = None
+
+    @property
+    def enabled(self):
+        return settings.MESSAGE_WRITE_BEHIND and connection.vendor == "postgresql"
+
+    def _reserve_ids(self):
+        table = Message._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, self.id_block_size],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    async def allocate_id(self):
+        """Return a primary key for a new message, reserving a new block when needed."""
+        with self._ids_lock:
+            if self._ids:
+                return self._ids.popleft()
+
+        ids = await database_sync_to_async(self._reserve_ids)()
+        with self._ids_lock:
+            self._ids.extend(ids)
+            return self._ids.popleft()
+
+    async def save(self, chat, text, sender, engine_ids, reply_to_id=None, is_truncated=False):
+        """
+        Return the message with its final ID; it is written to the database shortly after.
+        """
+        if not self.enabled:
+            return await save_message(chat, text, sender, engine_ids, reply_to_id=reply_to_id, is_truncated=is_truncated)
+
+        message = Message(
+            id=await self.allocate_id(),
+            chat=chat,
+            text=text,
+            sender=sender,
+            timestamp=timezone.now(),
+            reply_to_id=reply_to_id,
+            is_truncated=is_truncated,
+        )
+        # Outlives the wait of `wait_until_written`, in case the writer dies before clearing it.
+        await cache.aset(get_pending_key(message.id), True, self.write_wait * 10)
+        self._ensure_running()
+        self._queue.put_nowait((message, list(engine_ids or [])))
+        metrics.incr("message_writer.queued")
+        return message
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        elif self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._write_with_retries(batch)
+            except asyncio.CancelledError:
+                self._spill(batch)
+                raise
+            finally:
+                # Written or spilled: either way nobody should wait for these any more.
+                await self._clear_pending(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _clear_pending(self, batch):
+        try:
+            await cache.adelete_many([get_pending_key(message.id) for message, _ in batch])
+        except Exception as e:
+            logger.warning(f"Clearing the pending markers of {len(batch)} messages failed: {e}")
+
+    async def _write_with_retries(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await database_sync_to_async(self._write)(batch)
+                metrics.incr("message_writer.written", len(batch))
+                metrics.observe("message_writer.batch_size", len(batch))
+                return
+            except Exception as e:
+                logger.warning(f"Writing {len(batch)} messages failed (attempt {attempt}): {e}")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self.retry_delay * attempt)
+
+        metrics.incr("message_writer.failed", len(batch))
+        self._spill(batch)
+
+    def _write(self, batch, ignore_conflicts=False):
+        requested = {engine_id for _, engine_ids in batch for engine_id in engine_ids}
+        existing = {
+            str(engine_id) for engine_id in Engine.objects.filter(id__in=requested).values_list("id", flat=True)
+        } if requested else set()
+        Through = Message.engines.through
+
+        with transaction.atomic():
+            Message.objects.bulk_create([message for message, _ in batch], ignore_conflicts=ignore_conflicts)
+            Through.objects.bulk_create([
+                Through(message_id=message.id, engine_id=int(engine_id))
+                for message, engine_ids in batch
+                for engine_id in dict.fromkeys(map(str, engine_ids))
+                if engine_id in existing
+            ], ignore_conflicts=ignore_conflicts)
+
+    def _spill(self, batch):
+        """Store a batch that could not be written in the spool directory, fsynced, for `replay_spool`."""
+        ids = [message.id for message, _ in batch]
+        if not self.spool_dir:
+            logger.error(f"Dropped messages {ids}: no MESSAGE_SPOOL_DIR to spill them to")
+            return
+
+        records = [{
+            "id": message.id,
+            "chat_id": message.chat_id,
+            "text": message.text,
+            "sender": message.sender,
+            "timestamp": message.timestamp.isoformat(),
+            "reply_to_id": message.reply_to_id,
+            "is_truncated": message.is_truncated,
+            "engine_ids": [str(engine_id) for engine_id in engine_ids],
+        } for message, engine_ids in batch]
+        name = f"{time.time_ns()}-{uuid.uuid4().hex}.json"
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            temporary = os.path.join(self.spool_dir, f".{name}.tmp")
+            with open(temporary, "w") as f:
+                json.dump(records, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, os.path.join(self.spool_dir, name))
+        except OSError as e:
+            metrics.incr("message_writer.dropped", len(batch))
+            logger.error(f"Dropped messages {ids}: spilling them failed: {e}")
+            return
+        metrics.incr("message_writer.spilled", len(batch))
+        logger.error(f"Spilled messages {ids} to {name} after {self.max_retries} attempts")
+
+    def _restore(self, records):
+        """Rebuild a spilled batch, leaving out messages of deleted chats and dangling replies."""
+        chats = set(Chat.objects.filter(id__in={record["chat_id"] for record in records}).values_list("id", flat=True))
+        records = [record for record in records if record["chat_id"] in chats]
+        replied = {record["reply_to_id"] for record in records if record["reply_to_id"]}
+        replied = set(Message.objects.filter(id__in=replied).values_list("id", flat=True)) | {
+            record["id"] for record in records
+        }
+        return [(Message(
+            id=record["id"],
+            chat_id=record["chat_id"],
+            text=record["text"],
+            sender=record["sender"],
+            timestamp=datetime.fromisoformat(record["timestamp"]),
+            reply_to_id=record["reply_to_id"] if record["reply_to_id"] in replied else None,
+            is_truncated=record["is_truncated"],
+        ), record["engine_ids"]) for record in records]
+
+    def replay_spool(self):
+        """
+        Write the spilled batches, oldest first, and delete their files. Batches are
+        locked while they are written, so several processes can replay the same
+        directory; a batch written twice is ignored the second time.
+        Returns the number of messages replayed.
+        """
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return 0
+
+        written = 0
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            try:
+                f = open(path)
+            except FileNotFoundError:
+                continue  # Replayed by another process
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                if not os.path.exists(path):
+                    continue
+                batch = self._restore(json.load(f))
+                if batch:
+                    self._write(batch, ignore_conflicts=True)
+                os.remove(path)
+            written += len(batch)
+            metrics.incr("message_writer.replayed", len(batch))
+        return written
+
+    def wait_until_written(self, message_id):
+        """
+        Wait up to `write_wait` seconds for a message that is still queued in the
+        writer of another worker, e.g. when the client bookmarks an answer right
+        after receiving its ID. Returns as soon as it is written, and right away
+        for IDs that were never handed out or are already written.
+        """
+        if not self.enabled:
+            return
+        try:
+            message_id = int(message_id)
+        except (TypeError, ValueError):
+            return
+        deadline = time.monotonic() + self.write_wait
+        while cache.get(get_pending_key(message_id)) and time.monotonic() < deadline:
+            time.sleep(self.flush_interval)
+
+    async def await_written(self, message_id):
+        """`wait_until_written` for async callers, flushing this process's queue first."""
+        await self.flush()
+        if not self.enabled:
+            return
+        try:
+            message_id = int(message_id)
+        except (TypeError, ValueError):
+            return
+        deadline = time.monotonic() + self.write_wait
+        while await cache.aget(get_pending_key(message_id)) and time.monotonic() < deadline:
+            await asyncio.sleep(self.flush_interval)
+
+    async def flush(self):
+        """Wait until every queued message is written."""
+        if self._queue is not None and self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def close(self):
+        """
+        Drain the queue and stop the writer task. Meant to be called on shutdown;
+        messages still queued when the task is stopped are spilled.
+        """
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        remaining = []
+        while self._queue is not None and not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        if remaining:
+            self._spill(remaining)
+
+
+message_writer = MessageWriter(
+    batch_size=settings.MESSAGE_WRITE_BATCH_SIZE,
+    flush_interval=settings.MESSAGE_WRITE_INTERVAL,
+    id_block_size=settings.MESSAGE_ID_BLOCK_SIZE,
+    spool_dir=settings.MESSAGE_SPOOL_DIR,
+    write_wait=settings.MESSAGE_WRITE_WAIT,
+)
@@ -0,0 +1,131 @@
+"""
+Speculative prefetching for draft messages.
+
+While the user types, the client may send the partial message as a "draft".
+DRAFT_DEBOUNCE seconds after the last draft, its keywords are extracted and
+searched on the selected engines, which warms the keyword, adapter and corpus
+caches. When the message is sent and is close enough to the draft, its
+engines reuse the draft's keywords (and so the cached results) instead of
+extracting and searching again, unless a keyword ends in a word the user was
+still typing. Draft keywords are not added to the typeahead index or the
+corpus's searched keywords.
+
+Prefetches are limited per user ("draft:user:<id>") and their upstream
+requests are charged to the "draft:" budgets as well as the upstream's, so
+speculation is capped on its own and still counted against the provider.
+"""
+import asyncio
+import logging
+from django.conf import settings
+from . import metrics
+from .extraction import KeywordExtractor, normalize_message
+from .ratelimit import rate_limiter, speculative
+from .response_cache import get_shingles, similarity
+from .utils import fetch_engines, fetch_external_data, get_engine_deadline
+
+logger = logging.getLogger(__name__)
+
+
+async def prefetch_arguments(message, engines_list):
+    """
+    Extract and search the keywords of `message` on its external engines.
+    Returns the extracted tool arguments per service.
+    """
+    engines = await fetch_engines(engines_list)
+    external_engines = [engine for engine in engines if engine.external_service]
+    if not external_engines:
+        return {}
+
+    extractor = KeywordExtractor(message, [engine.external_service for engine in external_engines])
+
+    async def warm(engine):
+        progress = {}
+        try:
+            await asyncio.wait_for(
+                fetch_external_data(engine, extractor, progress),
+                timeout=get_engine_deadline(engine.external_service)
+            )
+        except Exception as e:
+            logger.info(f"Prefetching for engine {engine.id} stopped: {e!r}")
+        return engine.external_service, progress.get("external_data")
+
+    try:
+        await extractor.start()
+        results = await asyncio.gather(*(warm(engine) for engine in external_engines))
+    finally:
+        extractor.close()
+    return {service: arguments for service, arguments in results if arguments is not None}
+
+
+def is_truncated(keyword, words):
+    """
+    Whether a draft's keyword has a word that only begins one of the sent message's
+    `words`, e.g. "cranioplasty mes" extracted before "mesh" was typed.
+    """
+    return any(
+        term not in words and any(word.startswith(term) for word in words)
+        for term in normalize_message(keyword or "").split()
+    )
+
+
+class DraftPrefetch:
+    """The pending or running prefetch of a connection's latest draft."""
+    def __init__(self, user_id, message, engines_list):
+        self.user_id = user_id
+        self.message = message
+        self.engines_list = list(engines_list)
+        self.started = False
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    async def _run(self):
+        await asyncio.sleep(settings.DRAFT_DEBOUNCE)
+        if not await rate_limiter.acquire([f"draft:user:{self.user_id}"], wait=0):
+            metrics.incr("draft.rate_limited")
+            return None
+
+        self.started = True
+        metrics.incr("draft.prefetched")
+        speculative.set(True)  # Only affects this task
+        try:
+            return await prefetch_arguments(self.message, self.engines_list)
+        except Exception as e:
+            logger.warning(f"Prefetching draft of user {self.user_id} failed: {e}")
+            return None
+
+    def matches(self, message, engines_list):
+        if sorted(self.engines_list) != sorted(engines_list or []):
+            return False
+        draft = get_shingles(normalize_message(self.message))
+        return similarity(draft, get_shingles(normalize_message(message))) >= settings.DRAFT_MATCH_SIMILARITY
+
+    async def take(self, message, engines_list):
+        """
+        The draft's tool arguments per service if `message` matches it (waiting
+        for a running prefetch), else None; an unused prefetch is cancelled.
+        """
+        if not self.started or not self.matches(message, engines_list):
+            self.cancel()
+            metrics.incr("draft.discarded")
+            return None
+
+        await asyncio.wait({self.task})
+        if self.task.cancelled() or self.task.exception() is not None or not self.task.result():
+            return None
+
+        words = set(normalize_message(message).split())
+        reusable = {
+            service: arguments for service, arguments in self.task.result().items()
+            if not is_truncated(arguments.get("keyword"), words)
+        }
+        if not reusable:
+            metrics.incr("draft.discarded")
+            return None
+        metrics.incr("draft.reused")
+        return reusable
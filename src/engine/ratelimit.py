@@ -0,0 +1,246 @@
+"""
+Cluster-wide rate limiting of outbound SerpApi and OpenAI requests.
+
+Every upstream budget is a token bucket (`rate` requests per second, bursts of
+up to `burst`), shared by all workers through Redis when RATE_LIMIT_REDIS_URL
+is set. A request takes a token from each of its buckets at once (e.g. the
+"openai" provider budget and the budget of the model). Callers wait up to a
+given time for the tokens and otherwise degrade (skip the engine, tell the
+user to retry) instead of sending a request the provider would reject.
+
+Without Redis (or while it is unreachable), each worker enforces its share of
+the budgets (1 / RATE_LIMIT_WORKERS) with in-process buckets.
+
+A budget named "<prefix>:*" applies separately to every name starting with
+the prefix (e.g. "draft:user:*" gives each user their own bucket). Requests
+made while `speculative` is set (draft prefetches) are also charged to the
+"draft:<name>" budgets, and never wait: speculation is capped by its own
+budgets and still counts against the upstream's.
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Set while prefetching for a draft message.
+speculative = ContextVar("speculative", default=False)
+
+# KEYS: one bucket per budget, followed by their usage counters of the current minute.
+# ARGV: cost, then the rate and burst of every budget.
+# Takes `cost` tokens from every bucket, or none of them; returns "0" when granted,
+# else the seconds to wait until every bucket has enough tokens.
+ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local count = #KEYS / 2
+local cost = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i = 1, count do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or burst
+    local updated_at = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(now - updated_at, 0) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i = 1, count do
+    local rate = tonumber(ARGV[2 * i])
+    local burst = tonumber(ARGV[2 * i + 1])
+    redis.call('HSET', KEYS[i], 'tokens', levels[i] - cost, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[i], math.ceil(burst / rate) + 1)
+    redis.call('INCRBY', KEYS[count + i], cost)
+    redis.call('EXPIRE', KEYS[count + i], 180)
+end
+return '0'
+"""
+
+
+class RateLimitedError(Exception):
+    """No token became available in time; the request was not sent."""
+
+
+class LocalTokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def wait_time(self, cost):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return max(cost - self.tokens, 0) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, budgets, redis_url=None, workers=1, redis_retry=30):
+        self.budgets = budgets
+        self.redis_url = redis_url
+        self.workers = max(workers, 1)
+        self.redis_retry = redis_retry
+        self._redis = None
+        self._redis_loop = None
+        self._sync_redis = None
+        self._script = None
+        self._redis_failed_at = None
+        self._local = {}
+        self._local_usage = {}
+
+    @staticmethod
+    def key(name):
+        return f"ratelimit:{name}"
+
+    @staticmethod
+    def usage_key(name, minute):
+        return f"ratelimit:{name}:used:{minute}"
+
+    def get_budget(self, name):
+        """`(rate, burst)` of the name, from its own budget or a matching "<prefix>:*" one."""
+        budget = self.budgets.get(name)
+        if budget is None:
+            prefix = name.rpartition(":")[0]
+            budget = self.budgets.get(f"{prefix}:*") if prefix else None
+        return budget
+
+    def get_budgets(self, names):
+        """The configured budgets among `names`; a name without a budget is not limited."""
+        return [name for name in names if self.get_budget(name)]
+
+    def _get_redis(self):
+        if not self.redis_url:
+            return None
+        if self._redis_failed_at is not None and time.monotonic() - self._redis_failed_at < self.redis_retry:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._redis is None or self._redis_loop is not loop:
+            # Connections belong to the event loop they were opened on.
+            self._redis = aioredis.Redis.from_url(self.redis_url)
+            self._redis_loop = loop
+            self._script = self._redis.register_script(ACQUIRE_SCRIPT)
+        return self._redis
+
+    async def _try_acquire_redis(self, names, cost):
+        minute = int(time.time() // 60)
+        keys = [self.key(name) for name in names] + [self.usage_key(name, minute) for name in names]
+        args = [cost]
+        for name in names:
+            args.extend(self.get_budget(name))
+        return float(await self._script(keys=keys, args=args))
+
+    def _try_acquire_local(self, names, cost):
+        buckets = []
+        for name in names:
+            rate, burst = self.get_budget(name)
+            bucket = self._local.get(name)
+            if bucket is None:
+                bucket = self._local[name] = LocalTokenBucket(rate / self.workers, max(burst / self.workers, 1))
+            buckets.append(bucket)
+
+        wait = max(bucket.wait_time(cost) for bucket in buckets)
+        if wait == 0:
+            minute = int(time.time() // 60)
+            for bucket, name in zip(buckets, names):
+                bucket.tokens -= cost
+                usage = self._local_usage.setdefault(name, {})
+                usage[minute] = usage.get(minute, 0) + cost
+                for old_minute in [key for key in usage if key < minute - 1]:
+                    del usage[old_minute]
+        return wait
+
+    async def _try_acquire(self, names, cost):
+        """Take the tokens now, or return the seconds to wait before they may be available."""
+        if self._get_redis() is not None:
+            try:
+                return await self._try_acquire_redis(names, cost)
+            except (redis.RedisError, OSError) as e:
+                logger.error(f"Rate limiter falling back to local buckets: {e}")
+                self._redis_failed_at = time.monotonic()
+        return self._try_acquire_local(names, cost)
+
+    async def acquire(self, names, wait=None, cost=1):
+        """
+        Take `cost` tokens from the budgets of `names`, waiting at most `wait`
+        seconds (RATE_LIMIT_MAX_WAIT by default). Returns False if they could not be taken.
+        """
+        if speculative.get():
+            names, wait = [*names, *(f"draft:{name}" for name in names)], 0
+        names = self.get_budgets(names)
+        if not names:
+            return True
+        wait = settings.RATE_LIMIT_MAX_WAIT if wait is None else wait
+        deadline = time.monotonic() + wait
+        waited = False
+        while True:
+            delay = await self._try_acquire(names, cost)
+            if delay <= 0:
+                for name in names:
+                    metrics.incr(f"ratelimit.{name}.granted")
+                    if waited:
+                        metrics.incr(f"ratelimit.{name}.waited")
+                return True
+            if time.monotonic() + delay > deadline:
+                for name in names:
+                    metrics.incr(f"ratelimit.{name}.denied")
+                return False
+            waited = True
+            await asyncio.sleep(delay)
+
+    async def limit(self, names, wait=None):
+        """Like `acquire`, but raises `RateLimitedError` when no token is available in time."""
+        if not await self.acquire(names, wait):
+            raise RateLimitedError(f"Rate limit of {', '.join(names)} reached")
+
+    def usage(self):
+        """Requests granted per budget in the previous and the current minute, across the cluster when possible."""
+        minute = int(time.time() // 60)
+        usage = {}
+        for name, budget in self.budgets.items():
+            if not budget or name.endswith(":*"):
+                continue
+            usage[name] = {"rate": budget[0], "burst": budget[1], "backend": "local"}
+            counts = self._local_usage.get(name, {})
+            usage[name].update(previous_minute=counts.get(minute - 1, 0), current_minute=counts.get(minute, 0))
+
+        if self.redis_url and usage:
+            try:
+                if self._sync_redis is None:
+                    self._sync_redis = redis.Redis.from_url(self.redis_url)
+                names = list(usage)
+                counts = self._sync_redis.mget(
+                    [self.usage_key(name, minute - 1) for name in names] + [self.usage_key(name, minute) for name in names]
+                )
+                for index, name in enumerate(names):
+                    usage[name].update(
+                        backend="redis",
+                        previous_minute=int(counts[index] or 0),
+                        current_minute=int(counts[len(names) + index] or 0),
+                    )
+            except (redis.RedisError, OSError) as e:
+                logger.error(f"Reading rate limiter usage failed: {e}")
+        return usage
+
+
+def get_openai_budgets(model):
+    return ["openai", f"openai:{model}"]
+
+
+rate_limiter = RateLimiter(
+    {**settings.DRAFT_RATE_LIMITS, **settings.TYPEAHEAD_RATE_LIMITS, **settings.RATE_LIMITS},
+    redis_url=settings.RATE_LIMIT_REDIS_URL,
+    workers=settings.RATE_LIMIT_WORKERS,
+)
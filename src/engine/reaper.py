@@ -0,0 +1,99 @@
+"""
+Process-wide reaper of idle websocket connections.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class IdleReaper:
+    """
+    Closes connections that have been idle for `timeout` seconds.
+
+    Connections are kept in a dict ordered by last activity (a touch moves a
+    connection to the end), so a periodic sweep only looks at the connections it
+    closes plus one. A single task per process replaces a sleeping timeout task
+    per connection.
+    """
+    def __init__(self, timeout=300, interval=30):
+        self.timeout = timeout
+        self.interval = interval
+        self.reaped_total = 0
+        self._last_activity = {}
+        self._reaped = deque()
+        self._task = None
+
+    def register(self, consumer):
+        self._last_activity[consumer] = time.monotonic()
+        self._ensure_running()
+
+    def touch(self, consumer):
+        """Record activity on a registered connection."""
+        if self._last_activity.pop(consumer, None) is not None:
+            self._last_activity[consumer] = time.monotonic()
+
+    def unregister(self, consumer):
+        self._last_activity.pop(consumer, None)
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Reaping idle connections failed: {e}")
+
+    async def sweep(self):
+        """Close every connection idle for longer than the timeout."""
+        deadline = time.monotonic() - self.timeout
+        idle = []
+        for consumer, last_activity in self._last_activity.items():
+            if last_activity > deadline:
+                break
+            idle.append(consumer)
+        if not idle:
+            return 0
+
+        for consumer in idle:
+            del self._last_activity[consumer]
+        await asyncio.gather(
+            *(consumer.close(code=4001, reason="closed due to inactivity.") for consumer in idle),
+            return_exceptions=True,
+        )
+
+        self.reaped_total += len(idle)
+        self._reaped.append((time.monotonic(), len(idle)))
+        metrics.incr("connections.reaped", len(idle))
+        return len(idle)
+
+    def stats(self):
+        minute_ago = time.monotonic() - 60
+        while self._reaped and self._reaped[0][0] < minute_ago:
+            self._reaped.popleft()
+        return {
+            "open": len(self._last_activity),
+            "reaped_last_minute": sum(count for _, count in self._reaped),
+            "reaped_total": self.reaped_total,
+        }
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+idle_reaper = IdleReaper(timeout=settings.CHAT_IDLE_TIMEOUT, interval=settings.CHAT_IDLE_SWEEP_INTERVAL)
@@ -0,0 +1,258 @@
+"""
+Circuit breakers (and optional request hedging) for the upstream services.
+
+Every upstream (each SerpApi engine, OpenAI) gets a `CircuitBreaker` per
+process. It keeps the latency and outcome of the calls of the last
+BREAKER_WINDOW seconds and opens after BREAKER_FAILURE_THRESHOLD consecutive
+failures, or when the error rate crosses BREAKER_ERROR_RATE. While open, calls
+fail fast with `CircuitOpenError` so the caller can skip the upstream; after
+BREAKER_RESET_TIMEOUT seconds a single trial call decides whether it closes.
+
+Hedged upstreams send a second request when the first is slower than the
+recent p95 latency, and use whichever answers first.
+
+Breakers wrap the actual upstream requests (see `AsyncHTTPAdapter.perform_search`),
+below the adapter cache: cache hits are not calls to the upstream, and a hedge
+is a second real request rather than a wait on the first one's cache entry.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import deque
+from contextvars import ContextVar
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from . import metrics
+from .ratelimit import RateLimitedError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+# Latency samples needed before the p95 is trusted for hedging.
+MIN_HEDGE_SAMPLES = 20
+
+# Monotonic time by which the current engine's search must be done, set by
+# `fetch_external_data`. Upstream calls are timed out DEADLINE_MARGIN seconds
+# before it, so a slow upstream is recorded as a failure instead of being
+# cancelled by the deadline first.
+deadline = ContextVar("deadline", default=None)
+DEADLINE_MARGIN = 0.1
+
+
+class CircuitOpenError(Exception):
+    """The upstream's circuit is open; the call was not made."""
+
+
+def time_left():
+    """Timeout for an upstream call under the current deadline, or None without one."""
+    current = deadline.get()
+    if current is None:
+        return None
+    left = current - time.monotonic() - DEADLINE_MARGIN
+    if left <= 0:
+        # The deadline was used up before the upstream was asked; not its failure.
+        raise asyncio.TimeoutError
+    return left
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, error_rate=0.5, min_calls=20, window=60,
+                 reset_timeout=30, hedge=False, hedge_min_delay=0.2, hedge_ratio=0.1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_ratio = hedge_ratio
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._calls = deque()  # (time, latency, ok)
+        self._trial = False
+        self._hedged_at = deque()
+
+    def _prune(self, now):
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+        while self._hedged_at and self._hedged_at[0] < now - self.window:
+            self._hedged_at.popleft()
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit of {self.name} is now {state} (was {self.state})")
+        self.state = state
+        self.opened_at = time.monotonic() if state == OPEN else self.opened_at
+        metrics.incr(f"breaker.{self.name}.{state}")
+        report_state(self)
+
+    def allow(self):
+        """Whether a call may be made now; in half-open state only one trial call is let through."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+            self._trial = False
+        if self.state == HALF_OPEN:
+            if self._trial:
+                return False
+            self._trial = True
+            return True
+        return self.state == CLOSED
+
+    def record(self, latency, ok):
+        now = time.monotonic()
+        self._calls.append((now, latency, ok))
+        self._prune(now)
+        self._trial = False
+        if ok:
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self._set_state(CLOSED)
+            return
+
+        self.consecutive_failures += 1
+        failures = sum(not call_ok for _, _, call_ok in self._calls)
+        if (
+            self.state == HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+            or (len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.error_rate)
+        ):
+            self._set_state(OPEN)
+
+    def stats(self):
+        self._prune(time.monotonic())
+        latencies = [latency for _, latency, _ in self._calls]
+        return {
+            "state": self.state,
+            "calls": len(self._calls),
+            "error_rate": round(sum(not ok for _, _, ok in self._calls) / len(self._calls), 3) if self._calls else 0.0,
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+            "consecutive_failures": self.consecutive_failures,
+            "hedges": len(self._hedged_at),
+        }
+
+    def _hedge_delay(self):
+        """Seconds to wait before hedging, or None if this call should not be hedged."""
+        if not self.hedge or len(self._calls) < MIN_HEDGE_SAMPLES:
+            return None
+        if len(self._hedged_at) >= self.hedge_ratio * len(self._calls):
+            return None  # Hedges are capped to a share of the calls so a slow upstream is not doubled
+        successful = [latency for _, latency, ok in self._calls if ok]
+        if len(successful) < MIN_HEDGE_SAMPLES:
+            return None
+        return max(percentile(successful, 0.95), self.hedge_min_delay)
+
+    async def _attempt(self, factory, timeout):
+        started_at = time.monotonic()
+        try:
+            result = await asyncio.wait_for(factory(), timeout=timeout)
+        except (asyncio.CancelledError, RateLimitedError):
+            # Not the upstream's fault; an abandoned trial call must not keep the circuit half-open.
+            self._trial = False
+            raise
+        except Exception:
+            self.record(time.monotonic() - started_at, ok=False)
+            raise
+        self.record(time.monotonic() - started_at, ok=True)
+        return result
+
+    async def call(self, factory, timeout=None):
+        """
+        Await `factory()` (a coroutine function) through the breaker. Raises
+        `CircuitOpenError` without calling the upstream while the circuit is open.
+        """
+        if not self.allow():
+            metrics.incr(f"breaker.{self.name}.rejected")
+            raise CircuitOpenError(f"{self.name} is unavailable")
+
+        delay = self._hedge_delay() if self.state == CLOSED else None
+        first = asyncio.ensure_future(self._attempt(factory, timeout))
+        attempts = {first}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    self._hedged_at.append(time.monotonic())
+                    metrics.incr(f"breaker.{self.name}.hedged")
+                    attempts.add(asyncio.ensure_future(self._attempt(factory, timeout)))
+
+            while True:
+                done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+                if not attempts:
+                    return first.result()  # Every attempt failed: raise the first one's error
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+
+_breakers = {}
+
+
+def get_breaker(name):
+    """Return this process's breaker for the upstream `name`."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+            error_rate=settings.BREAKER_ERROR_RATE,
+            min_calls=settings.BREAKER_MIN_CALLS,
+            window=settings.BREAKER_WINDOW,
+            reset_timeout=settings.BREAKER_RESET_TIMEOUT,
+            hedge=name in settings.BREAKER_HEDGED_UPSTREAMS,
+            hedge_min_delay=settings.BREAKER_HEDGE_MIN_DELAY,
+            hedge_ratio=settings.BREAKER_HEDGE_RATIO,
+        )
+    return breaker
+
+
+def get_breaker_stats():
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+
+@database_sync_to_async
+def save_state(name, stats):
+    from .models import CircuitBreakerState
+
+    CircuitBreakerState.objects.update_or_create(
+        name=name, worker=WORKER,
+        defaults={
+            "state": stats["state"],
+            "error_rate": stats["error_rate"],
+            "p95_ms": stats["p95_ms"],
+            "consecutive_failures": stats["consecutive_failures"],
+            "changed_at": timezone.now(),
+        },
+    )
+
+
+def report_state(breaker):
+    """Record a state change in the database (in the background) for the admin."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(save_state(breaker.name, breaker.stats()))
+
+    def log_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Saving the circuit state of {breaker.name} failed: {task.exception()}")
+    task.add_done_callback(log_failure)
@@ -0,0 +1,138 @@
+"""
+Cache of answers to first-turn chat messages.
+
+A new chat's first message (no history, no reply-to) only depends on the engine
+set and the message, so its answer can be shared. Answers are stored per
+category and engine set under the normalized message; a message that is not an
+exact match can still hit a near-duplicate: every message is reduced to its
+character shingles and compared (Jaccard similarity) with the recently cached
+messages of the same scope.
+
+Categories opt in by setting `EngineCategory.response_cache_ttl`; purging a
+category bumps its version, which orphans every entry stored under it.
+"""
+import hashlib
+import json
+import re
+import zlib
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from . import metrics
+from .extraction import normalize_message
+from .models import Engine, EngineCategory
+
+SHINGLE_SIZE = 5
+
+
+def get_shingles(normalized):
+    """Hashed character shingles of an already normalized message."""
+    if len(normalized) <= SHINGLE_SIZE:
+        return frozenset([zlib.crc32(normalized.encode())])
+    return frozenset(
+        zlib.crc32(normalized[index:index + SHINGLE_SIZE].encode())
+        for index in range(len(normalized) - SHINGLE_SIZE + 1)
+    )
+
+
+def similarity(shingles, other):
+    return len(shingles & other) / len(shingles | other)
+
+
+def is_first_turn(slug, reply_to_id):
+    """Only a new chat's first message, not replying to anything, can use the cache."""
+    return not slug and not reply_to_id
+
+
+async def replay_deltas(answer):
+    """Yield a cached answer word by word, like a streamed completion."""
+    for match in re.finditer(r"\s*\S+", answer):
+        yield match.group(0)
+
+
+@database_sync_to_async
+def get_response_cache_scope(engines_list):
+    """
+    Return `(category_id, ttl)` for a message sent to `engines_list`, or None when
+    its category does not cache answers (or the engines span several categories).
+    """
+    if engines_list:
+        scopes = set(
+            Engine.objects.filter(id__in=engines_list).values_list("category_id", "category__response_cache_ttl")
+        )
+        scope = scopes.pop() if len(scopes) == 1 else None
+    else:
+        scope = EngineCategory.objects.filter(is_default=True).values_list("id", "response_cache_ttl").first()
+
+    if scope is None or not scope[1]:
+        return None
+    return scope
+
+
+class ResponseCache:
+    def __init__(self, similarity_threshold=0.8, index_size=200):
+        self.similarity_threshold = similarity_threshold
+        self.index_size = index_size
+
+    @staticmethod
+    def _version_key(category_id):
+        return f"response_cache_version:{category_id}"
+
+    @staticmethod
+    def _digest(*parts):
+        return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+    async def _scope_key(self, category_id, engine_ids):
+        version = await cache.aget(self._version_key(category_id), 0)
+        engines = sorted(str(engine_id) for engine_id in engine_ids or [])
+        return self._digest(category_id, version, engines)
+
+    async def get(self, category_id, engine_ids, message):
+        """Return the cached answer for the message (or a near-duplicate of it), or None."""
+        scope = await self._scope_key(category_id, engine_ids)
+        normalized = normalize_message(message)
+
+        answer = await cache.aget(f"response:{self._digest(scope, normalized)}")
+        if answer is not None:
+            metrics.incr("response_cache.hit_exact")
+            return answer
+
+        shingles = get_shingles(normalized)
+        best, best_score = None, self.similarity_threshold
+        for cached_normalized, cached_shingles in await cache.aget(f"response_index:{scope}", []):
+            score = similarity(shingles, frozenset(cached_shingles))
+            if score >= best_score:
+                best, best_score = cached_normalized, score
+
+        if best is not None:
+            answer = await cache.aget(f"response:{self._digest(scope, best)}")
+            if answer is not None:
+                metrics.incr("response_cache.hit_near")
+                return answer
+
+        metrics.incr("response_cache.miss")
+        return None
+
+    async def set(self, category_id, ttl, engine_ids, message, answer):
+        scope = await self._scope_key(category_id, engine_ids)
+        normalized = normalize_message(message)
+        await cache.aset(f"response:{self._digest(scope, normalized)}", answer, ttl)
+
+        # Most recent messages last; the oldest fall out once the index is full.
+        index_key = f"response_index:{scope}"
+        index = [entry for entry in await cache.aget(index_key, []) if entry[0] != normalized]
+        index.append((normalized, tuple(get_shingles(normalized))))
+        await cache.aset(index_key, index[-self.index_size:], ttl)
+
+    def purge(self, category_id):
+        """Invalidate every cached answer of the category."""
+        try:
+            cache.incr(self._version_key(category_id))
+        except ValueError:
+            cache.set(self._version_key(category_id), 1, None)
+
+
+response_cache = ResponseCache(
+    similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY,
+    index_size=settings.RESPONSE_CACHE_INDEX_SIZE,
+)
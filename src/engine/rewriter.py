@@ -0,0 +1,101 @@
+import re
+from functools import lru_cache
+from django.conf import settings
+
+
+class RewriteRules:
+    """
+    Case-insensitive term -> replacement rules compiled into a single pattern.
+    Longer terms are tried first so overlapping terms ("open ai"/"openai") resolve
+    to the most specific one.
+    """
+    def __init__(self, rules):
+        self.replacements = {term.lower(): replacement for term, replacement in rules.items()}
+        self.terms = terms = sorted(self.replacements, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+        self.max_length = max(map(len, terms), default=0)
+        # Every proper prefix of a term, anchored at the end: text ending in one of these
+        # may still become a match once the next chunk arrives.
+        prefixes = sorted({term[:i] for term in terms for i in range(1, len(term))}, key=len, reverse=True)
+        self.prefixes = tuple(prefixes)
+        self.prefix_ends = {prefix[-1] for prefix in prefixes}
+        self.partial = re.compile(
+            "(?:" + "|".join(re.escape(prefix) for prefix in prefixes) + r")\Z", re.IGNORECASE
+        ) if prefixes else None
+
+    def replace(self, match):
+        return self.replacements[match.group(0).lower()]
+
+    def in_lowercase(self, text):
+        """Whether the lowercased `text` contains a term; a plain substring test, cheaper than `pattern`."""
+        for term in self.terms:
+            if term in text:
+                return True
+        return False
+
+
+class StreamRewriter:
+    """
+    Applies RewriteRules to a stream of text chunks in a single pass per chunk.
+
+    Text that could be the start of a term split across chunks ("Chat" + "GPT")
+    is held back until the next chunk (or `flush`) decides it. Most chunks
+    contain no term and end in no partial term; both are ruled out with string
+    methods before any regex runs.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.pending = ""
+
+    def _hold_start(self, text, start):
+        """Index from which the end of `text` is a partial term, or len(text)."""
+        if self.rules.partial is not None:
+            match = self.rules.partial.search(text, max(start, len(text) - self.rules.max_length + 1))
+            if match:
+                return match.start()
+        return len(text)
+
+    def feed(self, chunk):
+        """Rewrite `chunk` and return the text that is safe to emit."""
+        text = self.pending + chunk
+        lower = text.lower()
+        ends_partially = lower[-1:] in self.rules.prefix_ends and lower.endswith(self.rules.prefixes)
+        if len(lower) == len(text) and not ends_partially:
+            # Most chunks: nothing to hold back, and usually no term either; both are
+            # checked without a regex. (Lowercasing that changes the length, e.g. "İ",
+            # takes the exact path below.)
+            self.pending = ""
+            if self.rules.in_lowercase(lower):
+                return self.rules.pattern.sub(self.rules.replace, text)
+            return text
+
+        hold = self._hold_start(text, 0)
+        if self.rules.pattern.search(text, 0, hold) is None:
+            # Nothing to rewrite in the emitted part of the text.
+            self.pending = text[hold:]
+            return text[:hold]
+
+        output = []
+        position = 0
+        for match in self.rules.pattern.finditer(text):
+            if match.start() >= hold:
+                break
+            output.append(text[position:match.start()])
+            output.append(self.rules.replace(match))
+            position = match.end()
+
+        if position > hold:
+            hold = self._hold_start(text, position)
+        output.append(text[position:hold])
+        self.pending = text[hold:]
+        return "".join(output)
+
+    def flush(self):
+        """Return whatever is still held back once the stream has ended."""
+        text, self.pending = self.pending, ""
+        return self.rules.pattern.sub(self.rules.replace, text)
+
+
+@lru_cache(maxsize=1)
+def get_brand_rules():
+    return RewriteRules(settings.BRAND_REWRITE_RULES)
@@ -50,8 +50,9 @@ class MessageSerializer(serializers.ModelSerializer):
             'id', 'username',
             'is_bookmarked', 'projects_in',
             'text', 'sender', 'timestamp',
-            'chat', 'engines', 'reply_to'
+            'chat', 'engines', 'reply_to', 'is_truncated'
         ]
+        read_only_fields = ['is_truncated']
 
     def get_is_bookmarked(self, obj):
         """
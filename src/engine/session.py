@@ -0,0 +1,68 @@
+import time
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+ACTIVE_SUBSCRIPTION_STATUSES = ("active", "trialing")
+
+
+class ChatSession:
+    """
+    Snapshot of what the chat needs to know about the connected user: their
+    subscription status, plan limits and allowed engine categories. Usage is
+    counted by the quota ledger.
+
+    Built once per connection and refreshed only when the access token nears
+    expiry or an invalidation event arrives, so messages skip the database.
+    """
+    def __init__(self, user, token_expires_at=None, customer_id=None, plan_id=None,
+                 has_active_subscription=False, messages_limit=0, allowed_category_ids=frozenset()):
+        self.user = user
+        self.token_expires_at = token_expires_at
+        self.customer_id = customer_id
+        self.plan_id = plan_id
+        self.has_active_subscription = has_active_subscription
+        self.messages_limit = messages_limit
+        self.allowed_category_ids = allowed_category_ids
+        self.stale = False
+
+    def token_expiring(self):
+        if self.token_expires_at is None:
+            return False
+        return self.token_expires_at - time.time() <= settings.CHAT_SESSION_REFRESH_MARGIN
+
+    def allows_categories(self, category_ids):
+        return set(category_ids) <= self.allowed_category_ids
+
+    @property
+    def groups(self):
+        """Channel-layer groups that deliver invalidation events for this session."""
+        groups = [f"chat_session_user_{self.user.pk}"]
+        if self.plan_id:
+            groups.append(f"chat_session_plan_{self.plan_id}")
+        return groups
+
+
+@database_sync_to_async
+def build_session(user, token_expires_at=None):
+    """
+    Build a ChatSession for the user with a single joined query over the customer,
+    subscription, plan and the plan's engine categories.
+    """
+    rows = get_user_model().objects.filter(pk=user.pk).values_list(
+        "customer__id",
+        "customer__subscription__status",
+        "customer__subscription__plan__id",
+        "customer__subscription__plan__messages_limit",
+        "customer__subscription__plan__engines_categories",
+    )
+
+    session = ChatSession(user, token_expires_at=token_expires_at)
+    for customer_id, status, plan_id, messages_limit, category_id in rows:
+        session.customer_id = customer_id
+        session.has_active_subscription = status in ACTIVE_SUBSCRIPTION_STATUSES
+        session.plan_id = plan_id
+        session.messages_limit = messages_limit or 0
+        if category_id is not None:
+            session.allowed_category_ids |= {category_id}
+    return session
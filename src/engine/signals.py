@@ -0,0 +1,17 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+def invalidate_chat_sessions(group):
+    """Ask every chat connection in `group` to rebuild its session snapshot."""
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        async_to_sync(channel_layer.group_send)(group, {"type": "session.invalidate"})
+
+
+def subscription_changed(sender, instance, **kwargs):
+    invalidate_chat_sessions(f"chat_session_user_{instance.customer.user_id}")
+
+
+def plan_changed(sender, instance, **kwargs):
+    invalidate_chat_sessions(f"chat_session_plan_{instance.pk}")
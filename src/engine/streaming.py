@@ -0,0 +1,125 @@
+"""
+Coalescing of streamed answer deltas into fewer websocket frames.
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def get_coalesce_options(scope):
+    """
+    Coalescing thresholds for a connection: the settings' defaults, optionally
+    overridden by `coalesce_ms` / `coalesce_bytes` in the websocket query string.
+    Client values are clamped so a connection cannot hold text back indefinitely.
+    """
+    max_delay = settings.STREAM_COALESCE_DELAY
+    max_bytes = settings.STREAM_COALESCE_BYTES
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    try:
+        if "coalesce_ms" in query:
+            max_delay = int(query["coalesce_ms"][0]) / 1000
+        if "coalesce_bytes" in query:
+            max_bytes = int(query["coalesce_bytes"][0])
+    except ValueError:
+        pass
+
+    max_delay = min(max(max_delay, 0), settings.STREAM_COALESCE_MAX_DELAY)
+    max_bytes = min(max(max_bytes, 0), settings.STREAM_COALESCE_MAX_BYTES)
+    return max_delay, max_bytes
+
+
+class FrameCoalescer:
+    """
+    Buffers the deltas of one streamed answer and sends them as a single
+    `{"content", "slug", "is_ended"}` frame once `max_bytes` are buffered or
+    `max_delay` seconds have passed since the first buffered delta.
+
+    The first delta is sent immediately so time-to-first-token is unaffected.
+    A threshold of 0 disables coalescing (one frame per delta).
+
+    For a resumable stream, frames also carry the `stream_id` and the `offset`
+    of the answer up to the end of the frame; a reconnecting client resumes
+    from the last offset it received.
+    """
+    def __init__(self, send, slug, max_delay, max_bytes, stream_id=None, offset=0):
+        self.send = send
+        self.slug = slug
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self.stream_id = stream_id
+        self.offset = offset
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.frames = 0
+        self.sent_bytes = 0
+        self._timer = None
+        self._timed_flush = None
+        self._lock = asyncio.Lock()
+
+    async def add(self, text):
+        if not text:
+            return
+        self.buffer.append(text)
+        self.buffered_bytes += len(text.encode())
+
+        if self.frames == 0 or self.buffered_bytes >= self.max_bytes or self.max_delay <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        self._timed_flush = asyncio.ensure_future(self.flush())
+        self._timed_flush.add_done_callback(self._timed_flush_done)
+
+    def _timed_flush_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.info(f"Sending a frame of chat {self.slug} failed: {task.exception()!r}")
+
+    async def flush(self):
+        """Send everything buffered so far as one frame."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            if not self.buffer:
+                return
+            content = "".join(self.buffer)
+            self.buffer.clear()
+            self.buffered_bytes = 0
+
+            self.offset += len(content)
+            frame = json.dumps(self._frame(content=content, is_ended=False))
+            self.frames += 1
+            self.sent_bytes += len(frame)
+            metrics.observe("stream.bytes_per_frame", len(frame))
+            await self.send(text_data=frame)
+
+    def _frame(self, **fields):
+        frame = {"content": "", "slug": self.slug, **fields}
+        if self.stream_id is not None:
+            frame.update(stream_id=self.stream_id, offset=self.offset)
+        return frame
+
+    async def close(self):
+        """Flush what is left and record the number of frames used for the message."""
+        if self._timed_flush is not None:
+            await asyncio.wait({self._timed_flush})  # Its failure is logged by _timed_flush_done
+        await self.flush()
+        if self.frames:
+            metrics.observe("stream.frames_per_message", self.frames)
+
+    async def end(self, message_id, truncated=False):
+        """Send the rest of the answer followed by the closing `is_ended` frame."""
+        await self.close()
+        frame = self._frame(message_id=message_id, is_ended=True)
+        if truncated:
+            frame["truncated"] = True
+        await self.send(text_data=json.dumps(frame))
@@ -0,0 +1,181 @@
+"""
+Answer generation decoupled from the websocket that asked for it.
+
+Every streamed answer is a `GenerationStream`: the generating task feeds the
+answer into it, and whichever connection is attached receives the text. If the
+socket drops, generation carries on into the buffer and a reconnecting client
+resumes from the last offset it received, on the same worker (live) or on any
+other worker (through a snapshot in the shared cache).
+"""
+import asyncio
+import logging
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Streams generated by this process, kept until STREAM_RESUME_TTL after they finish.
+_streams = {}
+
+
+def get_snapshot_key(stream_id):
+    return f"chat_stream:{stream_id}"
+
+
+def get_cancel_key(stream_id):
+    return f"chat_stream_cancel:{stream_id}"
+
+
+class GenerationStream:
+    """
+    Buffer of one answer being generated. At most one listener is attached at a
+    time: an object with async `add(text)` and `end(message_id)` methods.
+    """
+    def __init__(self, user_id, slug):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.slug = slug
+        self.chunks = []
+        self.length = 0
+        self.done = False
+        self.truncated = False
+        self.message_id = None
+        self.tokens = 0
+        self.replayed = False  # Answer replayed from the response cache, not generated
+        self.listener = None
+        self.task = None
+        self.cancellable = True
+        self.resumable = True
+        self._snapshot_at = 0
+
+    @property
+    def content(self):
+        return "".join(self.chunks)
+
+    def attach(self, listener):
+        self.listener = listener
+
+    def detach(self, listener=None):
+        """Detach `listener` (or whichever listener is attached)."""
+        if listener is None or self.listener is listener:
+            self.listener = None
+            metrics.incr("stream.detached")
+            if not self.done:
+                # Make the stream resumable from other workers right away.
+                asyncio.ensure_future(self._snapshot(force=True))
+
+    async def feed(self, text):
+        if not text:
+            return
+        self.chunks.append(text)
+        self.length += len(text)
+
+        if self.resumable and self.length > settings.STREAM_BUFFER_MAX_CHARS:
+            # Too long to keep resumable; the answer is still generated and saved.
+            self.resumable = False
+            await cache.adelete(get_snapshot_key(self.id))
+
+        listener = self.listener
+        if listener is not None:
+            try:
+                await listener.add(text)
+            except Exception as e:
+                logger.info(f"Stream {self.id} lost its listener: {e}")
+                self.detach(listener)
+        if self.listener is None:
+            await self._snapshot()
+
+    def cancel(self):
+        """Stop generating; the generating task saves what it has so far. Returns False if too late."""
+        if not self.cancellable or self.task is None or self.task.done():
+            return False
+        self.cancellable = False
+        self.task.cancel()
+        return True
+
+    async def finish(self, message_id, truncated=False):
+        """Mark the answer complete, tell the listener and schedule the buffer's expiry."""
+        self.cancellable = False
+        self.done = True
+        self.truncated = truncated
+        self.message_id = message_id
+        if message_id is not None and not truncated and not self.replayed:
+            metrics.observe("stream.completion_tokens", self.tokens)
+        await self._snapshot(force=True)
+
+        listener = self.listener
+        if listener is not None:
+            try:
+                await listener.end(self.message_id, truncated)
+            except Exception as e:
+                logger.info(f"Stream {self.id} lost its listener: {e}")
+                self.detach(listener)
+
+        asyncio.get_running_loop().call_later(settings.STREAM_RESUME_TTL, _streams.pop, self.id, None)
+
+    async def _snapshot(self, force=False):
+        """
+        Share the buffer with other workers, at most every STREAM_SNAPSHOT_INTERVAL
+        seconds, and pick up a `cancel` sent by a client following it from another worker.
+        """
+        if not self.resumable:
+            return
+        now = time.monotonic()
+        if not force and now - self._snapshot_at < settings.STREAM_SNAPSHOT_INTERVAL:
+            return
+        self._snapshot_at = now
+        await cache.aset(get_snapshot_key(self.id), {
+            "user_id": self.user_id,
+            "slug": self.slug,
+            "content": self.content,
+            "done": self.done,
+            "truncated": self.truncated,
+            "message_id": self.message_id,
+        }, settings.STREAM_RESUME_TTL)
+
+        if not self.done and await cache.aget(get_cancel_key(self.id)):
+            self.cancel()
+
+
+def start_stream(user_id, slug):
+    stream = GenerationStream(user_id, slug)
+    _streams[stream.id] = stream
+    metrics.incr("stream.started")
+    return stream
+
+
+def get_stream(stream_id):
+    """Return the stream if it is generated (or was recently finished) by this process."""
+    return _streams.get(stream_id)
+
+
+async def get_stream_snapshot(stream_id):
+    """Return the latest snapshot of a stream generated by any worker, or None."""
+    return await cache.aget(get_snapshot_key(stream_id))
+
+
+def record_cancellation(stream):
+    """
+    Count a cancelled answer and estimate the tokens it saved: the average length
+    of completed answers minus what had been generated when it was stopped.
+    """
+    saved = max(round(metrics.get_average("stream.completion_tokens") - stream.tokens), 0)
+    metrics.incr("stream.cancelled")
+    metrics.incr("stream.tokens_saved", saved)
+    metrics.observe("stream.tokens_at_cancel", stream.tokens)
+    logger.info(f"Stream {stream.id} cancelled after {stream.tokens} tokens (~{saved} saved)")
+
+
+async def request_cancel(stream_id):
+    """Ask the worker generating `stream_id` to stop; it checks with its next snapshot."""
+    await cache.aset(get_cancel_key(stream_id), True, settings.STREAM_RESUME_TTL)
+
+
+async def wait_for_streams(timeout=30):
+    """Give answers still being generated a chance to finish (and be saved) on shutdown."""
+    tasks = [stream.task for stream in _streams.values() if stream.task is not None and not stream.task.done()]
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
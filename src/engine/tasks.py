@@ -0,0 +1,12 @@
+from celery import shared_task
+from .persistence import message_writer
+
+@shared_task
+def replay_spooled_messages():
+    """
+    Writes the message batches the write-behind writer could not store.
+    This task should be scheduled to run every few minutes.
+    """
+    written = message_writer.replay_spool()
+
+    return f"Replayed {written} spooled messages"
@@ -1,6 +1,7 @@
+import asyncio
 import unittest
 from unittest.mock import patch, MagicMock
-from engine.adapters.serpapi_adapter import GooglePatentsAdapter
+from engine.adapters.serpapi.google_patent import GooglePatentsAdapter
 
 class GooglePatentsAdapterTest(unittest.TestCase):
     @patch.object(GooglePatentsAdapter, 'perform_search')
@@ -26,7 +27,7 @@ class GooglePatentsAdapterTest(unittest.TestCase):
         
         # Act: Call the search method with the desired parameters
         query = 'cranioplasty mesh'
-        result = adapter.search(query=query, number=2)
+        result = asyncio.run(adapter.search(query=query, number=2))
         
         # Assert: Check that result matches the expected format
         expected_result = [
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+from unittest import mock
+from django.test import override_settings
+from engine.adapters.serpapi.google_scholar import GoogleScholarAdapter
+from engine.adapters.serpapi.google_patent import GooglePatentsAdapter
+from engine.resilience import get_breaker
+
+def scholar_response(title):
+    return {"organic_results": [{"title": title, "snippet": "", "link": f"https://example.com/{title}"}]}
+
+class SerpapiAdapterTest(unittest.TestCase):
+    def test_build_params_drops_unset_values(self):
+        adapter = GoogleScholarAdapter()
+        params = adapter.build_params({"engine": "google_scholar", "q": "mesh", "hl": None})
+
+        self.assertEqual(params["q"], "mesh")
+        self.assertEqual(params["output"], "json")
+        self.assertEqual(params["api_key"], adapter.api_key)
+        self.assertNotIn("hl", params)
+
+    def test_adapters_share_connection_pool(self):
+        async def get_clients():
+            return GoogleScholarAdapter().get_client(), GooglePatentsAdapter().get_client()
+
+        scholar_client, patents_client = asyncio.run(get_clients())
+        self.assertIs(scholar_client, patents_client)
+
+@mock.patch("engine.resilience.report_state")
+class AdapterBreakerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.enterContext(override_settings(
+            BREAKER_HEDGED_UPSTREAMS=["google_scholar_search"], BREAKER_HEDGE_MIN_DELAY=0.01, BREAKER_HEDGE_RATIO=1
+        ))
+        self.enterContext(mock.patch.dict("engine.resilience._breakers", clear=True))
+        self.breaker = get_breaker("google_scholar_search")
+        self.requests = []
+
+    async def test_hedge_sends_a_second_upstream_request(self, report_state):
+        for _ in range(20):
+            self.breaker.record(0.01, ok=True)
+
+        async def fetch(params):
+            self.requests.append(params["q"])
+            if len(self.requests) == 1:
+                await asyncio.sleep(1)
+                return scholar_response("slow")
+            return scholar_response("fast")
+
+        adapter = GoogleScholarAdapter()
+        with mock.patch.object(adapter, "fetch", fetch):
+            results = await adapter.search(query="hedged bone graft")
+
+        self.assertEqual(self.requests, ["hedged bone graft", "hedged bone graft"])
+        self.assertEqual(results[0]["title"], "fast")
+        self.assertEqual(self.breaker.stats()["hedges"], 1)
+
+    async def test_cache_hits_are_not_upstream_calls(self, report_state):
+        async def fetch(params):
+            self.requests.append(params["q"])
+            return scholar_response("cached")
+
+        adapter = GoogleScholarAdapter()
+        with mock.patch.object(adapter, "fetch", fetch):
+            for _ in range(3):
+                await adapter.search(query="cached titanium mesh")
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.breaker.stats()["calls"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+from unittest import mock
+from django.core.cache import cache as shared_cache
+from engine.cache import TieredCache
+
+class TieredCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        shared_cache.clear()
+        self.cache = TieredCache("test", local_size=2, default_ttl=60)
+
+    async def test_returns_copies(self):
+        await self.cache.set("results", [{"title": "mesh"}])
+        (await self.cache.get("results"))[0]["title"] = "changed"
+        self.assertEqual(await self.cache.get("results"), [{"title": "mesh"}])
+
+    async def test_evicts_least_recently_used(self):
+        for key in ("a", "b"):
+            await self.cache.set(key, key)
+        self.cache._get_local("a")
+        await self.cache.set("c", "c")
+        self.assertEqual(list(self.cache._local), ["a", "c"])
+
+    async def test_falls_through_to_the_shared_cache(self):
+        await self.cache.set("key", "value")
+        self.cache._local.clear()
+        self.assertEqual(await self.cache.get("key"), "value")
+        self.assertIn("key", self.cache._local)
+
+    async def test_local_entries_expire(self):
+        with mock.patch("engine.cache.time.monotonic", return_value=1000):
+            self.cache._set_local("key", "value", ttl=10)
+        with mock.patch("engine.cache.time.monotonic", return_value=1011):
+            self.assertIsNone(await self.cache.get("key"))
+        self.assertNotIn("key", self.cache._local)
+
+    async def test_coalesces_concurrent_misses(self):
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ["result"]
+
+        results = await asyncio.gather(*(self.cache.get_or_set("key", compute) for _ in range(3)))
+        self.assertEqual(results, [["result"]] * 3)
+        self.assertEqual(len(calls), 1)
+        results[0].append("changed")
+        self.assertEqual(results[1], ["result"])
+
+    async def test_cache_if_vetoes_storing(self):
+        await self.cache.get_or_set("empty", mock.AsyncMock(return_value=[]), cache_if=bool)
+        self.assertIsNone(await self.cache.get("empty"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import asyncio
+import json
+import unittest
+from collections import deque
+from types import SimpleNamespace
+from unittest import mock
+from django.test import override_settings
+from engine.consumers import ChatConsumer
+
+class ChatConsumerQueueTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.enterContext(override_settings(CHAT_MAX_QUEUED_MESSAGES=1))
+        self.enterContext(mock.patch("engine.consumers.idle_reaper"))
+        self.consumer = ChatConsumer()
+        self.consumer.queued = deque()
+        self.consumer.queue_task = None
+        self.consumer.send = mock.AsyncMock()
+        self.consumer._ensure_session = mock.AsyncMock(return_value=True)
+        self.handled = []
+
+        async def handle_message(data):
+            self.handled.append(data["message"])
+
+        self.consumer._handle_message = handle_message
+        self.generation = asyncio.Event()
+        self.consumer.stream = SimpleNamespace(id="1", task=asyncio.ensure_future(self.generation.wait()))
+
+    async def receive(self, **data):
+        await asyncio.wait_for(self.consumer.receive(json.dumps(data)), timeout=1)
+
+    async def test_messages_wait_for_the_answer_without_blocking_receive(self):
+        await self.receive(message="first")
+        await self.receive(message="second")
+        self.assertEqual(self.handled, [])
+        self.consumer.send.assert_awaited_once_with(text_data=json.dumps({"type": "busy"}))
+
+        with mock.patch.object(self.consumer, "_cancel", mock.AsyncMock()) as cancel:
+            await self.receive(type="cancel", stream_id="1")
+        cancel.assert_awaited_once_with("1")
+
+        self.generation.set()
+        await self.consumer.queue_task
+        self.assertEqual(self.handled, ["first"])
+
+if __name__ == '__main__':
+    unittest.main()
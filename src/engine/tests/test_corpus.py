@@ -0,0 +1,54 @@
+from django.test import TestCase, override_settings
+from engine.corpus import search_corpus, search_with_corpus, store_results
+from engine.models import CorpusSearch
+from engine.ratelimit import speculative
+
+SERVICE = "google_scholar_search"
+
+def result(number, title):
+    return {"title": title, "snippet": "", "link": f"https://example.com/{number}"}
+
+@override_settings(CORPUS_ENABLED=True, CORPUS_MIN_RESULTS=2, CORPUS_MAX_RESULTS=10)
+class CorpusTest(TestCase):
+    async def test_searched_keyword_returns_its_own_results_in_order(self):
+        results = [result(1, "Mesh implants"), result(2, "Bone grafts"), result(3, "Skull plates")]
+        await store_results(SERVICE, "cranioplasty", results)
+        await store_results(SERVICE, "mesh", [result(4, "Mesh filters")])
+
+        self.assertEqual(await search_corpus(SERVICE, "Cranioplasty"), results)
+
+    async def test_a_new_search_replaces_the_keyword_results(self):
+        await store_results(SERVICE, "cranioplasty", [result(1, "Mesh implants"), result(2, "Bone grafts")])
+        await store_results(SERVICE, "cranioplasty", [result(2, "Bone grafts")])
+
+        self.assertEqual(await search_corpus(SERVICE, "cranioplasty"), [result(2, "Bone grafts")])
+        search = await CorpusSearch.objects.aget(service=SERVICE, keyword="cranioplasty")
+        self.assertEqual(await search.documents.acount(), 1)
+
+    async def test_unsearched_keyword_needs_enough_matches(self):
+        await store_results(SERVICE, "implants", [result(1, "Mesh implants"), result(2, "Titanium mesh")])
+
+        self.assertIsNone(await search_corpus(SERVICE, "implants titanium"))
+        self.assertEqual(len(await search_corpus(SERVICE, "mesh")), 2)
+
+    async def test_searches_the_external_service_on_a_miss(self):
+        calls = []
+
+        async def search(keyword):
+            calls.append(keyword)
+            return [result(1, "Mesh implants")]
+
+        self.assertEqual(await search_with_corpus(SERVICE, "cranioplasty", search), [result(1, "Mesh implants")])
+        self.assertEqual(await search_with_corpus(SERVICE, "cranioplasty", search), [result(1, "Mesh implants")])
+        self.assertEqual(calls, ["cranioplasty"])
+
+    async def test_draft_searches_are_not_stored(self):
+        async def search(keyword):
+            return [result(1, "Mesh implants")]
+
+        token = speculative.set(True)
+        try:
+            await search_with_corpus(SERVICE, "cranioplasty mes", search)
+        finally:
+            speculative.reset(token)
+        self.assertFalse(await CorpusSearch.objects.aexists())
@@ -0,0 +1,56 @@
+import json
+import unittest
+from engine.evidence import pack_evidence
+
+def patent(number, title, snippet="A device."):
+    return {
+        "title": title,
+        "snippet": snippet,
+        "patent_id": f"patent/US{number}A1/en",
+        "link": f"https://patents.google.com/patent/US{number}A1/en",
+    }
+
+class PackEvidenceTest(unittest.TestCase):
+    def test_results_are_deduplicated_and_ranked(self):
+        extra_data = [
+            {"external_data": {"keyword": "cranioplasty mesh"}, "service_data": [
+                patent(1, "Bicycle frame"),
+                patent(2, "Cranioplasty mesh forming tool", "Forming a titanium cranioplasty mesh."),
+            ]},
+            {"external_data": {"keyword": "mesh"}, "service_data": [patent(2, "Cranioplasty mesh forming tool")]},
+            {"filter": "Only granted patents."},
+        ]
+        packed, stats = pack_evidence("How do I form a cranioplasty mesh?", extra_data, token_budget=1000)
+        evidence = json.loads(packed)
+
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertEqual(evidence["filters"], ["Only granted patents."])
+        [table] = evidence["results"]
+        self.assertEqual(table["columns"], ["title", "snippet", "patent_id", "link"])
+        self.assertEqual([row[0] for row in table["rows"]], ["Cranioplasty mesh forming tool", "Bicycle frame"])
+
+    def test_results_without_identifier_differ_by_any_field(self):
+        extra_data = [{"external_data": {"keyword": "usb hub"}, "service_data": [
+            {"title": "USB hub", "price": "$10"},
+            {"title": "USB hub", "price": "$12"},
+            {"title": "usb  HUB", "price": "$10"},
+        ]}]
+        packed, stats = pack_evidence("usb hub", extra_data, token_budget=1000)
+
+        self.assertEqual(stats["duplicates"], 1)
+        [table] = json.loads(packed)["results"]
+        self.assertEqual([row[1] for row in table["rows"]], ["$10", "$12"])
+
+    def test_results_are_cut_at_the_token_budget(self):
+        extra_data = [{"external_data": {"keyword": "mesh"}, "service_data": [
+            patent(number, f"Mesh {number}", "x" * 200) for number in range(100)
+        ]}]
+        packed, stats = pack_evidence("mesh", extra_data, token_budget=500)
+
+        self.assertLessEqual(stats["tokens_after"], 500)
+        self.assertGreater(stats["included"], 0)
+        self.assertEqual(json.loads(packed)["omitted_results"], 100 - stats["included"])
+        self.assertLess(stats["tokens_after"], stats["tokens_before"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+from engine.history import ChatHistory
+
+class ChatHistoryTest(unittest.TestCase):
+    def test_keeps_only_latest_turns(self):
+        history = ChatHistory(max_turns=2)
+        history.append("user", "first")
+        history.append("system", "second")
+        history.append("user", "third")
+
+        self.assertEqual(len(history), 2)
+        self.assertEqual(
+            history.as_messages(),
+            [{"role": "system", "content": "second"}, {"role": "user", "content": "third"}]
+        )
+
+    def test_system_prompt_leads_messages(self):
+        history = ChatHistory()
+        history.extend([("user", "hi"), ("system", "hello")])
+
+        messages = history.as_messages(system_prompt="prompt")
+        self.assertEqual(messages[0], {"role": "system", "content": "prompt"})
+        self.assertEqual(len(messages), 3)
+
+if __name__ == '__main__':
+    unittest.main()
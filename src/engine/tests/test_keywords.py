@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+from engine.extraction import KeywordExtractor
+from engine.keywords import RakeKeywordExtractor
+
+class RakeKeywordExtractorTest(unittest.TestCase):
+    def setUp(self):
+        self.extractor = RakeKeywordExtractor()
+
+    def test_simple_requests_are_confident(self):
+        self.assertEqual(self.extractor.extract("Patents for forming cranioplasty mesh"), ("forming cranioplasty mesh", 1.0))
+        self.assertEqual(self.extractor.extract("I need research on graphene-based supercapacitors"),
+                         ("graphene-based supercapacitors", 1.0))
+
+    def test_requests_needing_interpretation_are_not(self):
+        _, confidence = self.extractor.extract("What is the difference between CRISPR and TALEN?")
+        self.assertLess(confidence, 0.75)
+        _, confidence = self.extractor.extract("Show me patents by Elon Musk filed after 2015")
+        self.assertLess(confidence, 0.75)
+        self.assertEqual(self.extractor.extract("لپ تاپ ارزان"), (None, 0.0))
+
+    def test_chat_questions_and_single_words_are_not(self):
+        for message in ["hello", "ok", "thanks!", "how do I file a patent", "cheap laptop"]:
+            _, confidence = self.extractor.extract(message)
+            self.assertLess(confidence, 0.75, message)
+
+class KeywordExtractorTest(unittest.IsolatedAsyncioTestCase):
+    @mock.patch("engine.extraction.call_openai_functions")
+    @mock.patch("engine.extraction.call_openai_function")
+    async def test_confident_local_keyword_skips_the_tool_call(self, call_openai_function, call_openai_functions):
+        extractor = KeywordExtractor("cheap gaming laptop", ["google_shopping_search", "google_autocomplete_search"],
+                                     use_cache=False)
+        await extractor.start()
+
+        self.assertEqual(await extractor.get_arguments("google_shopping_search"),
+                         {"keyword": "gaming laptop", "description": "cheap gaming laptop"})
+        self.assertEqual(await extractor.get_arguments("google_autocomplete_search"), {"keyword": "gaming laptop"})
+        call_openai_function.assert_not_called()
+        call_openai_functions.assert_not_called()
+
+    @mock.patch("engine.extraction.call_openai_function")
+    async def test_unconfident_local_keyword_falls_back_to_the_tool_call(self, call_openai_function):
+        for message in ["hello", "ok", "thanks!", "how do I file a patent", "cheap laptop"]:
+            call_openai_function.reset_mock()
+            call_openai_function.return_value = None
+            extractor = KeywordExtractor(message, ["google_patents_search"], use_cache=False)
+            await extractor.start()
+
+            await extractor.get_arguments("google_patents_search")
+            self.assertEqual(extractor.local, {}, message)
+            call_openai_function.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from django.core.cache import cache
+from engine.persistence import MessageWriter, get_pending_key
+
+class MessageWriterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.spool_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(patch.object(MessageWriter, "enabled", True))
+        self.writer = MessageWriter(batch_size=3, flush_interval=0.01, max_retries=2, retry_delay=0,
+                                    spool_dir=self.spool_dir)
+        ids = itertools.count(1)
+
+        async def allocate_id():
+            return next(ids)
+
+        self.writer.allocate_id = allocate_id
+        self.batches = []
+        self.failures = 0
+
+        def write(batch, ignore_conflicts=False):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("database is down")
+            self.batches.append([(message.id, engine_ids) for message, engine_ids in batch])
+
+        self.writer._write = write
+
+    async def save(self, count):
+        return [await self.writer.save(None, f"message {i}", "user", ["1"]) for i in range(count)]
+
+    async def test_writes_in_ordered_batches(self):
+        messages = await self.save(7)
+        await self.writer.flush()
+
+        self.assertEqual([message.id for message in messages], list(range(1, 8)))
+        self.assertEqual([len(batch) for batch in self.batches], [3, 3, 1])
+        self.assertEqual([message_id for batch in self.batches for message_id, _ in batch], list(range(1, 8)))
+        await self.writer.close()
+
+    async def test_retries_a_failed_batch(self):
+        self.failures = 1
+        await self.save(2)
+        await self.writer.flush()
+
+        self.assertEqual(self.batches, [[(1, ["1"]), (2, ["1"])]])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        await self.writer.close()
+
+    async def test_spills_and_replays_a_batch_that_keeps_failing(self):
+        self.failures = 2
+        await self.save(2)
+        await self.writer.flush()
+
+        self.assertEqual(self.batches, [])
+        self.assertEqual(len(os.listdir(self.spool_dir)), 1)
+
+        with patch.object(self.writer, "_restore", lambda records: [
+            (SimpleNamespace(id=record["id"]), record["engine_ids"]) for record in records
+        ]):
+            written = await asyncio.to_thread(self.writer.replay_spool)
+
+        self.assertEqual(written, 2)
+        self.assertEqual(self.batches, [[(1, ["1"]), (2, ["1"])]])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+        await self.writer.close()
+
+    async def test_waits_only_for_messages_handed_out_and_not_written(self):
+        [message] = await self.save(1)
+        self.assertTrue(await cache.aget(get_pending_key(message.id)))
+
+        waiting = asyncio.create_task(asyncio.to_thread(self.writer.wait_until_written, message.id))
+        await self.writer.flush()
+        await waiting
+        self.assertIsNone(await cache.aget(get_pending_key(message.id)))
+
+        started = time.monotonic()
+        await asyncio.to_thread(self.writer.wait_until_written, message.id + 1)
+        await self.writer.await_written(message.id + 1)
+        self.assertLess(time.monotonic() - started, self.writer.flush_interval)
+        await self.writer.close()
+
+    async def test_close_drains_the_queue(self):
+        await self.save(4)
+        await self.writer.close()
+
+        self.assertEqual(sum(len(batch) for batch in self.batches), 4)
+        self.assertIsNone(self.writer._task)
+
+if __name__ == '__main__':
+    unittest.main()
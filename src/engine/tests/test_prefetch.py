@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from django.test import override_settings
+from engine.prefetch import DraftPrefetch, is_truncated
+from engine.ratelimit import speculative
+from engine.utils import fetch_external_data
+
+ARGUMENTS = {"google_patents_search": {"keyword": "cranioplasty mesh"}}
+
+class DraftPrefetchTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.enterContext(override_settings(DRAFT_DEBOUNCE=0, DRAFT_MATCH_SIMILARITY=0.8))
+        self.prefetch_arguments = self.enterContext(
+            mock.patch("engine.prefetch.prefetch_arguments", return_value=ARGUMENTS)
+        )
+
+    async def test_reuses_a_matching_draft(self):
+        draft = DraftPrefetch(1, "patents for forming cranioplasty mes", [3])
+        draft.start()
+        await asyncio.sleep(0.01)
+        self.assertEqual(await draft.take("Patents for forming cranioplasty mesh", [3]), ARGUMENTS)
+
+    async def test_discards_a_different_message(self):
+        draft = DraftPrefetch(2, "patents for forming cranioplasty mesh", [3])
+        draft.start()
+        await asyncio.sleep(0.01)
+        self.assertIsNone(await draft.take("papers on bone grafts", [3]))
+        self.assertIsNone(await draft.take("patents for forming cranioplasty mesh", [4]))
+
+    async def test_debouncing_draft_is_cancelled(self):
+        with override_settings(DRAFT_DEBOUNCE=10):
+            draft = DraftPrefetch(3, "patents for forming cranioplasty mesh", [3])
+            draft.start()
+            await asyncio.sleep(0)
+            self.assertIsNone(await draft.take("patents for forming cranioplasty mesh", [3]))
+        await asyncio.sleep(0)
+        self.assertTrue(draft.task.cancelled())
+        self.prefetch_arguments.assert_not_called()
+
+    async def test_truncated_keywords_are_not_reused(self):
+        self.prefetch_arguments.return_value = {
+            "google_patents_search": {"keyword": "cranioplasty mes"},
+            "google_scholar_search": {"keyword": "cranioplasty"},
+        }
+        draft = DraftPrefetch(4, "patents for forming cranioplasty mes", [3, 5])
+        draft.start()
+        await asyncio.sleep(0.01)
+        self.assertEqual(
+            await draft.take("patents for forming cranioplasty mesh", [3, 5]),
+            {"google_scholar_search": {"keyword": "cranioplasty"}}
+        )
+
+    def test_is_truncated(self):
+        words = {"patents", "for", "cranioplasty", "mesh"}
+        self.assertTrue(is_truncated("cranioplasty mes", words))
+        self.assertFalse(is_truncated("cranioplasty mesh", words))
+        self.assertFalse(is_truncated("skull implant", words))  # Reworded, not cut
+
+class Adapter:
+    async def search(self, query):
+        return [{"value": f"{query} suggestion"}]
+
+class Extractor:
+    async def get_arguments(self, service):
+        return {"keyword": "cranioplasty mes"}
+
+class SpeculativeSearchTest(unittest.IsolatedAsyncioTestCase):
+    async def test_draft_keywords_do_not_feed_the_typeahead_index(self):
+        async def get_service_adapter():
+            return Adapter()
+
+        engine = SimpleNamespace(
+            id=1, name="Autocomplete", external_service="google_autocomplete_search",
+            get_service_adapter=get_service_adapter,
+        )
+        with mock.patch("engine.utils.typeahead_index") as typeahead_index, \
+                mock.patch("engine.resilience.report_state"):
+            token = speculative.set(True)
+            try:
+                await fetch_external_data(engine, Extractor(), {})
+            finally:
+                speculative.reset(token)
+            typeahead_index.add.assert_not_called()
+
+            await fetch_external_data(engine, Extractor(), {})
+            self.assertEqual(typeahead_index.add.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from RITengine.utils import parse_rate_limits
+from engine.ratelimit import RateLimiter, speculative
+
+class LocalRateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_takes_tokens_from_every_budget(self):
+        limiter = RateLimiter({"openai": (100, 5), "openai:gpt-4o": (1, 2)})
+        self.assertTrue(await limiter.acquire(["openai", "openai:gpt-4o"], wait=0))
+        self.assertTrue(await limiter.acquire(["openai", "openai:gpt-4o"], wait=0))
+        # The model budget is spent; the provider budget is not charged for a denied request.
+        self.assertFalse(await limiter.acquire(["openai", "openai:gpt-4o"], wait=0))
+        self.assertTrue(await limiter.acquire(["openai", "unlimited"], wait=0))
+        self.assertEqual(limiter.usage()["openai"]["current_minute"], 3)
+
+    async def test_waits_for_a_token(self):
+        limiter = RateLimiter({"serpapi": (20, 1)})
+        self.assertTrue(await limiter.acquire(["serpapi"], wait=0))
+        self.assertTrue(await limiter.acquire(["serpapi"], wait=0.2))
+
+    async def test_workers_share_the_budget(self):
+        limiter = RateLimiter({"serpapi": (10, 4)}, workers=2)
+        results = [await limiter.acquire(["serpapi"], wait=0) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+
+    async def test_prefix_budget_per_name(self):
+        limiter = RateLimiter({"draft:user:*": (1, 1)})
+        self.assertTrue(await limiter.acquire(["draft:user:1"], wait=0))
+        self.assertFalse(await limiter.acquire(["draft:user:1"], wait=0))
+        self.assertTrue(await limiter.acquire(["draft:user:2"], wait=0))
+
+    async def test_speculative_requests_use_draft_and_provider_budgets(self):
+        limiter = RateLimiter({"serpapi": (100, 2), "draft:serpapi": (1, 1)})
+        token = speculative.set(True)
+        try:
+            self.assertTrue(await limiter.acquire(["serpapi"]))
+            self.assertFalse(await limiter.acquire(["serpapi"]))
+        finally:
+            speculative.reset(token)
+        self.assertTrue(await limiter.acquire(["serpapi"], wait=0))
+        self.assertFalse(await limiter.acquire(["serpapi"], wait=0))
+        self.assertEqual(limiter.usage()["serpapi"]["current_minute"], 2)
+
+class ParseRateLimitsTest(unittest.TestCase):
+    def test_parses_budgets(self):
+        self.assertEqual(parse_rate_limits("serpapi=5/10, openai:gpt-4o=0.5/2"),
+                         {"serpapi": (5.0, 10), "openai:gpt-4o": (0.5, 2)})
+        self.assertEqual(parse_rate_limits(""), {})
+
+if __name__ == '__main__':
+    unittest.main()
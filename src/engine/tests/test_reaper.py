@@ -0,0 +1,28 @@
+import unittest
+from engine.reaper import IdleReaper
+
+class Connection:
+    def __init__(self):
+        self.closed_with = None
+
+    async def close(self, code=None, reason=None):
+        self.closed_with = code
+
+class IdleReaperTest(unittest.IsolatedAsyncioTestCase):
+    async def test_sweep_closes_only_idle_connections(self):
+        reaper = IdleReaper(timeout=60, interval=3600)
+        idle, active = Connection(), Connection()
+        reaper.register(idle)
+        reaper.register(active)
+        reaper._last_activity[idle] -= 120
+        reaper._last_activity[active] -= 120
+        reaper.touch(active)
+
+        self.assertEqual(await reaper.sweep(), 1)
+        self.assertEqual(idle.closed_with, 4001)
+        self.assertIsNone(active.closed_with)
+        self.assertEqual(reaper.stats()["open"], 1)
+        await reaper.stop()
+
+if __name__ == '__main__':
+    unittest.main()
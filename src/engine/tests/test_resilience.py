@@ -0,0 +1,84 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from django.test import override_settings
+from engine.adapters.serpapi.google_shopping import GoogleShoppingAdapter
+from engine.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, get_breaker
+from engine.utils import fetch_external_data_with_deadline
+
+async def fail():
+    raise ConnectionError("upstream down")
+
+async def succeed(delay=0, value="ok"):
+    await asyncio.sleep(delay)
+    return value
+
+@mock.patch("engine.resilience.report_state")
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_opens_after_consecutive_failures_and_recovers(self, report_state):
+        breaker = CircuitBreaker("upstream", failure_threshold=3, reset_timeout=0.05)
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                await breaker.call(fail)
+        self.assertEqual(breaker.state, OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            await breaker.call(succeed)
+
+        await asyncio.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())  # A single trial call at a time
+        breaker.record(0.01, ok=True)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(report_state.call_count, 3)  # Open, half-open, closed
+
+    async def test_timeouts_count_as_failures(self, report_state):
+        breaker = CircuitBreaker("upstream", failure_threshold=1)
+        with self.assertRaises(asyncio.TimeoutError):
+            await breaker.call(lambda: succeed(delay=1), timeout=0.01)
+        self.assertEqual(breaker.state, OPEN)
+
+    async def test_slow_requests_are_hedged(self, report_state):
+        breaker = CircuitBreaker("upstream", hedge=True, hedge_min_delay=0.01, hedge_ratio=1)
+        for _ in range(20):
+            breaker.record(0.01, ok=True)
+
+        delays = iter([1, 0])
+        self.assertEqual(await breaker.call(lambda: succeed(delay=next(delays), value="hedged")), "hedged")
+        self.assertEqual(breaker.stats()["hedges"], 1)
+
+class SlowAdapter(GoogleShoppingAdapter):
+    async def fetch(self, params):
+        await asyncio.sleep(1)
+        return {}
+
+class Extractor:
+    async def get_arguments(self, service):
+        return {"keyword": "usb hub"}
+
+@mock.patch("engine.resilience.report_state")
+class EngineDeadlineTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.enterContext(override_settings(
+            ENGINE_DEADLINES={"google_shopping_search": 0.2}, BREAKER_FAILURE_THRESHOLD=1
+        ))
+        self.enterContext(mock.patch.dict("engine.resilience._breakers", clear=True))
+
+    async def test_slow_upstream_opens_the_circuit_before_the_deadline(self, report_state):
+        async def get_service_adapter():
+            return SlowAdapter()
+
+        engine = SimpleNamespace(
+            id=1, name="Shopping", external_service="google_shopping_search",
+            get_service_adapter=get_service_adapter,
+        )
+        extra_data, timing = await fetch_external_data_with_deadline(engine, Extractor())
+
+        self.assertEqual(timing["status"], "timeout")
+        self.assertEqual(extra_data[0]["external_data"], {"keyword": "usb hub"})
+        self.assertEqual(get_breaker("google_shopping_search").state, OPEN)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from django.core.cache import cache
+from engine.extraction import normalize_message
+from engine.response_cache import ResponseCache, get_shingles, is_first_turn, similarity
+
+class ShingleSimilarityTest(unittest.TestCase):
+    def similarity(self, message, other):
+        return similarity(get_shingles(normalize_message(message)), get_shingles(normalize_message(other)))
+
+    def test_trivial_edits_are_near_duplicates(self):
+        self.assertEqual(self.similarity("How do I file a patent?", "how do i file a  patent"), 1.0)
+        self.assertGreaterEqual(
+            self.similarity("what is a provisional patent application", "What is a provisional patent application? thanks"),
+            0.8
+        )
+
+    def test_different_questions_are_not(self):
+        self.assertLess(self.similarity("best laptop under 1000", "best laptop under 2000"), 0.8)
+        self.assertLess(self.similarity("how do I file a patent", "how do I file patents in europe"), 0.8)
+
+class ResponseCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = ResponseCache(similarity_threshold=0.8, index_size=2)
+
+    async def test_exact_and_near_hits(self):
+        await self.cache.set(1, 60, [3, 4], "What is a provisional patent application?", "An early filing.")
+
+        self.assertEqual(await self.cache.get(1, [4, 3], "what is a provisional patent application"), "An early filing.")
+        self.assertEqual(
+            await self.cache.get(1, [3, 4], "What is a provisional patent application? thanks"), "An early filing."
+        )
+        self.assertIsNone(await self.cache.get(1, [3, 4], "How do I file a patent in Europe?"))
+        self.assertIsNone(await self.cache.get(1, [3], "What is a provisional patent application?"))
+
+    async def test_index_keeps_only_the_latest_messages_of_a_scope(self):
+        await self.cache.set(1, 60, [3], "what is a provisional patent application", "An early filing.")
+        await self.cache.set(1, 60, [3], "best laptop under 1000", "Any of these.")
+        await self.cache.set(1, 60, [3], "how do I file a patent", "Like this.")
+
+        # Dropped from the near-duplicate index, but still an exact hit.
+        self.assertIsNone(await self.cache.get(1, [3], "what is a provisional patent application thanks"))
+        self.assertEqual(await self.cache.get(1, [3], "What is a provisional patent application"), "An early filing.")
+        self.assertEqual(await self.cache.get(1, [3], "how do i file a patent?"), "Like this.")
+
+    async def test_purge_bumps_the_category_version(self):
+        await self.cache.set(1, 60, [3], "how do I file a patent", "Like this.")
+        await self.cache.set(2, 60, [3], "how do I file a patent", "Like that.")
+
+        self.cache.purge(1)
+        self.cache.purge(1)
+
+        self.assertEqual(cache.get(ResponseCache._version_key(1)), 2)
+        self.assertIsNone(await self.cache.get(1, [3], "how do I file a patent"))
+        self.assertEqual(await self.cache.get(2, [3], "how do I file a patent"), "Like that.")
+
+    def test_only_first_turn_messages_are_cached(self):
+        self.assertTrue(is_first_turn(None, None))
+        self.assertFalse(is_first_turn("chat-slug", None))
+        self.assertFalse(is_first_turn(None, 42))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from engine.rewriter import RewriteRules, StreamRewriter
+
+RULES = RewriteRules({"chatgpt": "RITengine", "openai": "RIT team", "open ai": "RIT team"})
+
+def rewrite(chunks):
+    rewriter = StreamRewriter(RULES)
+    return "".join(rewriter.feed(chunk) for chunk in chunks) + rewriter.flush()
+
+class StreamRewriterTest(unittest.TestCase):
+    def test_rewrites_terms_case_insensitively(self):
+        self.assertEqual(rewrite(["I am ChatGPT by OpenAI, open ai and OPEN AI."]),
+                         "I am RITengine by RIT team, RIT team and RIT team.")
+
+    def test_rewrites_terms_split_across_chunks(self):
+        self.assertEqual(rewrite(["I am Chat", "G", "PT by Open", " AI"]), "I am RITengine by RIT team")
+
+    def test_holds_back_only_partial_terms(self):
+        rewriter = StreamRewriter(RULES)
+        self.assertEqual(rewriter.feed("Hello chat"), "Hello ")
+        self.assertEqual(rewriter.feed("ty people"), "chatty people")
+        self.assertEqual(rewriter.flush(), "")
+
+    def test_text_that_changes_length_when_lowercased(self):
+        self.assertEqual(rewrite(["İstanbul ChatG", "PT and İ", "OpenAI"]), "İstanbul RITengine and İRIT team")
+
+    def test_flush_emits_unfinished_partial_term(self):
+        self.assertEqual(rewrite(["the end: open"]), "the end: open")
+
+if __name__ == '__main__':
+    unittest.main()
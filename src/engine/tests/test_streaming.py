@@ -0,0 +1,50 @@
+import asyncio
+import json
+import unittest
+from engine.streaming import FrameCoalescer
+
+class FrameCoalescerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.frames = []
+
+    async def send(self, text_data):
+        self.frames.append(json.loads(text_data)["content"])
+
+    async def test_first_delta_is_sent_immediately(self):
+        coalescer = FrameCoalescer(self.send, "slug", max_delay=10, max_bytes=1024)
+        await coalescer.add("Hello")
+        await coalescer.add(" world")
+        self.assertEqual(self.frames, ["Hello"])
+
+        await coalescer.close()
+        self.assertEqual(self.frames, ["Hello", " world"])
+
+    async def test_flushes_on_size(self):
+        coalescer = FrameCoalescer(self.send, "slug", max_delay=10, max_bytes=4)
+        for delta in ["a", "b", "c", "d", "e", "f"]:
+            await coalescer.add(delta)
+        self.assertEqual(self.frames, ["a", "bcde"])
+
+    async def test_flushes_on_delay(self):
+        coalescer = FrameCoalescer(self.send, "slug", max_delay=0.01, max_bytes=1024)
+        await coalescer.add("a")
+        await coalescer.add("b")
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.frames, ["a", "b"])
+
+    async def test_failed_timed_flush_is_logged(self):
+        async def send(text_data):
+            if self.frames:
+                raise ConnectionError("socket closed")
+            self.frames.append(json.loads(text_data)["content"])
+
+        coalescer = FrameCoalescer(send, "slug", max_delay=0.01, max_bytes=1024)
+        await coalescer.add("a")
+        await coalescer.add("b")
+        with self.assertLogs("engine.streaming", "INFO"):
+            await asyncio.sleep(0.05)
+        await coalescer.close()
+        self.assertEqual(self.frames, ["a"])
+
+if __name__ == '__main__':
+    unittest.main()
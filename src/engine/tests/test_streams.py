@@ -0,0 +1,50 @@
+import unittest
+from engine.streams import start_stream, get_stream
+
+class Listener:
+    def __init__(self):
+        self.text = ""
+        self.ended_with = None
+        self.truncated = None
+
+    async def add(self, text):
+        self.text += text
+
+    async def end(self, message_id, truncated=False):
+        self.ended_with = message_id
+        self.truncated = truncated
+
+class GenerationStreamTest(unittest.IsolatedAsyncioTestCase):
+    async def test_generation_continues_without_listener(self):
+        stream = start_stream(user_id=1, slug="chat")
+        listener = Listener()
+        stream.attach(listener)
+        await stream.feed("Hello")
+        stream.detach(listener)
+        await stream.feed(" world")
+
+        self.assertEqual(listener.text, "Hello")
+        self.assertEqual(stream.content, "Hello world")
+        self.assertIs(get_stream(stream.id), stream)
+
+    async def test_resumed_listener_gets_the_end(self):
+        stream = start_stream(user_id=1, slug="chat")
+        await stream.feed("Hello")
+        listener = Listener()
+        stream.attach(listener)
+        await stream.feed("!")
+        await stream.finish(42)
+
+        self.assertEqual(listener.text, "!")
+        self.assertEqual(listener.ended_with, 42)
+        self.assertFalse(listener.truncated)
+        self.assertTrue(stream.done)
+
+    async def test_cancel_needs_a_running_generation(self):
+        stream = start_stream(user_id=1, slug="chat")
+        self.assertFalse(stream.cancel())
+        await stream.finish(None, truncated=True)
+        self.assertTrue(stream.truncated)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+from engine.ratelimit import RateLimiter
+from engine.typeahead import PrefixIndex, TypeaheadIndex
+
+class PrefixIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        for term in ["Cranioplasty mesh", "cranioplasty  MESH", "cranial implant", "crane", "mesh forming"]:
+            self.index.add(term)
+        self.index.merge()
+
+    def test_suggests_terms_by_prefix_most_frequent_first(self):
+        self.assertEqual(self.index.lookup("CRAN"), ["Cranioplasty mesh", "crane", "cranial implant"])
+        self.assertEqual(self.index.lookup("cranio"), ["Cranioplasty mesh"])
+        self.assertEqual(self.index.lookup("cran", limit=1), ["Cranioplasty mesh"])
+        self.assertEqual(self.index.lookup("drill"), [])
+
+    def test_new_terms_are_visible_after_a_merge(self):
+        self.index.add("crane", weight=5)
+        self.assertEqual(self.index.lookup("cra", limit=1), ["Cranioplasty mesh"])
+        self.index.merge()
+        self.assertEqual(self.index.lookup("cra", limit=1), ["crane"])
+        self.assertEqual(len(self.index), 4)
+
+class TypeaheadFallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.index = TypeaheadIndex()
+        self.fetch = self.enterContext(mock.patch(
+            "engine.typeahead.fetch_autocomplete", mock.AsyncMock(return_value=[{"value": "cranioplasty"}])
+        ))
+        self.enterContext(mock.patch(
+            "engine.typeahead.rate_limiter", RateLimiter({"typeahead:user:*": (0.001, 2)})
+        ))
+
+    def test_short_cold_prefixes_are_not_fetched(self):
+        self.assertEqual(self.index.suggest("cr", user_id=1), ([], "index"))
+        self.fetch.assert_not_called()
+
+    def test_cold_prefixes_past_the_users_budget_get_nothing(self):
+        self.assertEqual(self.index.suggest("cra", user_id=1), (["cranioplasty"], "adapter"))
+        self.assertEqual(self.index.suggest("crb", user_id=1), (["cranioplasty"], "adapter"))
+        self.assertEqual(self.index.suggest("crc", user_id=1), ([], "limited"))
+        self.assertEqual(self.index.suggest("crc", user_id=2), (["cranioplasty"], "adapter"))
+        self.assertEqual(self.fetch.await_count, 3)
+
+if __name__ == '__main__':
+    unittest.main()
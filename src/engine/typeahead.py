@@ -0,0 +1,188 @@
+"""
+In-memory typeahead suggestions.
+
+Suggestions come from a per-process prefix index: a sorted array of the
+keywords extracted from chat messages, the keywords of the local corpus and the
+autocomplete suggestions fetched so far. A lookup is two binary searches plus
+picking the most frequent terms in the range, so it never leaves the process.
+Only a prefix the index knows nothing about goes to the autocomplete adapter,
+if it has at least TYPEAHEAD_FALLBACK_MIN_CHARS characters and the user's
+"typeahead:user:<id>" budget has a token left; otherwise it gets no suggestions.
+
+New terms are queued and merged into the index by a background thread every
+TYPEAHEAD_MERGE_INTERVAL seconds; corpus keywords searched by other workers are
+picked up every TYPEAHEAD_RELOAD_INTERVAL seconds. The background thread is started with the
+server (lifespan startup).
+"""
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.utils import timezone
+from . import metrics
+from .adapter import get_adapter
+from .models import CorpusSearch
+from .ratelimit import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+MAX_TERM_LENGTH = 100
+MAX_PENDING = 10_000
+
+
+def normalize_term(term):
+    return " ".join(term.casefold().split())
+
+
+async def fetch_autocomplete(prefix):
+    adapter = await get_adapter("google_autocomplete_search")
+    return await adapter.search(query=prefix)
+
+
+async def fetch_autocomplete_for(user_id, prefix):
+    """Autocomplete results for a cold prefix, or None once the user's typeahead budget is spent."""
+    if not await rate_limiter.acquire([f"typeahead:user:{user_id}"], wait=0):
+        return None
+    return await fetch_autocomplete(prefix)
+
+
+class PrefixIndex:
+    """
+    Sorted array of normalized terms, each with the text to suggest and a weight
+    (how often it was seen). Readers use the arrays of the latest merge, which
+    are replaced as a whole, so lookups never wait for a merge.
+    """
+    def __init__(self):
+        self._index = ([], [])  # Sorted terms and their (suggestion, weight), in parallel
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._index[0])
+
+    def __contains__(self, term):
+        terms = self._index[0]
+        normalized = normalize_term(term)
+        index = bisect_left(terms, normalized)
+        return index < len(terms) and terms[index] == normalized
+
+    def add(self, term, weight=1):
+        """Queue a term for the next merge."""
+        normalized = normalize_term(term or "")
+        if not normalized or len(normalized) > MAX_TERM_LENGTH:
+            return
+        with self._lock:
+            if normalized in self._pending:
+                suggestion, pending_weight = self._pending[normalized]
+                self._pending[normalized] = (suggestion, pending_weight + weight)
+            elif len(self._pending) < MAX_PENDING:
+                self._pending[normalized] = (term.strip(), weight)
+
+    def merge(self):
+        """Merge the queued terms into the index; returns the number of terms merged."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        terms, entries = [], []
+        current = zip(*self._index)
+        added = sorted(pending.items())
+        for term, entry in heapq.merge(current, added, key=lambda item: item[0]):
+            if terms and terms[-1] == term:
+                entries[-1] = (entries[-1][0], entries[-1][1] + entry[1])
+            else:
+                terms.append(term)
+                entries.append(entry)
+        self._index = (terms, entries)
+        return len(pending)
+
+    def lookup(self, prefix, limit=10):
+        """Return up to `limit` suggestions starting with `prefix`, most frequent first."""
+        terms, entries = self._index
+        prefix = normalize_term(prefix)
+        if not prefix:
+            return []
+        start = bisect_left(terms, prefix)
+        end = bisect_left(terms, prefix + "\U0010ffff", start)
+        best = heapq.nlargest(limit, range(start, end), key=lambda index: entries[index][1])
+        return [entries[index][0] for index in best]
+
+
+class TypeaheadIndex(PrefixIndex):
+    """The process-wide prefix index, kept up to date by a background thread."""
+    def __init__(self, merge_interval=5, reload_interval=3600):
+        super().__init__()
+        self.merge_interval = merge_interval
+        self.reload_interval = reload_interval
+        self._reloaded_since = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    async def start(self):
+        """Start the background thread; called on server startup."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="typeahead-index", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        reloaded_at = None
+        while True:
+            try:
+                if reloaded_at is None or time.monotonic() - reloaded_at >= self.reload_interval:
+                    reloaded_at = time.monotonic()
+                    self.reload()
+                self.merge()
+            except Exception as e:
+                logger.error(f"Updating the typeahead index failed: {e}")
+            time.sleep(self.merge_interval)
+
+    def reload(self):
+        """Queue the corpus keywords searched (by any worker) since the last reload."""
+        searches = CorpusSearch.objects.all()
+        if self._reloaded_since is not None:
+            searches = searches.filter(fetched_at__gte=self._reloaded_since)
+        self._reloaded_since = timezone.now()
+        for keyword in searches.values_list("keyword", flat=True).iterator():
+            if keyword not in self:
+                self.add(keyword)
+
+    def suggest(self, prefix, limit=10, user_id=None):
+        """
+        Return `(suggestions, source)`: suggestions from the index, else (for a
+        cold prefix) from the autocomplete adapter, whose results are indexed.
+        Cold prefixes that are too short or past the user's budget get none.
+        """
+        started_at = time.perf_counter()
+        suggestions = self.lookup(prefix, limit)
+        metrics.observe("typeahead.lookup_ms", (time.perf_counter() - started_at) * 1000)
+        if suggestions:
+            metrics.incr("typeahead.hit")
+            return suggestions, "index"
+
+        metrics.incr("typeahead.cold")
+        if len(normalize_term(prefix)) < settings.TYPEAHEAD_FALLBACK_MIN_CHARS:
+            return [], "index"
+        try:
+            results = async_to_sync(fetch_autocomplete_for)(user_id, prefix)
+        except Exception as e:
+            logger.error(f"Autocomplete fallback for '{prefix}' failed: {e}")
+            return [], "adapter"
+        if results is None:
+            metrics.incr("typeahead.limited")
+            return [], "limited"
+        for result in results:
+            self.add(result["value"])
+        return [result["value"] for result in results[:limit]], "adapter"
+
+
+typeahead_index = TypeaheadIndex(
+    merge_interval=settings.TYPEAHEAD_MERGE_INTERVAL,
+    reload_interval=settings.TYPEAHEAD_RELOAD_INTERVAL,
+)
@@ -3,7 +3,8 @@ from .views import (
     EngineDetailView, EngineListCreateView, UserChatsListView,
     UserChatsDetailView, ChatsMessagesListView, AssistsDetailView,
     AssistsListCreateView, GenerateChatLinkView, EngineCategoryListCreateView,
-    EngineCategoryDetailView, ChatViewersListView
+    EngineCategoryDetailView, ChatViewersListView, EngineMetricsView,
+    TypeaheadView
  )
 from bookmark.views import BookmarkMessageView
 from project.views import ProjectsInMessageView
@@ -21,6 +22,8 @@ urlpatterns = [
     path('chats/<slug:slug>/messages/', ChatsMessagesListView.as_view(), name='chat_detail'),
     path('assists/', AssistsListCreateView.as_view(), name='assist_list'),
     path('assists/<int:id>/', AssistsDetailView.as_view(), name='assist_detail'),
+    path('typeahead/', TypeaheadView.as_view(), name='typeahead'),
+    path('metrics/', EngineMetricsView.as_view(), name='engine_metrics'),
 ]
 
 #Bookmark related
@@ -1,13 +1,24 @@
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.utils import timezone
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from .models import Message, Engine, EngineCategory
-from .functions import call_openai_function
-import json
+from .extraction import KeywordExtractor
+from .evidence import pack_evidence
+from .corpus import is_corpus_service, search_with_corpus
+from .typeahead import typeahead_index
+from .resilience import CircuitOpenError, deadline
+from .ratelimit import RateLimitedError, speculative
+from . import metrics
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 @database_sync_to_async
-def save_message(chat, text, sender, engine_ids, reply_to=None):
+def save_message(chat, text, sender, engine_ids, reply_to_id=None, is_truncated=False):
     """
     Save a message to the database with the associated engines and reply-to message if provided.
     """
@@ -17,19 +28,23 @@ def save_message(chat, text, sender, engine_ids, reply_to=None):
         text=text,
         sender=sender,
         timestamp=timezone.now(),
-        reply_to=reply_to
+        reply_to_id=reply_to_id,
+        is_truncated=is_truncated
     )
     message.engines.set(engines)
     return message
 
 
 @database_sync_to_async
-def load_chat_history(chat):
+def load_chat_history(chat, limit=None):
     """
-    Load the chat history and return it in a format suitable for the chat model (e.g., ChatGPT).
+    Load the latest `limit` messages of the chat as (role, content) turns suitable
+    for the chat model (e.g., ChatGPT), oldest first.
     """
-    messages = Message.objects.filter(chat=chat).order_by('timestamp').values('sender', 'text')
-    return [{'role': 'user' if msg['sender'] == 'user' else 'system', 'content': msg['text']} for msg in messages]
+    messages = Message.objects.filter(chat=chat).order_by('-timestamp').values_list('sender', 'text')
+    if limit:
+        messages = messages[:limit]
+    return [('user' if sender == 'user' else 'system', text) for sender, text in reversed(list(messages))]
 
 @database_sync_to_async
 def fetch_engines(engines_list):
@@ -38,80 +53,181 @@ def fetch_engines(engines_list):
     """
     return list(Engine.objects.filter(id__in=engines_list).select_related('category'))
 
-async def format_message(message, extra_data=[], in_reply_to=""):
+async def format_message(message, extra_data=[], in_reply_to="", token_budget=None):
     """
     Format the given data by combining the message with any additional data
-    and reply-to text to give to chatGPT.
+    and reply-to text to give to chatGPT. The additional data is packed into
+    at most `token_budget` tokens (see `engine.evidence`).
     """
-    extra_data_str = str(extra_data)
+    extra_data_str, stats = pack_evidence(message, extra_data, token_budget)
+    if extra_data:
+        saved = max(stats["tokens_before"] - stats["tokens_after"], 0)
+        metrics.observe("evidence.tokens", stats["tokens_after"])
+        metrics.incr("evidence.tokens_saved", saved)
+        metrics.incr("evidence.duplicates", stats["duplicates"])
+        logger.info(
+            f"Packed {stats['included']}/{stats['results']} results ({stats['duplicates']} duplicates) "
+            f"into ~{stats['tokens_after']} tokens, ~{saved} saved"
+        )
     if in_reply_to:
         return f"msg: {message}\n\nextra_data: {extra_data_str}\n\nin_reply_to: {in_reply_to}"
     return f"msg: {message}\n\nextra_data: {extra_data_str}"
 
-async def get_prompts(message, engines_list, reply_to_text=""):
+def get_engine_deadline(service):
+    """
+    Return the deadline (in seconds) configured for the given external service.
+    """
+    return settings.ENGINE_DEADLINES.get(service, settings.ENGINE_DEFAULT_DEADLINE)
+
+async def fetch_external_data(engine, extractor, progress):
+    """
+    Extract a keyword for the engine's external service and search it.
+    Intermediate results are recorded in `progress` so a caller that gives up
+    on the engine can still report what was gathered so far.
+    """
+    # The upstream requests made below time out just before the engine's deadline.
+    deadline.set(time.monotonic() + get_engine_deadline(engine.external_service))
+    service_adapter = await engine.get_service_adapter()
+    if not service_adapter:
+        logger.error(f"Service adapter not found for engine {engine.id}")
+        return []
+
+    tool_result = await extractor.get_arguments(engine.external_service)
+    if tool_result is None:
+        logger.error(f"Could not extract tool arguments for engine {engine.id}")
+        return []
+    progress["external_data"] = tool_result
+
+    keyword = tool_result.get("keyword")
+    if not keyword:
+        logger.error(f"'keyword' not found in tool_result for engine {engine.id}")
+        return []
+
+    # Draft keywords may be cut mid-word; only sent messages feed the suggestions.
+    if not speculative.get():
+        typeahead_index.add(keyword)
+
+    async def search(keyword):
+        return await service_adapter.search(query=keyword)
+
+    if is_corpus_service(engine.external_service):
+        total_result = await search_with_corpus(engine.external_service, keyword, search)
+    else:
+        total_result = await search(keyword)
+
+    if engine.external_service == "google_autocomplete_search" and not speculative.get():
+        for suggestion in total_result:
+            typeahead_index.add(suggestion["value"])
+
+    extra_data = []
+    if len(total_result) <= 0:
+        extra_data.append("Say the api is not responding")
+    extra_data.append({"external_data": tool_result, "service_data": total_result})
+    return extra_data
+
+async def fetch_external_data_with_deadline(engine, extractor):
+    """
+    Run `fetch_external_data` for a single engine within its configured deadline.
+    Returns the engine's extra_data entries and a timing record for the engine.
+    """
+    progress = {}
+    status = "ok"
+    started_at = time.monotonic()
+    try:
+        extra_data = await asyncio.wait_for(
+            fetch_external_data(engine, extractor, progress),
+            timeout=get_engine_deadline(engine.external_service)
+        )
+    except asyncio.TimeoutError:
+        status = "timeout"
+        extra_data = [{
+            "external_data": progress.get("external_data"),
+            "service_data": [],
+            "partial": True,
+        }]
+    except (CircuitOpenError, RateLimitedError) as e:
+        # The service (or the model extracting its keyword) keeps failing or is over its
+        # request budget; skip it without waiting.
+        status = "skipped"
+        extra_data = [f"Say the {engine.name} engine is temporarily unavailable"]
+        logger.warning(f"Skipped engine {engine.id}: {e}")
+    except Exception as e:
+        status = "error"
+        extra_data = []
+        logger.error(f"Fetching external data for engine {engine.id} failed: {e}")
+
+    timing = {
+        "engine_id": engine.id,
+        "service": engine.external_service,
+        "status": status,
+        "elapsed_ms": round((time.monotonic() - started_at) * 1000, 1),
+    }
+    return extra_data, timing
+
+async def get_prompts(message, engines_list, reply_to_text="", use_cache=True, prefetched=None):
     """
     Generate prompts by aggregating data from all engines, either from external services
     or internal prompts, and handling the associated category prompt.
+
+    External engines are fetched concurrently, each within its own deadline. Returns
+    (final_message, category_prompt, error_message, timings) where timings holds one
+    record per external engine. `use_cache=False` bypasses the keyword cache; `prefetched`
+    holds tool arguments already extracted (per service) from the message's draft.
     """
     if not engines_list:
         default_category = await database_sync_to_async(EngineCategory.objects.get)(is_default=True)
         default_final_message = await format_message(message, in_reply_to=reply_to_text)
-        return default_final_message, default_category.prompt, None
+        return default_final_message, default_category.prompt, None, []
 
     engines = await fetch_engines(engines_list)
     if not engines:
-        return None, None, "Engines not found."
+        return None, None, "Engines not found.", []
 
     categories = {engine.category.id for engine in engines}
     if len(categories) > 1:
-        return None, None, "All engines must be in the same category."
+        return None, None, "All engines must be in the same category.", []
+
+    external_engines = [engine for engine in engines if engine.external_service]
+    extractor = KeywordExtractor(
+        message, [engine.external_service for engine in external_engines],
+        use_cache=use_cache, prefetched=prefetched
+    )
+
+    try:
+        await extractor.start()
+        external_results = await asyncio.gather(
+            *(fetch_external_data_with_deadline(engine, extractor) for engine in external_engines)
+        )
+    finally:
+        extractor.close()
+    external_data = dict(zip((engine.id for engine in external_engines), external_results))
 
     extra_data = []
+    timings = []
     for engine in engines:
         if engine.external_service:
-            service_adapter = await engine.get_service_adapter()
-            if service_adapter:
-                tool_result = await call_openai_function([{'role': 'user', 'content': message}], engine.external_service)
-                
-                # Check if tool_result is a string and needs to be parsed
-                if isinstance(tool_result, str):
-                    try:
-                        tool_result = json.loads(tool_result)  # Parse the JSON string into a dictionary
-                    except json.JSONDecodeError:
-                        print("Error: tool_result is not valid JSON")
-                        continue  # Skip the rest of the loop if the parsing fails
-                
-                # Now you can safely access the 'keyword'
-                keyword = tool_result.get("keyword")
-                
-                if keyword:
-                    total_result = await service_adapter.search(query=keyword)
-                    
-                    if len(total_result) <= 0:
-                        extra_data.append("Say the api is not responding")
-                    extra_data.append({"external_data": tool_result, "service_data": total_result})
-                    
-                else:
-                    print("Error: 'keyword' not found in tool_result")
-            else:
-                print("Error: service_adapter not found")
+            engine_data, timing = external_data[engine.id]
+            extra_data.extend(engine_data)
+            timings.append(timing)
         elif engine.prompt:
             extra_data.append({"filter": engine.prompt})
 
     if not extra_data:
-        return None, None, "No valid prompts or external data found."
+        return None, None, "No valid prompts or external data found.", timings
 
     category = engines[0].category
-    final_message = await format_message(message, extra_data, reply_to_text)
-    return final_message, category.prompt, None
+    final_message = await format_message(message, extra_data, reply_to_text, category.evidence_token_budget)
+    return final_message, category.prompt, None, timings
 
 @database_sync_to_async
 def authenticate_user(token):
     """
     Authenticate the user by validating the provided JWT token.
+    Returns the user and the token's expiry timestamp, or (None, None).
     """
     try:
-        validated_token = JWTAuthentication().get_validated_token(token)
-        return JWTAuthentication().get_user(validated_token)
+        authentication = JWTAuthentication()
+        validated_token = authentication.get_validated_token(token)
+        return authentication.get_user(validated_token), validated_token['exp']
     except (InvalidToken, TokenError):
-        return None
+        return None, None
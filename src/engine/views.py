@@ -1,11 +1,11 @@
 from django.shortcuts import get_object_or_404
 from rest_framework import generics
 from django.conf import settings
-from openai import AsyncOpenAI
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from share.views import GenerateShareableLinkView, BaseViewersListView, SharedRetrieveUpdateDestroyView
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from .filters import ChatFilter, MessageFilter
 from collections import defaultdict
 from share.permissions import IsOwnerOrViewer
@@ -20,6 +20,13 @@ from .serializers import (
     EngineCategorySerializer
 )
 
+from . import metrics
+from .adapters.cache import adapter_cache
+from .extraction import keyword_cache
+from .reaper import idle_reaper
+from .typeahead import typeahead_index
+from .resilience import get_breaker_stats
+from .ratelimit import rate_limiter
 from .models import (
     Chat,
     Engine,
@@ -29,9 +36,6 @@ from .models import (
 )
 
 
-client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-
-
 class EngineListCreateView(generics.ListCreateAPIView):
     serializer_class = EngineSerializer
     pagination_class = PageNumberPagination
@@ -173,3 +177,43 @@ class ChatViewersListView(BaseViewersListView):
     def get_object(self):
         chat_slug = self.kwargs.get('slug')
         return get_object_or_404(Chat, slug=chat_slug)
+
+
+class TypeaheadView(APIView):
+    """
+    Suggestions for what the user is typing (`?q=<prefix>&limit=<n>`), served
+    from the in-memory typeahead index.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        prefix = request.query_params.get('q', '').strip()
+        try:
+            limit = int(request.query_params.get('limit', settings.TYPEAHEAD_MAX_SUGGESTIONS))
+        except ValueError:
+            limit = settings.TYPEAHEAD_MAX_SUGGESTIONS
+        limit = min(max(limit, 1), settings.TYPEAHEAD_MAX_SUGGESTIONS)
+
+        if not prefix:
+            return Response({"query": prefix, "suggestions": [], "source": "index"})
+        suggestions, source = typeahead_index.suggest(prefix, limit, user_id=request.user.pk)
+        return Response({"query": prefix, "suggestions": suggestions, "source": source})
+
+
+class EngineMetricsView(APIView):
+    """
+    Exposes the in-process engine metrics (cache hit rates, timings, ...) of the
+    worker serving the request.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "adapter_cache": adapter_cache.stats(),
+            "keyword_cache": keyword_cache.stats(),
+            "connections": idle_reaper.stats(),
+            "typeahead_terms": len(typeahead_index),
+            "breakers": get_breaker_stats(),
+            "rate_limits": rate_limiter.usage(),
+            **metrics.snapshot(),
+        })
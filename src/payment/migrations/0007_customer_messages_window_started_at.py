@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("payment", "0006_alter_subscription_customer"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customer",
+            name="messages_window_started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -141,6 +141,7 @@ class Customer(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='customer')
     source_id = models.CharField(max_length=255, blank=True, null=True)
     messages_sent_today = models.IntegerField(default=0)
+    messages_window_started_at = models.DateTimeField(blank=True, null=True)
     projects_created = models.IntegerField(default=0)
     bookmarks_created = models.IntegerField(default=0)
 
@@ -166,16 +167,26 @@ class Customer(models.Model):
             return self.subscription.is_active() or self.subscription.is_trialing()
          return False
 
-    def can_create_project(self):
+    def reserve_project(self):
+        """
+        Check the subscription and count a new project against the plan's limit.
+        Give the use back with `quota_ledger.release` if the project is not created.
+        """
+        from .quota import quota_ledger
+
         if not self.has_active_subscription():
             raise PermissionDenied("You must have an active subscription to create projects.")
 
-        if self.subscription and self.projects_created >= self.subscription.plan.projects_limit:
+        allowed, _ = quota_ledger.consume(self.pk, "projects", self.subscription.plan.projects_limit)
+        if not allowed:
             raise PermissionDenied("You have reached the maximum number of projects allowed by your subscription plan.")
 
     def create_project(self, **kwargs):
-        self.can_create_project()
-        project = Project.objects.create(user=self.user, **kwargs)
-        self.projects_created += 1
-        self.save()
-        return project
+        from .quota import quota_ledger
+
+        self.reserve_project()
+        try:
+            return Project.objects.create(user=self.user, **kwargs)
+        except Exception:
+            quota_ledger.release(self.pk, "projects")
+            raise
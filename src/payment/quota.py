@@ -0,0 +1,192 @@
+import logging
+import redis
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Customer
+
+logger = logging.getLogger(__name__)
+
+# Usage kinds tracked by the ledger, the Customer field holding their durable count
+# and whether they are counted per window (None means the count never resets).
+QUOTA_KINDS = {
+    "messages": {"field": "messages_sent_today", "window": settings.QUOTA_MESSAGES_WINDOW},
+    "projects": {"field": "projects_created", "window": None},
+    "bookmarks": {"field": "bookmarks_created", "window": None},
+}
+
+DIRTY_KEY = "quota:dirty"
+
+# KEYS: counter, dirty set. ARGV: limit, amount, customer id, seed count, seed ttl.
+# Returns {-1, 0} when the counter is cold and no seed was given, so the caller can
+# seed it from the database; otherwise {allowed, used}.
+CONSUME_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if ARGV[4] == '' then
+        return {-1, 0}
+    end
+    if tonumber(ARGV[5]) > 0 then
+        redis.call('SET', KEYS[1], ARGV[4], 'EX', ARGV[5])
+    else
+        redis.call('SET', KEYS[1], ARGV[4])
+    end
+end
+local used = tonumber(redis.call('GET', KEYS[1]))
+local amount = tonumber(ARGV[2])
+if amount > 0 and used + amount > tonumber(ARGV[1]) then
+    return {0, used}
+end
+used = redis.call('INCRBY', KEYS[1], amount)
+redis.call('SADD', KEYS[2], ARGV[3])
+return {1, used}
+"""
+
+# KEYS: counter, dirty set. ARGV: amount, customer id. Gives back at most the counted
+# uses, and nothing once the counter expired (the window they were counted in is over);
+# DECRBY keeps the counter's TTL. Returns the count left.
+RELEASE_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]))
+if not used then
+    return 0
+end
+local amount = math.min(tonumber(ARGV[1]), used)
+if amount <= 0 then
+    return used
+end
+used = redis.call('DECRBY', KEYS[1], amount)
+redis.call('SADD', KEYS[2], ARGV[2])
+return used
+"""
+
+
+class QuotaLedger:
+    """
+    Per-customer usage counters with atomic check-and-increment.
+
+    Counters live in Redis (updated by a Lua script) when QUOTA_REDIS_URL is set and
+    are written back to the Customer row periodically by `sync_to_database`. Without
+    Redis, counters are updated in the database with conditional F() updates.
+
+    Windowed kinds start a new window per customer on the first use after the
+    previous one ended, instead of being reset for everyone at midnight.
+    """
+    def __init__(self, redis_url=None):
+        self.redis_url = redis_url
+        self._redis = None
+        self._consume_script = None
+        self._release_script = None
+
+    @property
+    def redis(self):
+        if self._redis is None and self.redis_url:
+            self._redis = redis.Redis.from_url(self.redis_url)
+            self._consume_script = self._redis.register_script(CONSUME_SCRIPT)
+            self._release_script = self._redis.register_script(RELEASE_SCRIPT)
+        return self._redis
+
+    @staticmethod
+    def key(customer_id, kind):
+        return f"quota:{customer_id}:{kind}"
+
+    def _window_state(self, customer, kind, now):
+        """Return (count, seconds left in the window) from the durable Customer row."""
+        config = QUOTA_KINDS[kind]
+        count = getattr(customer, config["field"])
+        window = config["window"]
+        if window is None:
+            return count, 0
+        started_at = customer.messages_window_started_at
+        if started_at is None or started_at + window <= now:
+            return 0, int(window.total_seconds())
+        return count, max(int((started_at + window - now).total_seconds()), 1)
+
+    def consume(self, customer_id, kind, limit, amount=1):
+        """
+        Atomically count `amount` uses of `kind` unless that would exceed `limit`.
+        Returns (allowed, used).
+        """
+        if self.redis is None:
+            return self._consume_database(customer_id, kind, limit, amount)
+
+        keys = [self.key(customer_id, kind), DIRTY_KEY]
+        allowed, used = self._consume_script(keys=keys, args=[limit, amount, customer_id, "", 0])
+        if allowed == -1:
+            customer = Customer.objects.get(pk=customer_id)
+            seed, ttl = self._window_state(customer, kind, timezone.now())
+            allowed, used = self._consume_script(keys=keys, args=[limit, amount, customer_id, seed, ttl])
+        return bool(allowed), used
+
+    def release(self, customer_id, kind, amount=1):
+        """Give back uses counted for an action that did not go through; counts never go below 0."""
+        if self.redis is None:
+            field = QUOTA_KINDS[kind]["field"]
+            Customer.objects.filter(pk=customer_id).update(**{field: Greatest(F(field) - amount, 0)})
+        else:
+            self._release_script(keys=[self.key(customer_id, kind), DIRTY_KEY], args=[amount, customer_id])
+
+    def _consume_database(self, customer_id, kind, limit, amount):
+        config = QUOTA_KINDS[kind]
+        field = config["field"]
+        customers = Customer.objects.filter(pk=customer_id)
+
+        if config["window"] is not None and amount <= limit:
+            now = timezone.now()
+            window_over = (
+                Q(messages_window_started_at__isnull=True)
+                | Q(messages_window_started_at__lte=now - config["window"])
+            )
+            if customers.filter(window_over).update(**{field: amount, "messages_window_started_at": now}):
+                return True, amount
+
+        allowed = bool(customers.filter(**{f"{field}__lte": limit - amount}).update(**{field: F(field) + amount}))
+        used = customers.values_list(field, flat=True).first() or 0
+        return allowed, used
+
+    def usage(self, customer, kind):
+        """Return (used, seconds until the window resets or None) for the customer."""
+        if self.redis is not None:
+            key = self.key(customer.pk, kind)
+            used, ttl = self.redis.get(key), self.redis.ttl(key)
+            if used is not None:
+                return int(used), (ttl if ttl >= 0 else None)
+
+        used, ttl = self._window_state(customer, kind, timezone.now())
+        if QUOTA_KINDS[kind]["window"] is None:
+            return used, None
+        return used, (ttl if used else None)
+
+    def sync_to_database(self, batch_size=500):
+        """
+        Write the Redis counters of customers with recent usage back to the database.
+        Returns the number of customers synced.
+        """
+        if self.redis is None:
+            return 0
+
+        synced = 0
+        now = timezone.now()
+        while True:
+            customer_ids = [int(customer_id) for customer_id in self.redis.spop(DIRTY_KEY, batch_size) or []]
+            if not customer_ids:
+                return synced
+
+            for customer_id in customer_ids:
+                updates = {}
+                for kind, config in QUOTA_KINDS.items():
+                    key = self.key(customer_id, kind)
+                    used = self.redis.get(key)
+                    if used is None:
+                        continue
+                    updates[config["field"]] = int(used)
+                    window = config["window"]
+                    ttl = self.redis.ttl(key)
+                    if window is not None and ttl >= 0:
+                        updates["messages_window_started_at"] = now - (window - timedelta(seconds=ttl))
+                if updates:
+                    Customer.objects.filter(pk=customer_id).update(**updates)
+            synced += len(customer_ids)
+
+
+quota_ledger = QuotaLedger(redis_url=settings.QUOTA_REDIS_URL)
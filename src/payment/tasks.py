@@ -1,14 +1,12 @@
 from celery import shared_task
-from .models import Customer
+from .quota import quota_ledger
 
 @shared_task
-def reset_plan_limits():
+def sync_usage_ledger():
     """
-    Resets usage limits for each subscription's plan.
-    This task should be scheduled to run daily or at a specified interval.
+    Writes the usage counters of the quota ledger back to the Customer rows.
+    This task should be scheduled to run every few minutes.
     """
+    synced = quota_ledger.sync_to_database()
 
-    active_customers = Customer.objects.filter(subscription__status__in=['active', 'trialing'])
-    active_customers.update(messages_sent_today=0)
-
-    return f"Reset limits for {active_customers.count()} active subscriptions"
+    return f"Synced usage for {synced} customers"
@@ -0,0 +1,62 @@
+from unittest import mock
+import fakeredis
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from .models import Customer
+from .quota import DIRTY_KEY, QuotaLedger
+
+
+class RedisQuotaLedgerTest(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.enterContext(mock.patch("payment.quota.redis.Redis.from_url", return_value=self.redis))
+        self.ledger = QuotaLedger(redis_url="redis://quota")
+        self.key = self.ledger.key(1, "messages")
+
+    def test_consume_stops_at_the_limit(self):
+        self.redis.set(self.key, 0, ex=60)
+
+        self.assertEqual(self.ledger.consume(1, "messages", limit=2), (True, 1))
+        self.assertEqual(self.ledger.consume(1, "messages", limit=2), (True, 2))
+        self.assertEqual(self.ledger.consume(1, "messages", limit=2), (False, 2))
+        self.assertTrue(self.redis.sismember(DIRTY_KEY, 1))
+
+    def test_release_keeps_the_window(self):
+        self.redis.set(self.key, 2, ex=60)
+
+        self.ledger.release(1, "messages")
+
+        self.assertEqual(int(self.redis.get(self.key)), 1)
+        self.assertGreater(self.redis.ttl(self.key), 0)
+        self.assertTrue(self.redis.sismember(DIRTY_KEY, 1))
+
+    def test_release_never_goes_below_zero(self):
+        self.redis.set(self.key, 1, ex=60)
+
+        self.ledger.release(1, "messages", amount=3)
+        self.ledger.release(1, "messages")
+
+        self.assertEqual(int(self.redis.get(self.key)), 0)
+
+    def test_release_after_the_window_ended_is_a_no_op(self):
+        self.ledger.release(1, "messages")
+
+        self.assertFalse(self.redis.exists(self.key))
+        self.assertFalse(self.redis.sismember(DIRTY_KEY, 1))
+
+
+class DatabaseQuotaLedgerTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create(username="quota", email="quota@example.com")
+        self.customer = Customer.objects.create(user=user, projects_created=1)
+        self.ledger = QuotaLedger()
+
+    def test_release_never_goes_below_zero(self):
+        self.ledger.release(self.customer.pk, "projects", amount=2)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.projects_created, 0)
+
+    def test_consume_stops_at_the_limit(self):
+        self.assertEqual(self.ledger.consume(self.customer.pk, "projects", limit=2), (True, 2))
+        self.assertEqual(self.ledger.consume(self.customer.pk, "projects", limit=2), (False, 2))
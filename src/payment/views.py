@@ -13,6 +13,7 @@ import stripe
 from .models import Plan
 from django.contrib.auth import get_user_model
 from .serializers import PlanSerializer
+from .quota import quota_ledger
 
 
 class CheckoutSessionView(APIView):
@@ -129,3 +130,29 @@ class PlanListView(APIView):
                     categorized_plans['yearly'].append(serialized_plan)
 
         return Response(categorized_plans)
+
+
+class UsageView(APIView):
+    """
+    Returns the customer's current usage and plan limits, read from the quota ledger.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        customer = getattr(request.user, 'customer', None)
+        if not customer or not customer.has_active_subscription():
+            raise CustomAPIException("You must have an active subscription.", status_code=403)
+
+        plan = customer.subscription.plan
+        limits = {
+            'messages': plan.messages_limit,
+            'projects': plan.projects_limit,
+            'bookmarks': plan.bookmarks_limit,
+        }
+
+        usage = {}
+        for kind, limit in limits.items():
+            used, resets_in = quota_ledger.usage(customer, kind)
+            usage[kind] = {'used': used, 'limit': limit, 'resets_in': resets_in}
+
+        return Response(usage)
@@ -8,6 +8,8 @@ from share.views import GenerateShareableLinkView, BaseViewersListView, SharedRe
 from .models import Project, Message
 from .serializers import ProjectSerializer
 from engine.serializers import MessageSerializer
+from engine.persistence import message_writer
+from payment.quota import quota_ledger
 from .filters import ProjectFilter
 from rest_framework.pagination import PageNumberPagination
 from share.permissions import IsOwnerOrViewer
@@ -29,13 +31,15 @@ class ProjectListCreateView(generics.ListCreateAPIView):
         customer = getattr(self.request.user, 'customer', None)
 
         if customer:
-            project = serializer.save(user=self.request.user)
-            customer.can_create_project()
-            customer.projects_created += 1
-            customer.save()
+            customer.reserve_project()
+            try:
+                project = serializer.save(user=self.request.user)
 
-            if 'viewers' in serializer.validated_data:
-                project.viewers.add(*serializer.validated_data['viewers'])
+                if 'viewers' in serializer.validated_data:
+                    project.viewers.add(*serializer.validated_data['viewers'])
+            except Exception:
+                quota_ledger.release(customer.pk, "projects")
+                raise
 
             return project
         else:
@@ -62,6 +66,7 @@ class ProjectsInMessageView(APIView):
 
     def post(self, request, message_id):
         user = request.user
+        message_writer.wait_until_written(message_id)
         message = get_object_or_404(Message, id=message_id, chat__user=user)
         project_ids = request.data.get('project_ids', [])
 
@@ -108,6 +113,7 @@ class MessagesInProjectView(APIView):
         message_ids = request.data.get('message_ids', [])
 
         for message_id in message_ids:
+            message_writer.wait_until_written(message_id)
             message = get_object_or_404(Message, id=message_id)
             self.check_object_permissions(request, message)
             project.messages.add(message)
@@ -4,6 +4,7 @@ from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from engine.models import Message, Engine
+from engine.persistence import message_writer
 from .models import Vote
 from RITengine.exceptions import CustomAPIException
 
@@ -19,6 +20,7 @@ class LikeDislikeView(APIView):
         if vote_type not in [Vote.LIKE, Vote.DISLIKE]:
             raise CustomAPIException("Invalid vote type.")
 
+        message_writer.wait_until_written(message_id)
         message = get_object_or_404(Message, id=message_id)
 
         existing_vote = Vote.objects.filter(user=user, message=message).first()